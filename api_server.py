@@ -0,0 +1,717 @@
+"""Headless HTTP API over knowledge base management, indexing and querying
+
+    python api_server.py [--host 127.0.0.1] [--port 8600]
+
+A small asyncio HTTP/1.1 server without third-party dependencies. graphrag
+init and query commands run under asyncio.create_subprocess_exec (see
+kb_async). The API runs in a process of its own next to the web UI. The two
+share indexing jobs through jobs/ (see index_jobs), so jobs started from
+either side show up in both and only one indexes a knowledge base at a time,
+and take the same knowledge base locks (see kb_locks); identical queries are
+only collapsed within one process. Metrics are exported to metrics/api.prom
+instead of the web UI's metrics.prom. Every request body and
+response is JSON, except uploads (the raw document as the request body) and
+streamed responses, which are newline-delimited JSON events sent with
+chunked transfer encoding.
+
+    GET    /health
+    GET    /kbs                                   list knowledge bases
+    POST   /kbs               {"name"}            create and initialize one
+    DELETE /kbs/<kb>
+    GET    /kbs/<kb>/files?search=&page=&page_size=
+    PUT    /kbs/<kb>/files/<name>.txt?on_duplicate=reject|link   upload a document
+    DELETE /kbs/<kb>/files/<name>.txt
+    POST   /kbs/<kb>/clear-cache {"keep_llm_cache"}
+    POST   /kbs/<kb>/index    {"incremental"}     start an indexing job
+    GET    /kbs/<kb>/jobs
+    GET    /jobs/<id>
+    GET    /workers                               indexing workers and the job spool's queue
+    POST   /jobs/<id>/cancel
+    GET    /jobs/<id>/log?lines=200&follow=1     follow=1 streams the log until the job ends
+    POST   /kbs/<kb>/query    {"query", "method", "stream", "use_cache", "timeout"}
+    GET    /kbs/<kb>/export?cache=0&env=0         download the knowledge base as .tar.zst
+    PUT    /kbs/<kb>/import                       create a knowledge base from an export
+
+Exports are compressed while they are sent and imports extracted while
+they arrive (see kb_transfer), so neither is held in memory or on disk.
+
+A streamed query sends "output" events with graphrag's progress output,
+"delta" events with each new piece of the answer ("reset" if a partial
+answer has to be discarded) and a final "answer" event with the full text.
+
+Queries and graphrag commands each have a concurrency limit; a request that
+does not get a slot within GRAPHRAG_API_QUEUE_TIMEOUT seconds is answered
+with 503 and Retry-After. When GRAPHRAG_API_TOKEN is set, every request
+needs an "Authorization: Bearer <token>" header.
+"""
+import argparse
+import asyncio
+import codecs
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import kb_async
+from fs_cache import file_sizes, paginate
+from index_jobs import get_job_manager
+from job_spool import JobSpool
+from kb_core import (QUERY_METHODS, KnowledgeBaseError, clear_cache, delete_input_files,
+                     delete_knowledge_base, index_knowledge_base, kb_path_for,
+                     list_input_files, list_knowledge_bases)
+from kb_locks import KBBusyError
+from kb_transfer import TransferError, archive_name, export_knowledge_base, import_knowledge_base
+from metrics import export_as, get_metrics
+from uploads import CHUNK_SIZE, DUPLICATE_LINK, DUPLICATE_REJECT, InputWriter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = int(os.environ.get("GRAPHRAG_API_PORT", "8600"))
+MAX_QUERIES = int(os.environ.get("GRAPHRAG_API_MAX_QUERIES", "4"))
+MAX_COMMANDS = int(os.environ.get("GRAPHRAG_API_MAX_COMMANDS", "2"))
+MAX_UPLOADS = int(os.environ.get("GRAPHRAG_API_MAX_UPLOADS", "4"))
+QUEUE_TIMEOUT = float(os.environ.get("GRAPHRAG_API_QUEUE_TIMEOUT", "30"))
+MAX_UPLOAD_BYTES = int(os.environ.get("GRAPHRAG_API_MAX_UPLOAD_BYTES", str(1024 ** 3)))
+MAX_IMPORT_BYTES = int(os.environ.get("GRAPHRAG_API_MAX_IMPORT_BYTES", str(64 * 1024 ** 3)))
+API_TOKEN = os.environ.get("GRAPHRAG_API_TOKEN")
+MAX_JSON_BYTES = 1024 * 1024
+MAX_HEADER_LINES = 100
+FOLLOW_INTERVAL = 0.5
+PIPE_CHUNKS = 8
+PIPE_POLL = 0.5
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Request:
+    def __init__(self, method, target, headers, reader):
+        self.method = method
+        parts = urlsplit(target)
+        self.path = [unquote(part) for part in parts.path.strip("/").split("/") if part]
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.reader = reader
+        self.body_read = False
+
+    @property
+    def length(self):
+        try:
+            return int(self.headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+
+    async def chunks(self):
+        """The request body in chunks of at most CHUNK_SIZE bytes"""
+        self.body_read = True
+        left = self.length
+        while left > 0:
+            data = await self.reader.read(min(CHUNK_SIZE, left))
+            if not data:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body ended early")
+            left -= len(data)
+            yield data
+
+    async def json(self):
+        if self.length > MAX_JSON_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        body = b"".join([chunk async for chunk in self.chunks()])
+        if not body:
+            return {}
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+        return data
+
+    def flag(self, name, default=False):
+        return self.query.get(name, str(default)).lower() in ("1", "true", "yes")
+
+    def integer(self, name, default, minimum=0):
+        """An integer query parameter; HTTP 400 unless it is a whole number >= minimum"""
+        try:
+            value = int(self.query.get(name, default))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"'{name}' must be an integer")
+        if value < minimum:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"'{name}' must be at least {minimum}")
+        return value
+
+
+class Stream:
+    """A chunked response of newline-delimited JSON events"""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def send(self, event, **fields):
+        line = json.dumps({"event": event, **fields}, ensure_ascii=False) + "\n"
+        data = line.encode("utf-8")
+        self.writer.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        await self.writer.drain()
+
+
+class Limiter:
+    """A concurrency limit that gives up with 503 instead of queueing forever"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE,
+                            f"Too many concurrent {self.name}, try again later",
+                            {"Retry-After": str(max(1, int(QUEUE_TIMEOUT)))})
+        finally:
+            self.waiting -= 1
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+    def state(self):
+        return {"limit": self.limit, "waiting": self.waiting}
+
+
+class Pipe:
+    """Bounded hand-over of byte chunks between the event loop and a worker thread
+
+    Used as the file object of exports (write) and imports (read). Both ends
+    block while the pipe is full or empty, which keeps a slow client from
+    making the other side buffer an archive. close() makes the blocked side
+    fail, e.g. after the client went away.
+    """
+
+    def __init__(self, size=PIPE_CHUNKS):
+        self._queue = queue.Queue(size)
+        self._pending = b""
+        self._finished = False
+        self.closed = False
+
+    def put(self, data):
+        while True:
+            if self.closed:
+                raise ConnectionError("The transfer was aborted")
+            try:
+                return self._queue.put(data, timeout=PIPE_POLL)
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        self.put(bytes(data))
+        return len(data)
+
+    def finish(self):
+        self.put(b"")
+
+    def get(self):
+        while True:
+            if self.closed:
+                raise ConnectionError("The transfer was aborted")
+            try:
+                return self._queue.get(timeout=PIPE_POLL)
+            except queue.Empty:
+                continue
+
+    def read(self, size=-1):
+        if not self._pending and not self._finished:
+            self._pending = self.get()
+            self._finished = not self._pending
+        if size is None or size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def close(self):
+        self.closed = True
+
+
+def _retrieve(task):
+    """Mark a transfer's failure as seen once nobody awaits it any more"""
+    if not task.cancelled():
+        task.exception()
+
+
+def _job_dict(job):
+    data = job.to_dict()
+    data["elapsed"] = round(job.elapsed(), 2)
+    return data
+
+
+def _workers():
+    spool = JobSpool()
+    return {"workers": spool.workers(),
+            "queue": [{**state, "claim": claim} for state, claim in spool.queue()]}
+
+
+def _document_name(name):
+    if name != Path(name).name or name.startswith(".") or not name.endswith(".txt"):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Documents must be .txt files without a path")
+    return name
+
+
+class APIServer:
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, token=API_TOKEN):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.queries = Limiter("queries", MAX_QUERIES)
+        self.commands = Limiter("commands", MAX_COMMANDS)
+        self.uploads = Limiter("uploads", MAX_UPLOADS)
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"GraphRAG API listening on http://{self.host}:{self.port}")
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    # Connection handling
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported")
+        return Request(method.upper(), target, headers, reader)
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                start = time.perf_counter()
+                status = await self._dispatch(request, writer, keep_alive)
+                route = request.path[0] if request.path else ""
+                get_metrics().observe("api_request", time.perf_counter() - start,
+                                      {"method": request.method, "route": route,
+                                       "status": int(status)})
+                if not keep_alive or not request.body_read and request.length:
+                    return  # An unread body would be taken for the next request
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request, writer, keep_alive):
+        try:
+            self._authorize(request)
+            if request.headers.get("expect", "").lower() == "100-continue":
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            return await self._route(request, writer, keep_alive)
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {"error": str(e)}, keep_alive, e.headers)
+            return e.status
+        except TransferError as e:
+            await self._send_json(writer, HTTPStatus.UNPROCESSABLE_ENTITY, {"error": str(e)},
+                                  keep_alive)
+            return HTTPStatus.UNPROCESSABLE_ENTITY
+        except KnowledgeBaseError as e:
+            status = HTTPStatus.CONFLICT if "already exists" in str(e) else HTTPStatus.NOT_FOUND
+            if str(e).startswith("Invalid"):
+                status = HTTPStatus.BAD_REQUEST
+            await self._send_json(writer, status, {"error": str(e)}, keep_alive)
+            return status
+        except (KBBusyError, TimeoutError) as e:
+            await self._send_json(writer, HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)},
+                                  keep_alive, {"Retry-After": "5"})
+            return HTTPStatus.SERVICE_UNAVAILABLE
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            logger.exception(f"API request {request.method} /{'/'.join(request.path)} failed")
+            await self._send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)},
+                                  keep_alive)
+            return HTTPStatus.INTERNAL_SERVER_ERROR
+
+    def _authorize(self, request):
+        if not self.token:
+            return
+        header = request.headers.get("authorization", "")
+        if not hmac.compare_digest(header.encode(), f"Bearer {self.token}".encode()):
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "Missing or wrong API token",
+                            {"WWW-Authenticate": "Bearer"})
+
+    async def _send_json(self, writer, status, payload, keep_alive=True, headers=None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self._write_head(writer, status, {"Content-Type": "application/json; charset=utf-8",
+                                          "Content-Length": str(len(body)), **(headers or {})},
+                         keep_alive)
+        writer.write(body)
+        await writer.drain()
+        return status
+
+    def _write_head(self, writer, status, headers, keep_alive):
+        status = HTTPStatus(status)
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        headers = {**headers, "Connection": "keep-alive" if keep_alive else "close"}
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _stream(self, writer, produce):
+        """Send the events produce(stream) emits as a chunked NDJSON response"""
+        self._write_head(writer, HTTPStatus.OK, {"Content-Type": "application/x-ndjson",
+                                                 "Transfer-Encoding": "chunked",
+                                                 "Cache-Control": "no-cache"}, True)
+        stream = Stream(writer)
+        try:
+            await produce(stream)
+        except (KnowledgeBaseError, KBBusyError, TimeoutError, HTTPError) as e:
+            await stream.send("error", error=str(e))
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            logger.exception("Streamed API response failed")
+            await stream.send("error", error=str(e))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return HTTPStatus.OK
+
+    # Routes
+
+    async def _route(self, request, writer, keep_alive):
+        method, path = request.method, request.path
+
+        async def reply(payload, status=HTTPStatus.OK):
+            return await self._send_json(writer, status, payload, keep_alive)
+
+        if path == ["health"] and method == "GET":
+            return await reply({"status": "ok", "queries": self.queries.state(),
+                                "commands": self.commands.state()})
+        if path == ["kbs"] and method == "GET":
+            return await reply({"knowledge_bases": list_knowledge_bases()})
+        if path == ["kbs"] and method == "POST":
+            return await self._create(request, reply)
+        if len(path) >= 2 and path[0] == "kbs":
+            kb_name, rest = path[1], path[2:]
+            if not rest and method == "DELETE":
+                await asyncio.to_thread(delete_knowledge_base, kb_name)
+                return await reply({"deleted": kb_name})
+            if rest == ["import"] and method == "PUT":
+                return await reply(await self._import(request, kb_name), HTTPStatus.CREATED)
+            kb_path = kb_path_for(kb_name)
+            if rest == ["export"] and method == "GET":
+                return await self._export(request, writer, kb_path, keep_alive)
+            if rest == ["files"] and method == "GET":
+                return await reply(await asyncio.to_thread(
+                    self._files, kb_path, request.query.get("search", ""),
+                    request.integer("page", 1, minimum=1),
+                    request.integer("page_size", 100, minimum=1)))
+            if len(rest) == 2 and rest[0] == "files" and method == "PUT":
+                return await reply(await self._upload(request, kb_path, _document_name(rest[1])))
+            if len(rest) == 2 and rest[0] == "files" and method == "DELETE":
+                deleted, errors = await asyncio.to_thread(
+                    delete_input_files, kb_path, [_document_name(rest[1])])
+                if errors:
+                    raise HTTPError(HTTPStatus.NOT_FOUND, str(errors[0][1]))
+                return await reply({"deleted": deleted})
+            if rest == ["clear-cache"] and method == "POST":
+                body = await request.json()
+                errors = await asyncio.to_thread(clear_cache, kb_path,
+                                                 bool(body.get("keep_llm_cache", False)))
+                return await reply({"errors": [f"{item}: {error}" for item, error in errors]})
+            if rest == ["index"] and method == "POST":
+                body = await request.json()
+                job = await asyncio.to_thread(index_knowledge_base, kb_name,
+                                              bool(body.get("incremental", False)))
+                return await reply(_job_dict(job), HTTPStatus.ACCEPTED)
+            if rest == ["jobs"] and method == "GET":
+                jobs = get_job_manager().jobs(kb_name, limit=request.integer("limit", 20))
+                return await reply({"jobs": [_job_dict(job) for job in jobs]})
+            if rest == ["query"] and method == "POST":
+                return await self._query(request, writer, kb_path, reply)
+        if path == ["workers"] and method == "GET":
+            return await reply(await asyncio.to_thread(_workers))
+        if len(path) >= 2 and path[0] == "jobs":
+            job = get_job_manager().get(path[1])
+            if job is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"Job '{path[1]}' does not exist")
+            if len(path) == 2 and method == "GET":
+                return await reply(_job_dict(job))
+            if path[2:] == ["cancel"] and method == "POST":
+                return await reply({"cancelled": get_job_manager().cancel(job.id)})
+            if path[2:] == ["log"] and method == "GET":
+                lines = request.integer("lines", 200)
+                if not request.flag("follow"):
+                    text = await asyncio.to_thread(get_job_manager().tail, job.id, lines)
+                    return await reply({"log": text, "status": job.status})
+                return await self._stream(writer, lambda stream: self._follow(stream, job, lines))
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {'/' + '/'.join(path)}")
+
+    async def _create(self, request, reply):
+        name = (await request.json()).get("name", "")
+        async with self.commands:
+            success, output = await kb_async.create_knowledge_base(name)
+        if not success:
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR,
+                            f"graphrag init failed: {output[-2000:]}")
+        return await reply({"created": name}, HTTPStatus.CREATED)
+
+    def _files(self, kb_path, search, page, page_size):
+        names = list_input_files(kb_path, search)
+        page_names, page, pages = paginate(names, page, page_size)
+        sizes = file_sizes(kb_path / "input", page_names)
+        return {"total": len(names), "page": page, "pages": pages,
+                "files": [{"name": name, "bytes": sizes.get(name)} for name in page_names]}
+
+    async def _upload(self, request, kb_path, name):
+        if request.length > MAX_UPLOAD_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            f"Documents are limited to {MAX_UPLOAD_BYTES} bytes")
+        policy = request.query.get("on_duplicate", DUPLICATE_REJECT)
+        if policy not in (DUPLICATE_REJECT, DUPLICATE_LINK):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "on_duplicate must be 'reject' or 'link'")
+        async with self.uploads:
+            writer = await asyncio.to_thread(InputWriter, kb_path, policy)
+            # Hidden, so the *.txt glob never sees a partial document
+            tmp_path = writer.input_path / f".{name}.{uuid.uuid4().hex[:8]}.part"
+            digest, size = hashlib.sha256(), 0
+            start = time.perf_counter()
+            try:
+                with open(tmp_path, "wb") as f:
+                    async for chunk in request.chunks():
+                        digest.update(chunk)
+                        await asyncio.to_thread(f.write, chunk)
+                        size += len(chunk)
+                result = await asyncio.to_thread(writer.commit, tmp_path, name,
+                                                 digest.hexdigest(), size)
+                await asyncio.to_thread(writer.close)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+        get_metrics().observe("file_io", time.perf_counter() - start,
+                              {"op": "upload", "kb": kb_path.name, "status": "ok"},
+                              files=1, bytes=size)
+        return result
+
+    async def _export(self, request, writer, kb_path, keep_alive):
+        options = {"include_cache": request.flag("cache"), "include_env": request.flag("env")}
+        async with self.uploads:
+            pipe = Pipe()
+
+            def run():
+                try:
+                    export_knowledge_base(kb_path, pipe, **options)
+                finally:
+                    if not pipe.closed:
+                        pipe.finish()
+
+            task = asyncio.ensure_future(asyncio.to_thread(run))
+            try:
+                data = await asyncio.to_thread(pipe.get)
+                if not data:
+                    await task  # Failed before the first byte; answered with an error status
+                self._write_head(writer, HTTPStatus.OK, {
+                    "Content-Type": "application/zstd", "Transfer-Encoding": "chunked",
+                    "Content-Disposition": f'attachment; filename="{archive_name(kb_path.name)}"'},
+                    keep_alive)
+                while data:
+                    writer.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                    await writer.drain()
+                    data = await asyncio.to_thread(pipe.get)
+                try:
+                    await task
+                except Exception:
+                    # The status is sent; end without the last chunk so the client sees the failure
+                    logger.exception(f"Export of '{kb_path.name}' failed")
+                    raise ConnectionAbortedError("Export failed")
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+            finally:
+                pipe.close()  # Stops the export if the client went away
+                task.add_done_callback(_retrieve)
+        return HTTPStatus.OK
+
+    async def _import(self, request, name):
+        if request.length > MAX_IMPORT_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            f"Imports are limited to {MAX_IMPORT_BYTES} bytes")
+        async with self.uploads:
+            pipe = Pipe()
+
+            def run():
+                try:
+                    return import_knowledge_base(pipe, name)
+                except BaseException:
+                    pipe.close()  # Stop taking the request body
+                    raise
+
+            task = asyncio.ensure_future(asyncio.to_thread(run))
+            try:
+                async for chunk in request.chunks():
+                    if pipe.closed:
+                        continue  # The import failed; read the rest so the client gets the error
+                    try:
+                        await asyncio.to_thread(pipe.put, chunk)
+                    except ConnectionError:
+                        pass
+                if not pipe.closed:
+                    await asyncio.to_thread(pipe.finish)
+                manifest = await task
+            finally:
+                pipe.close()  # Lets the import fail if the body ended early
+                task.add_done_callback(_retrieve)
+        files = manifest["files"]
+        return {"imported": name, "source": manifest.get("kb"), "files": len(files),
+                "bytes": sum(entry["bytes"] for entry in files.values())}
+
+    async def _query(self, request, writer, kb_path, reply):
+        body = await request.json()
+        query = str(body.get("query", "")).strip()
+        method = str(body.get("method", "local")).lower()
+        if not query:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'query' is required")
+        if method not in QUERY_METHODS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"'method' must be one of {QUERY_METHODS}")
+        try:
+            timeout = float(body["timeout"]) if body.get("timeout") else None
+        except (TypeError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'timeout' must be a number of seconds")
+        options = {"use_cache": bool(body.get("use_cache", True)), "timeout": timeout}
+        if not body.get("stream"):
+            async with self.queries:
+                response, _output, source = await kb_async.answer_query(
+                    kb_path, method, query, **options)
+            if response is None:
+                raise HTTPError(HTTPStatus.BAD_GATEWAY, "graphrag returned no answer")
+            return await reply({"response": response, "source": source, "method": method})
+
+        async def produce(stream):
+            queue = asyncio.Queue()
+            sent = ""
+
+            def on_partial(text):
+                # The answer so far; clients get only what is new
+                nonlocal sent
+                if text.startswith(sent):
+                    delta = text[len(sent):]
+                else:
+                    queue.put_nowait(("reset", {}))
+                    delta = text
+                sent = text
+                if delta:
+                    queue.put_nowait(("delta", {"text": delta}))
+
+            await stream.send("queued")
+            async with self.queries:
+                await stream.send("started")
+                task = asyncio.ensure_future(kb_async.answer_query(
+                    kb_path, method, query, on_partial=on_partial,
+                    on_output=lambda text: queue.put_nowait(("output", {"text": text})),
+                    **options))
+                try:
+                    while True:
+                        getter = asyncio.ensure_future(queue.get())
+                        done, _pending = await asyncio.wait(
+                            {task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                        if getter in done:
+                            event, fields = getter.result()
+                            await stream.send(event, **fields)
+                            continue
+                        getter.cancel()
+                        while not queue.empty():
+                            event, fields = queue.get_nowait()
+                            await stream.send(event, **fields)
+                        break
+                finally:
+                    if not task.done():
+                        task.cancel()  # The client went away; stop graphrag
+                response, _output, source = task.result()
+            if response is None:
+                await stream.send("error", error="graphrag returned no answer")
+            else:
+                await stream.send("answer", response=response, source=source, method=method)
+
+        return await self._stream(writer, produce)
+
+    async def _follow(self, stream, job, lines):
+        """Stream a job's log from the last lines on until the job has finished"""
+        text = await asyncio.to_thread(get_job_manager().tail, job.id, lines)
+        if text:
+            await stream.send("output", text=text)
+        path = job.log_path
+        position = path.stat().st_size if path.exists() else 0
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        progress = None
+        while True:
+            job = await asyncio.to_thread(get_job_manager().get, job.id) or job  # May run elsewhere
+            active = job.active
+            size = path.stat().st_size if path.exists() else 0
+            if size < position:
+                position = 0  # The log was rotated
+            if size > position:
+                with open(path, "rb") as f:
+                    f.seek(position)
+                    data = await asyncio.to_thread(f.read, size - position)
+                position = size
+                await stream.send("output", text=decoder.decode(data))
+            if not active:
+                break
+            state = (job.status, job.current_workflow, len(job.workflows))
+            if state != progress:
+                progress = state
+                await stream.send("progress", status=job.status, workflow=job.current_workflow,
+                                  workflows_done=len(job.workflows))
+            await asyncio.sleep(FOLLOW_INTERVAL)
+        await stream.send("finished", job=_job_dict(job))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless HTTP API for the GraphRAG Web UI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    export_as("api.prom")  # The web UI writes metrics.prom
+    try:
+        asyncio.run(APIServer(args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,48 @@
 import streamlit as st
-import os
-import subprocess
-import shutil
+import io
 from pathlib import Path
 from dotenv import load_dotenv
 import yaml
 import pkg_resources
 import logging
+import time
+import re
+from kb_core import (answer_query, invalidate_index, list_knowledge_bases,
+                     index_knowledge_base, delete_input_files, KnowledgeBaseError,
+                     create_knowledge_base as create_kb, delete_knowledge_base as delete_kb,
+                     clear_cache as clear_kb_cache, warm_query_worker)
+from index_versions import (list_versions, rollback, VersionError,
+                            KEEP_VERSIONS as KEEP_INDEX_VERSIONS,
+                            delete_all as delete_index_versions)
+from kb_locks import writing, get_single_flight, KBBusyError
+from index_jobs import get_job_manager
+from job_spool import JobSpool
+from input_manifest import InputManifest, estimate_delta, EXCLUDED_DIR
+from index_estimate import estimate_index, estimate_cost, format_duration
+from near_duplicates import (find_duplicates, exclude_duplicates, restore_excluded,
+                             list_excluded, DedupeError, THRESHOLD as DEDUPE_THRESHOLD)
+from index_profile import (list_profiles, compare_profiles, find_regressions, settings_diff,
+                           record_settings_edit, REGRESSION_RATIO,
+                           REGRESSION_MIN_SECONDS)
+from cache_admin import (storage_usage, llm_cache_breakdown, clear_dir,
+                         prune_llm_cache, dedupe_llm_cache, format_bytes)
+from query_cache import get_query_cache
+from batch_query import (load_questions, run_batch, summarize, to_csv, to_jsonl,
+                         BatchFormatError, MAX_PARALLELISM)
+from archive_ingest import ingest_archive, ArchiveError, ARCHIVE_TYPES
+from kb_transfer import (export_to_file, import_knowledge_base, list_exports, archive_name,
+                         TransferError, EXPORT_DIR, MAX_DOWNLOAD_BYTES)
+from uploads import save_uploads, DUPLICATE_LINK, DUPLICATE_REJECT
+from metrics import get_metrics
+from kb_artifacts import list_artifacts
+from index_explorer import describe, default_columns, read_page, FILTER_OPS
+from graph_view import get_graph, vega_lite_spec, GraphError, MAX_NODES as GRAPH_MAX_NODES
+from federated_query import (query_knowledge_bases, merge_answers,
+                             DEFAULT_TIMEOUT as FEDERATED_TIMEOUT)
+from run_logs import (list_run_logs, log_files, search as search_log,
+                      tail as tail_log_file, total_size as total_log_size)
+from fs_cache import (list_files, read_text, filter_names, paginate,
+                      file_sizes)
 
 
 # 配置日志记录
@@ -26,6 +62,21 @@ except AttributeError:
     rerun_method = st.experimental_rerun
     st.warning("你的 Streamlit 版本较旧，建议升级至 1.27.0 及以上以支持刷新功能。")
 
+# 记录每次脚本运行的耗时；被 rerun 打断的运行单独标记
+script_started = time.perf_counter()
+script_page = None
+_rerun = rerun_method
+
+
+def record_script_run(outcome):
+    get_metrics().observe("script_run", time.perf_counter() - script_started,
+                          {"page": script_page or "", "outcome": outcome})
+
+
+def rerun_method():
+    record_script_run("rerun")
+    _rerun()
+
 # 配置页面
 st.set_page_config(page_title="GraphRAG Web UI", layout="wide")
 
@@ -39,29 +90,20 @@ KB_DIR.mkdir(exist_ok=True)
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 
-def list_knowledge_bases():
-    """列出所有知识库"""
-    return [d.name for d in KB_DIR.iterdir() if d.is_dir()]
-
-
 def create_knowledge_base(name):
     """创建新的知识库并初始化"""
-    kb_path = KB_DIR / name
-    input_path = kb_path / "input"
-    kb_path.mkdir(parents=True, exist_ok=True)
-    input_path.mkdir(parents=True, exist_ok=True)
-
     # 执行初始化命令，并使用 spinner 显示加载动画
     with st.spinner("正在初始化知识库..."):
-        output = run_graphrag_command(
-            ["init", "--root", str(kb_path)], cwd=ROOT_DIR)
+        try:
+            success, output = create_kb(name)
+        except KnowledgeBaseError:
+            return (False, f"知识库名称 '{name}' 无效！")
 
     # 输出初始化结果到控制台
     print(f"初始化输出 for {name}: {output}")
 
     # 判断初始化是否成功
-    expected_message = f"Initializing project at {kb_path}"
-    if expected_message in output:
+    if success:
         return (True, "知识库创建并初始化成功！")
     else:
         return (False, "初始化失败，请检查 graphrag 是否正确安装或配置。")
@@ -69,46 +111,107 @@ def create_knowledge_base(name):
 
 def delete_knowledge_base(name):
     """删除指定的知识库"""
-    kb_path = KB_DIR / name
-    if kb_path.exists() and kb_path.is_dir():
-        shutil.rmtree(kb_path)
-        return (True, f"知识库 '{name}' 已删除！")
-    else:
+    try:
+        # 会等待正在进行的查询和索引结束
+        delete_kb(name)
+    except KnowledgeBaseError:
         return (False, f"知识库 '{name}' 不存在！")
+    except KBBusyError as e:
+        return (False, str(e))
+    return (True, f"知识库 '{name}' 已删除！")
 
 
-def clear_cache(kb_path):
-    """清除指定知识库的缓存文件和文件夹，保留 input、prompts、.env 和 settings.yaml"""
-    exclusions = {"input", "prompts", ".env", "settings.yaml"}
-    for item in kb_path.iterdir():
-        if item.name in exclusions:
-            logger.info(f"保留文件或文件夹: {item}")
-            continue
-        try:
-            if item.is_dir():
-                shutil.rmtree(item)
-                logger.info(f"已删除目录: {item}")
+def clear_cache(kb_path, keep_llm_cache=False):
+    """清除指定知识库的缓存文件和文件夹，保留 input、prompts、.env、settings.yaml、输入文件清单和索引版本"""
+    for item, error in clear_kb_cache(kb_path, keep_llm_cache):  # 知识库正在使用时抛出 KBBusyError
+        st.error(f"删除 {item} 时出错: {error}")
+
+
+def transfer_knowledge_bases(kb_list):
+    """将知识库导出为 .tar.zst 压缩包，并在其他节点上导入"""
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("导出知识库")
+        export_kb = st.selectbox("选择要导出的知识库", [""] + kb_list, index=0, key="export_select")
+        include_cache = st.checkbox("包含 LLM 缓存", key="export_cache")
+        include_env = st.checkbox("包含 .env（含 API 密钥）", key="export_env")
+        if st.button("导出知识库"):
+            if not export_kb:
+                st.error("请选择要导出的知识库！")
             else:
-                item.unlink()
-                logger.info(f"已删除文件: {item}")
-        except Exception as e:
-            logger.error(f"删除 {item} 时出错: {e}")
-            st.error(f"删除 {item} 时出错: {e}")
+                progress_text = st.empty()
+
+                def report(files, written):
+                    progress_text.text(f"已导出 {files} 个文件，{format_bytes(written)}...")
+
+                path = EXPORT_DIR / archive_name(export_kb)
+                try:
+                    manifest = export_to_file(KB_DIR / export_kb, path, include_cache=include_cache,
+                                              include_env=include_env, progress=report)
+                except (OSError, TransferError, KBBusyError) as e:
+                    st.error(f"导出知识库时出错: {e}")
+                else:
+                    progress_text.empty()
+                    st.success(f"已将 {len(manifest['files'])} 个文件导出到 {path}"
+                               f"（{format_bytes(path.stat().st_size)}）")
+        exports = list_exports()
+        if exports:
+            export = st.selectbox(
+                "已导出的压缩包", exports, key="export_file",
+                format_func=lambda e: f"{e['name']} ({format_bytes(e['bytes'])})")
+            if export["bytes"] <= MAX_DOWNLOAD_BYTES:
+                with open(export["path"], "rb") as f:
+                    st.download_button("下载压缩包", f, export["name"], "application/zstd")
+            else:
+                kb_name = export["name"].rsplit("-", 2)[0]
+                st.info(f"文件过大，无法通过浏览器下载。请从服务器复制 {export['path']}，"
+                        f"或通过 HTTP API 流式导出："
+                        f"`curl -o {export['name']} http://<host>:8600/kbs/{kb_name}/export`")
+            if st.button("删除压缩包"):
+                Path(export["path"]).unlink(missing_ok=True)
+                rerun_method()
+    with col2:
+        st.subheader("导入知识库")
+        archive = st.file_uploader("上传导出的压缩包（.tar.zst）", type=["zst", "tzst"],
+                                   key="kb_archive_upload")
+        server_path = st.text_input("或输入服务器上导出压缩包的路径")
+        import_name = st.text_input("导入后的知识库名称")
+        if st.button("导入知识库"):
+            if not archive and not server_path:
+                st.error("请上传压缩包或输入服务器路径！")
+            elif not import_name:
+                st.error("请输入知识库名称！")
+            else:
+                progress_text = st.empty()
+
+                def report(files, written):
+                    progress_text.text(f"已解压并校验 {files} 个文件，{format_bytes(written)}...")
+
+                try:
+                    if archive:
+                        manifest = import_knowledge_base(archive, import_name, progress=report)
+                    else:
+                        with open(server_path, "rb") as f:
+                            manifest = import_knowledge_base(f, import_name, progress=report)
+                except (OSError, TransferError, KnowledgeBaseError) as e:
+                    st.error(f"导入知识库时出错: {e}")
+                else:
+                    progress_text.empty()
+                    st.success(f"已将 '{manifest.get('kb')}' 导入为 '{import_name}'"
+                               f"（{len(manifest['files'])} 个文件，校验和全部通过）")
+                    if not manifest.get("include_env"):
+                        st.warning("压缩包中没有 .env，请在索引或查询前于该知识库的 .env 设置中填写 API 密钥。")
 
 
 def edit_env(kb_path):
     """编辑 .env 文件"""
     env_path = kb_path / ".env"
-    load_dotenv(dotenv_path=env_path)
-    if env_path.exists():
-        try:
-            with open(env_path, "r", encoding="utf-8") as f:
-                env_content = f.read()
-        except Exception as e:
-            st.error(f"读取 .env 文件时出错: {e}")
-            env_content = ""
-    else:
+    try:
+        env_content = read_text(env_path)  # 文件变化前使用缓存内容
+    except Exception as e:
+        st.error(f"读取 .env 文件时出错: {e}")
         env_content = ""
+    load_dotenv(stream=io.StringIO(env_content))
     st.subheader(".env 文件编辑")
     new_env = st.text_area("编辑 .env 文件内容", env_content, height=200)
     if st.button("保存 .env 文件"):
@@ -124,14 +227,10 @@ def edit_env(kb_path):
 def edit_settings(kb_path):
     """编辑 settings.yaml 文件"""
     settings_path = kb_path / "settings.yaml"
-    if settings_path.exists():
-        try:
-            with open(settings_path, "r", encoding="utf-8") as f:
-                settings_content = f.read()
-        except Exception as e:
-            st.error(f"读取 settings.yaml 文件时出错: {e}")
-            settings_content = ""
-    else:
+    try:
+        settings_content = read_text(settings_path)  # 文件变化前使用缓存内容
+    except Exception as e:
+        st.error(f"读取 settings.yaml 文件时出错: {e}")
         settings_content = ""
     st.subheader("settings.yaml 文件编辑")
     new_settings = st.text_area(
@@ -140,54 +239,97 @@ def edit_settings(kb_path):
         try:
             with open(settings_path, "w", encoding="utf-8") as f:
                 f.write(new_settings)
+            record_settings_edit(kb_path.name, new_settings)  # 供性能分析定位变慢的原因
             st.success("settings.yaml 文件已保存！")
             rerun_method()  # 自动刷新页面
         except Exception as e:
             st.error(f"保存 settings.yaml 文件时出错: {e}")
 
 
+FILE_PAGE_SIZES = [25, 50, 100]
+
+
 def manage_files(kb_path):
     """管理知识库中的 txt 文件"""
     input_path = kb_path / "input"
     st.subheader("管理知识库中的知识文件 (input 下的 txt 文件)")
-    # 列出当前文件
-    files = [f.name for f in input_path.glob("*.txt")]
-    st.write("当前文件：")
+    # 分页列出当前文件，支持搜索
+    files = list_files(input_path, "*.txt")
+    st.write(f"当前文件（{len(files)} 个）：")
     if files:
-        for file in files:
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            search = st.text_input("搜索文件", key=f"file_search_{kb_path.name}")
+        with col2:
+            page_size = st.selectbox("每页文件数", FILE_PAGE_SIZES,
+                                     key=f"file_page_size_{kb_path.name}")
+        matches = filter_names(files, search)
+        with col3:
+            page = st.number_input("页码", min_value=1, key=f"file_page_{kb_path.name}")
+        page_files, page, pages = paginate(matches, page, page_size)
+        st.caption(f"共 {len(matches)} 个匹配文件，第 {page} / {pages} 页")
+        sizes = file_sizes(input_path, page_files)
+        # 每次删除后递增，使选择框恢复为未勾选
+        generation = st.session_state.get(f"file_selection_{kb_path.name}", 0)
+        selected = []
+        for file in page_files:
             col1, col2 = st.columns([4, 1])
             with col1:
-                st.text(file)
+                if st.checkbox(file, key=f"sel_{kb_path.name}_{generation}_{file}"):
+                    selected.append(file)
             with col2:
-                if st.button(f"删除 {file}", key=f"del_{file}"):
-                    try:
-                        os.remove(input_path / file)
-                        st.success(f"文件 '{file}' 已删除！")
-                        print(f"文件 '{file}' 已删除！")
-                        rerun_method()  # 自动刷新页面
-                    except Exception as e:
-                        st.error(f"删除文件 '{file}' 时出错: {e}")
+                st.text(format_bytes(sizes.get(file, 0)))
+        select_all = st.checkbox(f"选择全部 {len(matches)} 个匹配文件",
+                                 key=f"sel_all_{kb_path.name}_{generation}")
+        targets = matches if select_all else selected
+        if st.button(f"删除选中的 {len(targets)} 个文件", disabled=not targets):
+            deleted, errors = delete_input_files(kb_path, targets)
+            for name, error in errors:
+                st.error(f"删除文件 '{name}' 时出错: {error}")
+            st.session_state[f"file_selection_{kb_path.name}"] = generation + 1
+            print(f"已从 '{kb_path.name}' 删除 {len(deleted)} 个文件")
+            if len(deleted) == len(targets):
+                rerun_method()  # 自动刷新页面
     else:
         st.info("当前没有上传的 txt 文件。")
     st.write("---")
+    # 显示上一批上传的结果
+    upload_summary = st.session_state.pop('upload_summary', None)
+    if upload_summary:
+        st.success(upload_summary)
     # 上传文件
     uploaded_files = st.file_uploader(
         "上传新的 txt 文件", type=["txt"], accept_multiple_files=True)
+    duplicate_policy = st.radio(
+        "内容已存在的文档", ["拒绝", "保留为硬链接"], horizontal=True)
 
     # 初始化 session state 标记
     if 'files_uploaded' not in st.session_state:
         st.session_state['files_uploaded'] = False
 
     if uploaded_files and not st.session_state['files_uploaded']:
-        for uploaded_file in uploaded_files:
-            save_path = input_path / uploaded_file.name
-            try:
-                with open(save_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                print(f"文件 '{uploaded_file.name}' 上传成功！")
-            except Exception as e:
-                st.error(f"上传文件 '{uploaded_file.name}' 时出错: {e}")
-        st.success(f"共上传了 {len(uploaded_files)} 个文件。")
+        # 使用小线程池分块写入文件，并跳过内容重复的文件
+        progress_bar = st.progress(0.0, text="正在上传文件...")
+        with get_metrics().timer("file_io", op="upload", kb=kb_path.name) as timing:
+            results = save_uploads(
+                kb_path, uploaded_files,
+                on_duplicate=DUPLICATE_LINK if duplicate_policy == "保留为硬链接" else DUPLICATE_REJECT,
+                progress=lambda done, total: progress_bar.progress(done / total))
+            timing["files"] = len(results)
+            timing["bytes"] = sum(result["size"] for result in results)
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            if result["status"] == "error":
+                st.error(f"上传文件 '{result['name']}' 时出错: {result['error']}")
+            elif result["status"] == "duplicate":
+                print(f"文件 '{result['name']}' 已跳过，内容与 '{result['duplicate_of']}' 相同")
+            else:
+                print(f"文件 '{result['name']}' 上传成功！")
+        st.session_state['upload_summary'] = (
+            f"共上传了 {counts.get('saved', 0)} 个文件，"
+            f"拒绝 {counts.get('duplicate', 0)} 个重复文件，"
+            f"硬链接 {counts.get('linked', 0)} 个，未变化 {counts.get('unchanged', 0)} 个。")
         # 设置标记以指示文件已上传
         st.session_state['files_uploaded'] = True  # 设置标记为已上传
         rerun_method()  # 自动刷新页面
@@ -197,67 +339,720 @@ def manage_files(kb_path):
         st.session_state['files_uploaded'] = False
 
 
-def run_graphrag_command(args, cwd):
-    """通过 subprocess 调用 graphrag 命令，并输出结果到控制台"""
+def import_archives(kb_path):
+    """从 zip/tar 压缩包批量导入知识文件"""
+    st.subheader("从压缩包导入")
+    st.write(".zip、.tar.gz 或 .tar.zst 压缩包中的文本文件（.txt、.md）会直接解压到 input "
+             "文件夹，并统一转换为 UTF-8 编码。")
+    archive = st.file_uploader("上传压缩包", type=ARCHIVE_TYPES, key="archive_upload")
+    server_path = st.text_input("或输入服务器上压缩包的路径（适用于超大语料）")
+    duplicate_policy = st.radio(
+        "内容已存在的文档", ["拒绝", "保留为硬链接"], horizontal=True, key="archive_duplicates")
+    if st.button("导入压缩包"):
+        if not archive and not server_path:
+            st.error("请上传压缩包或输入服务器路径！")
+            return
+        progress_text = st.empty()
+
+        def report(members, written):
+            progress_text.text(f"已处理 {members} 个压缩包成员，已写入 {format_bytes(written)}...")
+
+        on_duplicate = DUPLICATE_LINK if duplicate_policy == "保留为硬链接" else DUPLICATE_REJECT
+        try:
+            if archive:
+                summary = ingest_archive(kb_path, archive, archive.name,
+                                         on_duplicate=on_duplicate, progress=report)
+            else:
+                with open(server_path, "rb") as f:
+                    summary = ingest_archive(kb_path, f, Path(server_path).name,
+                                             on_duplicate=on_duplicate, progress=report)
+        except (OSError, ArchiveError) as e:
+            st.error(f"导入压缩包时出错: {e}")
+            return
+        st.success(f"已导入 {summary['saved']} 个文件（{format_bytes(summary['bytes'])}），"
+                   f"拒绝 {summary['duplicate']} 个重复文件，硬链接 {summary['linked']} 个，"
+                   f"未变化 {summary['unchanged']} 个，跳过 {summary['skipped']} 个不支持的文件，"
+                   f"{summary['reencoded']} 个文件已转换为 UTF-8。")
+        if summary["error"]:
+            st.warning(f"有 {summary['error']} 个文件无法解压，请查看服务器日志。")
+
+
+def find_near_duplicates(kb_path):
+    """查找近似重复的文档，并将其排除在索引之外"""
+    st.subheader("近似重复文档")
+    st.write("与其他文档内容大部分相同的文档（如修订版或副本）会消耗 LLM 调用，却几乎不会为图谱"
+             f"增加新内容。被排除的文档会移动到 GraphRAG 不读取的 {EXCLUDED_DIR} 文件夹，"
+             "之后可以恢复。")
+    threshold = st.slider("相似度阈值", min_value=0.5, max_value=1.0,
+                          value=min(max(DEDUPE_THRESHOLD, 0.5), 1.0), step=0.05,
+                          key=f"dedupe_threshold_{kb_path.name}")
+    state_key = f"near_duplicates_{kb_path.name}"
+    if st.button("查找近似重复", key=f"find_duplicates_{kb_path.name}"):
+        bar = st.progress(0.0, text="正在计算输入文档的签名...")
+        labels = {"signatures": "已计算签名", "tokens": "已分词"}
+        try:
+            st.session_state[state_key] = find_duplicates(
+                kb_path, threshold, progress=lambda stage, done, total: bar.progress(
+                    done / total, text=f"{labels[stage]} {done}/{total} 个文档"))
+        except DedupeError as e:
+            st.error(str(e))
+        bar.empty()
+    result = st.session_state.get(state_key)
+    if result:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("文档数", f"{result['documents']:,}")
+        col2.metric("重复簇", f"{len(result['clusters']):,}")
+        col3.metric("重复文档", f"{result['duplicate_documents']:,}")
+        col4.metric("节省的 LLM 调用", f"{result['saved_llm_calls']:,}")
+        st.caption(
+            f"排除这些重复文档约可节省 {result['saved_llm_prompt_tokens']:,} 个提示词 token 和 "
+            f"{result['saved_embedding_tokens']:,} 个嵌入 token"
+            f"（文档本身 {result['duplicate_tokens']:,} 个 token）。"
+            f"本次计算 {result['read_files']} 个文档的签名，{result['cached_files']} 个来自缓存，"
+            f"跳过 {result['empty_documents']} 个没有文本的文档。")
+        if not result["exact_tokens"]:
+            st.warning("tiktoken 或其编码不可用，token 数按文件大小近似估算。")
+        duplicates = {entry["name"]: {"duplicate_of": cluster["keep"],
+                                      "similarity": entry["similarity"]}
+                      for cluster in result["clusters"] for entry in cluster["duplicates"]}
+        if not duplicates:
+            st.info(f"没有相似度达到 {result['threshold']:.0%} 的文档。")
+        else:
+            st.dataframe([{"保留": cluster["keep"], "重复文档": entry["name"],
+                           "相似度": f"{entry['similarity']:.0%}", "Token 数": entry["tokens"]}
+                          for cluster in result["clusters"] for entry in cluster["duplicates"]],
+                         use_container_width=True)
+            chosen = st.multiselect("要排除的重复文档", list(duplicates),
+                                    default=list(duplicates), key=f"exclude_{kb_path.name}")
+            if st.button(f"排除 {len(chosen)} 个文档", disabled=not chosen,
+                         key=f"exclude_button_{kb_path.name}"):
+                try:
+                    excluded, errors = exclude_duplicates(
+                        kb_path, {name: duplicates[name] for name in chosen})
+                except KBBusyError as e:
+                    st.error(str(e))
+                    st.stop()
+                for name, error in errors:
+                    st.error(f"排除文件 '{name}' 时出错: {error}")
+                st.session_state.pop(state_key, None)
+                print(f"已从 '{kb_path.name}' 排除 {len(excluded)} 个近似重复文件")
+                if not errors:
+                    rerun_method()
+
+    excluded = list_excluded(kb_path)
+    if excluded:
+        with st.expander(f"已排除的文档（{len(excluded)}）"):
+            st.dataframe([{"文档": name, "重复于": entry.get("duplicate_of"),
+                           "相似度": (f"{entry['similarity']:.0%}"
+                                      if entry.get("similarity") is not None else ""),
+                           "排除时间": time.strftime("%Y-%m-%d %H:%M",
+                                                     time.localtime(entry["excluded_at"]))}
+                          for name, entry in excluded.items()], use_container_width=True)
+            chosen = st.multiselect("要恢复的文档", list(excluded), key=f"restore_{kb_path.name}")
+            if st.button(f"恢复 {len(chosen)} 个文档", disabled=not chosen,
+                         key=f"restore_button_{kb_path.name}"):
+                try:
+                    restored, errors = restore_excluded(kb_path, chosen)
+                except KBBusyError as e:
+                    st.error(str(e))
+                    st.stop()
+                for name, error in errors:
+                    st.error(f"恢复文件 '{name}' 时出错: {error}")
+                if not errors:
+                    rerun_method()
+
+
+def manage_storage(kb_path):
+    """显示生成文件夹的磁盘占用，并按需清理"""
+    st.subheader("缓存与存储")
+    usage = storage_usage(kb_path)
+    labels = {"cache": "LLM 缓存", "output": "输出", "logs": "日志"}
+    cols = st.columns(len(usage))
+    for col, (name, (size, files)) in zip(cols, usage.items()):
+        col.metric(labels[name], format_bytes(size), f"{files} 个文件", delta_color="off")
+
+    breakdown = llm_cache_breakdown(kb_path)
+    if breakdown:
+        with st.expander("按工作流查看 LLM 缓存"):
+            st.table([{"工作流": name, "大小": format_bytes(size), "文件数": files}
+                      for name, (size, files) in breakdown.items()])
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("清除输出", key="clear_output",
+                     help="删除当前索引及所有保留的版本"):
+            try:
+                with writing(kb_path):
+                    delete_index_versions(kb_path)
+                    InputManifest(kb_path).reset_indexed()
+                    invalidate_index(kb_path)
+                st.success("输出已清除！")
+                rerun_method()  # 自动刷新页面
+            except KBBusyError as e:
+                st.error(str(e))
+    with col2:
+        if st.button("清除日志", key="clear_logs"):
+            try:
+                clear_dir(kb_path, "logs")
+                st.success("日志已清除！")
+                rerun_method()  # 自动刷新页面
+            except KBBusyError as e:
+                st.error(str(e))
+
+    st.write("---")
+    st.write("按最近最少使用的顺序裁剪 LLM 缓存，或合并内容相同的缓存条目，以控制磁盘占用。")
+    budget_mb = st.number_input("LLM 缓存上限（MB）", min_value=0, value=1024, step=128)
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("裁剪 LLM 缓存"):
+            try:
+                with st.spinner("正在裁剪 LLM 缓存..."):
+                    removed, freed = prune_llm_cache(kb_path, budget_mb * 1024 * 1024)
+                st.success(f"已删除 {removed} 个缓存条目，释放 {format_bytes(freed)}。")
+            except KBBusyError as e:
+                st.error(str(e))
+    with col2:
+        if st.button("合并重复的 LLM 缓存"):
+            try:
+                with st.spinner("正在合并重复的 LLM 缓存..."):
+                    linked, saved = dedupe_llm_cache(kb_path)
+                st.success(f"已合并 {linked} 个相同条目，节省 {format_bytes(saved)}。")
+            except KBBusyError as e:
+                st.error(str(e))
+
+
+def batch_query_page(kb_path):
+    """对知识库批量运行 CSV/JSONL 问题集"""
+    st.write("上传包含 `question` 列的 CSV 文件，或包含 `question` 字段的 JSONL 文件。"
+             "可选的 `method` 列会覆盖默认的查询方法。")
+    questions_file = st.file_uploader("问题集", type=["csv", "jsonl"])
+    col1, col2 = st.columns(2)
+    with col1:
+        default_method = st.selectbox("默认查询方法", ["local", "global", "drift"],
+                                      key="batch_method")
+    with col2:
+        parallelism = st.slider("并发查询数", 1, MAX_PARALLELISM, 4)
+    if st.button("运行批量查询"):
+        if not questions_file:
+            st.error("请上传问题集！")
+            return
+        try:
+            questions = load_questions(questions_file, questions_file.name, default_method)
+        except BatchFormatError as e:
+            st.error(f"读取问题集时出错: {e}")
+            return
+        if not questions:
+            st.error("问题集中没有任何问题！")
+            return
+        progress_bar = st.progress(0.0, text="正在运行问题...")
+        table = st.empty()
+        results = []
+        for result in run_batch(kb_path, questions, cwd=ROOT_DIR, parallelism=parallelism):
+            results.append(result)
+            progress_bar.progress(len(results) / len(questions),
+                                  text=f"已回答 {len(results)} / {len(questions)} 个问题")
+            table.dataframe([{"#": r["index"], "问题": r["question"], "方法": r["method"],
+                              "状态": r["status"], "耗时（秒）": r["latency_seconds"]}
+                             for r in sorted(results, key=lambda r: r["index"])],
+                            use_container_width=True)
+        st.session_state[f"batch_results_{kb_path.name}"] = results
+
+    results = st.session_state.get(f"batch_results_{kb_path.name}")
+    if results:
+        summary = summarize(results)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("问题数", summary["count"])
+        col2.metric("已回答", summary["statuses"].get("ok", 0))
+        col3.metric("p50 耗时（秒）", summary["p50"])
+        col4.metric("p95 耗时（秒）", summary["p95"])
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("导出 CSV", to_csv(results), "batch_results.csv", "text/csv")
+        with col2:
+            st.download_button("导出 JSONL", to_jsonl(results), "batch_results.jsonl",
+                               "application/jsonl")
+
+
+def explore_index(kb_path):
+    """按页浏览索引产物，不整表加载"""
+    st.subheader("索引浏览")
+    artifacts = list_artifacts(kb_path)
+    if not artifacts:
+        st.info("该知识库还没有索引产物，请先建立索引。")
+        return
+    key = f"explorer_{kb_path.name}"
+    name = st.selectbox("索引表", list(artifacts), key=f"{key}_artifact")
+    path = artifacts[name]
+    info = describe(path)
+    column_names = [column for column, _type in info["columns"]]
+    st.caption(f"共 {info['rows']} 行，{info['row_groups']} 个行组，"
+               f"{format_bytes(path.stat().st_size)}")
+    columns = st.multiselect("列", column_names, default=default_columns(path),
+                             key=f"{key}_{name}_columns")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        search = st.text_input("搜索文本列", key=f"{key}_{name}_search")
+    with col2:
+        sort_column = st.selectbox("排序列", [""] + column_names, key=f"{key}_{name}_sort")
+    with col3:
+        descending = st.checkbox("降序", key=f"{key}_{name}_desc")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        filter_column = st.selectbox("筛选列", [""] + column_names,
+                                     key=f"{key}_{name}_filter")
+    with col2:
+        filter_op = st.selectbox("运算符", FILTER_OPS, key=f"{key}_{name}_op")
+    with col3:
+        filter_value = st.text_input("值", key=f"{key}_{name}_value")
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox("每页行数", [25, 50, 100, 250], key=f"{key}_page_size")
+    with col2:
+        page = st.number_input("页码", min_value=1, key=f"{key}_{name}_page")
     try:
-        result = subprocess.run(
-            ["python", "-m", "graphrag"] + args,
-            cwd=cwd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,  # 将stderr重定向到stdout
-            text=True,
-            check=True
-        )
-        print(f"Command Output: {result.stdout}")
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Command Error: {e.output}")
-        return f"Error: {e.output}"
-
-
-def parse_graphrag_response(output, method):
-    """解析 graphrag 命令的响应"""
-    markers = {
-        "local": "SUCCESS: Local Search Response:",
-        "global": "SUCCESS: Global Search Response:",
-        "drift": "SUCCESS: DRIFT Search Response:"
-    }
-    marker = markers.get(method.lower())
-    if not marker:
-        return None
-    start = output.find(marker)
-    if start == -1:
-        return None
-    return output[start + len(marker):].strip()
-
-
-def index_knowledge_base(name):
-    """索引指定的知识库"""
-    kb_path = KB_DIR / name
-
-    # 执行索引命令，并使用 spinner 显示加载动画
-    with st.spinner("正在索引知识库..."):
-        output = run_graphrag_command(
-            ["index", "--root", str(kb_path)], cwd=ROOT_DIR)
-
-    # 输出索引结果到控制台
-    print(f"索引输出 for {name}: {output}")
-
-    # 判断索引是否成功
-    expected_message = "All workflows completed successfully."
-    if expected_message in output:
+        with st.spinner("正在读取索引表..."):
+            table, matches = read_page(
+                path, columns or None, page, page_size, search=search.strip(),
+                filter_column=filter_column if filter_value else None,
+                filter_op=filter_op, filter_value=filter_value,
+                sort_column=sort_column or None, descending=descending)
+    except (ValueError, KeyError, OSError) as e:
+        st.error(f"读取 {name} 时出错: {e}")
+        return
+    pages = max(1, -(-matches // page_size))
+    st.caption(f"共 {matches} 行匹配，第 {min(page, pages)} / {pages} 页")
+    st.dataframe(table, use_container_width=True)
+
+
+def graph_view(kb_path):
+    """分层级显示实体图，由服务器端进行降采样"""
+    st.subheader("知识图谱")
+    try:
+        with st.spinner("正在加载图谱并计算布局..."):
+            graph = get_graph(kb_path)
+    except (GraphError, ValueError, KeyError, OSError) as e:
+        st.info(f"没有可显示的图谱: {e}")
+        return
+    key = f"graph_{kb_path.name}"
+    col1, col2 = st.columns(2)
+    with col1:
+        view = st.radio("起始视图", ["度数最高的实体", "社区"],
+                        horizontal=True, key=f"{key}_view")
+    with col2:
+        count = st.slider("节点数", 20, GRAPH_MAX_NODES, 100, step=10, key=f"{key}_count")
+    if view == "社区":
+        summary = graph.community_summary(count)
+        if summary is None:
+            st.info("索引中没有社区划分，改为显示度数最高的实体。")
+            view = "度数最高的实体"
+        else:
+            options = {node["name"]: node["id"] for node in summary["nodes"]}
+            opened = st.selectbox("打开社区", [""] + list(options), key=f"{key}_community")
+            if not opened:
+                st.caption(f"显示 {len(summary['nodes'])} / {summary['total_nodes']} 个社区")
+                st.vega_lite_chart(vega_lite_spec(summary), use_container_width=True)
+                return
+            base = graph.members(options[opened], count)
+    if view == "度数最高的实体":
+        base = [node["id"] for node in graph.top_nodes(count)["nodes"]]
+    payload = graph.neighborhood([], base=base)
+    expand = st.multiselect("展开以下实体的邻居", [node["name"] for node in payload["nodes"]],
+                            key=f"{key}_expand")
+    if expand:
+        payload = graph.neighborhood(expand, base=base)
+    st.caption(f"显示 {len(payload['nodes'])} / {payload['total_nodes']} 个实体，"
+               f"{len(payload['edges'])} / {payload['total_edges']} 条关系")
+    st.vega_lite_chart(vega_lite_spec(payload), use_container_width=True)
+
+
+STREAM_RENDER_SECONDS = 0.1
+
+
+def partial_renderer(area):
+    """将流式生成的答案渲染到占位元素中，最多每 STREAM_RENDER_SECONDS 秒刷新一次"""
+    last_render = [0.0]
+
+    def render(text):
+        now = time.perf_counter()
+        if not text or now - last_render[0] >= STREAM_RENDER_SECONDS:
+            area.markdown(text + " ▌" if text else "")
+            last_render[0] = now
+
+    return render
+
+
+METRIC_GROUPS = [
+    ("GraphRAG 命令", "command", ["subcommand", "exit_code"]),
+    ("查询", "query", ["method", "source"]),
+    ("首个 token 延迟", "query_first_token", ["method", "source"]),
+    ("索引任务", "index_job", ["kind", "status"]),
+    ("索引工作流", "workflow", ["workflow"]),
+    ("文件操作", "file_io", ["op", "status"]),
+    ("页面运行", "script_run", ["page", "outcome"]),
+]
+LOG_CHOICES = 200
+METRIC_WINDOWS = {"最近 5 分钟": 300, "最近 1 小时": 3600, "全部保留的记录": None}
+
+
+def metrics_page():
+    """命令、查询、索引和文件读写的滚动延迟百分位"""
+    metrics = get_metrics()
+    window = st.radio("时间范围", list(METRIC_WINDOWS), index=1, horizontal=True)
+    since = time.time() - METRIC_WINDOWS[window] if METRIC_WINDOWS[window] else None
+    for title, name, group_by in METRIC_GROUPS:
+        rows = [row for row in metrics.summary(since=since, group_by=group_by)
+                if row["metric"] == name]
+        st.subheader(title)
+        if rows:
+            st.table([{key: value for key, value in row.items() if key != "metric"}
+                      for row in rows])
+        else:
+            st.info("该时间范围内没有记录。")
+    with st.expander("最近的 GraphRAG 命令"):
+        recent = metrics.events("command", since=since)[-20:]
+        if recent:
+            st.table([{"时间": time.strftime("%H:%M:%S", time.localtime(e["time"])),
+                       **e["labels"], "秒": round(e["seconds"], 2),
+                       "峰值内存": format_bytes(e["peak_rss_bytes"]) if "peak_rss_bytes" in e else "-",
+                       "输出大小": format_bytes(e["output_bytes"])}
+                      for e in reversed(recent)])
+        else:
+            st.info("该时间范围内没有 GraphRAG 命令。")
+    st.subheader("Prometheus 导出")
+    st.caption(f"写入 `{metrics.export_path}`；设置 `GRAPHRAG_METRICS_PORT` 后"
+               f"还可通过 `http://<host>:<port>/metrics` 获取。")
+    export = metrics.prometheus()
+    metrics.flush(force=True)
+    st.download_button("下载 metrics.prom", export, "metrics.prom", "text/plain")
+    with st.expander("Prometheus 文本"):
+        st.code(export, language="text")
+
+
+def logs_page():
+    """查看并搜索索引任务和 graphrag 命令的日志"""
+    source = st.radio("来源", ["索引任务", "命令"], horizontal=True)
+    kb_filter = st.selectbox("知识库", ["全部"] + list_knowledge_bases(), key="logs_kb")
+    kb_name = None if kb_filter == "全部" else kb_filter
+    if source == "索引任务":
+        options = {f"{job.id} — {job.kb_name}（{job.status}）": job.log_path
+                   for job in get_job_manager().jobs(kb_name, limit=LOG_CHOICES)
+                   if job.log_path.exists()}
+    else:
+        options = {f"{run['name']}（{format_bytes(run['bytes'])}）": run["path"]
+                   for run in list_run_logs(kb_name)[:LOG_CHOICES]}
+    if not options:
+        st.info("暂无日志。")
+        return
+    path = options[st.selectbox("日志", list(options), key="logs_file")]
+    st.caption(f"共 {format_bytes(total_log_size(path))}，{len(log_files(path))} 个文件")
+    col1, col2, col3 = st.columns([4, 1, 1])
+    pattern = col1.text_input("搜索", key="logs_search")
+    use_regex = col2.checkbox("正则", key="logs_regex")
+    match_case = col3.checkbox("区分大小写", key="logs_case")
+    if pattern:
+        try:
+            matches, truncated = search_log(path, pattern, regex=use_regex,
+                                            ignore_case=not match_case)
+        except re.error as e:
+            st.error(f"正则表达式无效: {e}")
+            return
+        st.write(f"{len(matches)}{'+' if truncated else ''} 行匹配")
+        st.code("\n".join(f"{number:>8}  {line}" for number, line in matches)
+                or "（无匹配）", language="text")
+    else:
+        lines = st.number_input("最后行数", min_value=10, max_value=5000, value=200,
+                                step=50, key="logs_lines")
+        if st.button("刷新", key="logs_refresh"):
+            rerun_method()  # 重新读取最新的行
+        st.code(tail_log_file(path, int(lines)) or "（空）", language="text")
+
+
+def federated_query_page(kb_list, default_kb):
+    """并行向多个知识库提出同一个问题"""
+    selected = st.multiselect("知识库", kb_list, default=[default_kb], key="federated_kbs")
+    for name in selected:
+        warm_query_worker(KB_DIR / name)
+    query = st.text_input("请输入你的问题", key="federated_query")
+    col1, col2 = st.columns(2)
+    with col1:
+        method = st.selectbox("选择查询方法", ["local", "global", "drift"],
+                              key="federated_method")
+    with col2:
+        timeout = st.number_input("每个知识库的超时时间（秒）", min_value=5,
+                                  value=FEDERATED_TIMEOUT, step=5)
+    if st.button("查询所选知识库"):
+        if not selected or not query:
+            st.error("请至少选择一个知识库并输入问题！")
+            return
+        status = st.empty()
+        # 每个知识库一个占位区域，答案到达后即时填充
+        sections = {}
+        for name in selected:
+            st.markdown(f"### {name}")
+            sections[name] = st.empty()
+            sections[name].info("正在等待回答...")
+        results = []
+        for result in query_knowledge_bases([KB_DIR / name for name in selected], method,
+                                            query, cwd=ROOT_DIR, timeout=timeout):
+            results.append(result)
+            status.write(f"已有 {len(results)} / {len(selected)} 个知识库返回结果")
+            section = sections[result["knowledge_base"]]
+            if result["status"] == "ok":
+                section.markdown(f"{result['answer']}\n\n"
+                                 f"_用时 {result['latency_seconds']} 秒_")
+            elif result["status"] == "no_response":
+                section.warning(f"未找到有效的响应（{result['latency_seconds']} 秒）。")
+            elif result["status"] == "timeout":
+                section.warning(f"{timeout} 秒内未返回回答。")
+            else:
+                section.error(f"查询失败: {result['error']}")
+        st.download_button("导出合并的回答", merge_answers(results, order=selected),
+                           "federated_answers.md", "text/markdown")
+
+
+def _worker_status(worker):
+    if not worker["alive"]:
+        return "无响应"
+    if not worker.get("job"):
+        return "空闲"
+    workflow = f"（{worker['workflow']}）" if worker.get("workflow") else ""
+    return f"正在索引 {worker['kb']}{workflow}"
+
+
+def show_index_workers():
+    """显示索引工作进程，以及在任务队列中等待或已被领取的任务"""
+    spool = JobSpool()
+    workers, queue = spool.workers(), spool.queue()
+    if not workers and not queue:
+        return
+    live = sum(worker["alive"] for worker in workers)
+    with st.expander(f"索引工作进程（{live} 个在线，{len(queue)} 个任务排队或运行中）"):
+        st.caption("在本机或共享 knowledge_bases 卷的其他主机上通过 `python index_worker.py` "
+                   "启动的工作进程会从任务队列中领取索引任务。")
+        if workers:
+            st.table([{"工作进程": w["name"], "主机": w["host"],
+                       "状态": _worker_status(w),
+                       "成功": w.get("succeeded", 0), "失败": w.get("failed", 0),
+                       "最近心跳": f"{w['heartbeat_age']:.0f} 秒前"} for w in workers])
+        if queue:
+            st.table([{"任务": state["id"], "知识库": state["kb_name"],
+                       "状态": state["status"],
+                       "工作进程": claim["worker"] if claim else "",
+                       "尝试次数": state.get("attempts", 0),
+                       "心跳": (f"{claim['heartbeat_age']:.0f} 秒前"
+                              if claim and claim.get("heartbeat_age") is not None else "")}
+                      for state, claim in queue])
+
+
+def show_index_jobs(name):
+    """显示知识库索引任务的进度和日志"""
+    show_index_workers()
+    manager = get_job_manager()
+    jobs = manager.jobs(name, limit=10)
+    if not jobs:
+        st.info("该知识库尚未通过 Web 界面索引过。")
+        return
+    job = jobs[0]
+    st.write(f"最近的任务：`{job.id}` — **{job.status}** "
+             f"（{job.elapsed():.0f} 秒）" + (f"，工作进程 `{job.worker}`" if job.worker else ""))
+    if job.active and job.spool and not job.worker:
+        st.info("正在等待索引工作进程领取任务...")
+    if job.workflows:
+        st.table([{"工作流": w["name"], "耗时（秒）": w["seconds"]}
+                  for w in job.workflows])
+    if job.active:
+        if job.current_workflow:
+            st.write(f"正在运行的工作流：`{job.current_workflow}`")
+        st.info(f"正在索引，已完成 {len(job.workflows)} 个工作流。")
+        if st.button("取消索引", key=f"cancel_{job.id}"):
+            manager.cancel(job.id)
+            st.warning("正在取消索引任务...")
+    elif job.status == "succeeded":
         st.success("知识库索引成功！")
-        logger.info(f"知识库 '{name}' 索引成功！")
-        rerun_method()  # 自动刷新页面以显示最新内容
+    elif job.status == "cancelled":
+        st.warning("索引已取消。")
     else:
         st.error("索引失败，请检查 graphrag 是否正确安装或配置。")
+    with st.expander("索引日志", expanded=job.active):
+        st.code(manager.tail(job.id) or "（暂无输出）", language="text")
+    if len(jobs) > 1:
+        with st.expander("历史索引任务"):
+            st.table([{"任务": j.id, "状态": j.status,
+                       "工作进程": j.worker or "Web 界面",
+                       "工作流数": len(j.workflows),
+                       "耗时（秒）": round(j.elapsed())} for j in jobs[1:]])
+
+
+def show_index_estimate(kb_path):
+    """估算完整索引的 LLM 调用次数、token 数、耗时和费用"""
+    with st.expander("估算索引费用和耗时"):
+        st.caption("对每个输入文档进行分词（按内容哈希缓存），并结合 settings.yaml 中的"
+                   "分块、模型和并发设置进行估算。")
+        col1, col2 = st.columns(2)
+        llm_price = col1.number_input("LLM 每百万提示 token 价格", min_value=0.0,
+                                      value=0.0, step=0.5, key=f"llm_price_{kb_path.name}")
+        embedding_price = col2.number_input(
+            "嵌入每百万 token 价格", min_value=0.0, value=0.0, step=0.01,
+            key=f"embedding_price_{kb_path.name}")
+        state_key = f"index_estimate_{kb_path.name}"
+        if st.button("估算", key=f"estimate_{kb_path.name}"):
+            bar = st.progress(0.0, text="正在对输入文档分词...")
+            estimate = estimate_index(
+                kb_path, progress=lambda done, total: bar.progress(
+                    done / total, text=f"已分词 {done}/{total} 个文档"))
+            bar.empty()
+            st.session_state[state_key] = estimate
+        estimate = st.session_state.get(state_key)
+        if not estimate:
+            return
+        settings = estimate["settings"]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("文档数", f"{estimate['documents']:,}")
+        col2.metric("Token 数", f"{estimate['tokens']:,}")
+        col3.metric("分块数", f"{estimate['chunks']:,}")
+        col4.metric("预计耗时", format_duration(estimate["wall_seconds"]))
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("抽取调用", f"{estimate['extraction_calls'] + estimate['claim_calls']:,}")
+        col2.metric("LLM 调用（合计）", f"{estimate['llm_calls']:,}")
+        col3.metric("嵌入调用", f"{estimate['embedding_calls']:,}")
+        col4.metric("费用", f"{estimate_cost(estimate, llm_price, embedding_price):,.2f}")
+        st.caption(
+            f"模型 `{settings['model']}`，并发请求 {settings['concurrency']}，"
+            f"嵌入模型 `{settings['embedding_model']}`，分块 {settings['chunk_size']} token"
+            f"（重叠 {settings['chunk_overlap']}），gleaning {settings['max_gleanings']} 次。"
+            f"约 {estimate['llm_prompt_tokens']:,} 个提示 token 和 "
+            f"{estimate['embedding_tokens']:,} 个嵌入 token。"
+            f"本次分词 {estimate['tokenized_files']} 个文档，"
+            f"{estimate['cached_files']} 个来自缓存。")
+        if not estimate["exact_tokens"]:
+            st.warning("tiktoken 或其编码不可用，token 数按文件大小近似估算。")
+        st.caption("摘要和社区报告的调用次数以及耗时为典型值，实际取决于内容和 LLM 的响应速度。")
+
+
+def show_index_versions(kb_path):
+    """列出保留的索引版本，并可回滚到其中之一"""
+    versions = list_versions(kb_path)
+    if not versions:
+        return
+    with st.expander(f"索引版本（{len(versions)}）"):
+        st.table([{"版本": v["name"],
+                   "创建时间": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(v["created"])),
+                   "大小": format_bytes(v["bytes"]), "文件数": v["files"],
+                   "当前": "✓" if v["current"] else ""} for v in versions])
+        st.caption(f"除当前索引外，保留最近的 {KEEP_INDEX_VERSIONS} 个版本"
+                   "（GRAPHRAG_KEEP_INDEX_VERSIONS）。")
+        previous = [v["name"] for v in versions if not v["current"]]
+        if not previous:
+            return
+        version = st.selectbox("版本", previous, key=f"rollback_{kb_path.name}")
+        if st.button("回滚", key=f"rollback_button_{kb_path.name}"):
+            try:
+                with writing(kb_path):
+                    snapshot = rollback(kb_path, version)
+                    if snapshot is None:
+                        InputManifest(kb_path).reset_indexed()
+                    else:
+                        InputManifest(kb_path).mark_indexed(snapshot)
+                    invalidate_index(kb_path)
+                st.success(f"知识库已切换到索引版本 {version}。")
+                rerun_method()  # 自动刷新页面
+            except (KBBusyError, VersionError) as e:
+                st.error(str(e))
+
+def _run_label(profile):
+    started = time.strftime("%Y-%m-%d %H:%M", time.localtime(profile["started"] or 0))
+    kind = "增量" if profile["kind"] == "update" else "全量"
+    return f"{started} · {kind} · {format_duration(profile['total_seconds'])}"
+
+
+def _change_text(change):
+    return "" if change is None else f"{change:+.0%}"
+
+
+def show_index_profiles(kb_path):
+    """按工作流展示已完成索引的性能，并对比不同运行"""
+    st.subheader("索引性能分析")
+    profiles = list_profiles(kb_path.name)
+    if not profiles:
+        st.info("暂无性能记录。索引成功完成后会自动记录。")
+        return
+    for candidate, baseline, comparison in find_regressions(profiles)[:3]:
+        slower = [row["name"] for row in comparison["workflows"] if row["regressed"]]
+        st.warning(f"修改 settings.yaml 后，{_run_label(candidate)} 的运行变慢了"
+                   f"（总计 {_change_text(comparison['total_change'])}"
+                   + (f"；变慢的工作流：{', '.join(slower)}" if slower else "") + "）。")
+
+    latest = profiles[0]
+    st.write(f"**最近一次运行：** {_run_label(latest)}"
+             + (f"，{latest['documents']} 个文档" if latest.get("documents") else ""))
+    total = latest["total_seconds"] or 1
+    st.table([{"工作流": w["name"],
+               "耗时": format_duration(w["seconds"]) if w["seconds"] is not None else "-",
+               "占比": f"{(w['seconds'] or 0) / total:.0%}",
+               "LLM 调用": w["llm_calls"], "重试": w["retries"],
+               "限流": w["rate_limits"], "等待": format_duration(w["wait_seconds"]),
+               "Token": w["input_tokens"] + w["output_tokens"],
+               "行数": "-" if w["rows"] is None else w["rows"]} for w in latest["workflows"]])
+    if latest["tables"]:
+        st.caption("表行数：" + "，".join(f"{name} {rows}"
+                                          for name, rows in latest["tables"].items()))
+
+    if len(profiles) > 1:
+        st.write("**历次运行耗时**")
+        values = [{"run": _run_label(p), "workflow": w["name"], "seconds": w["seconds"] or 0}
+                  for p in reversed(profiles[:20]) for w in p["workflows"]]
+        st.vega_lite_chart({
+            "data": {"values": values},
+            "mark": "bar",
+            "encoding": {
+                "x": {"field": "run", "type": "nominal", "sort": None, "title": None},
+                "y": {"field": "seconds", "type": "quantitative", "aggregate": "sum"},
+                "color": {"field": "workflow", "type": "nominal"},
+            },
+        }, use_container_width=True)
+
+        st.write("**对比运行**")
+        labels = {p["job_id"]: _run_label(p) for p in profiles}
+        col1, col2 = st.columns(2)
+        baseline_id = col1.selectbox("基准", list(labels), index=1,
+                                     format_func=labels.get, key=f"profile_base_{kb_path.name}")
+        candidate_id = col2.selectbox("对比", list(labels), index=0,
+                                      format_func=labels.get, key=f"profile_new_{kb_path.name}")
+        by_id = {p["job_id"]: p for p in profiles}
+        baseline, candidate = by_id[baseline_id], by_id[candidate_id]
+        comparison = compare_profiles(baseline, candidate)
+        st.table([{"工作流": row["name"],
+                   "基准": format_duration(row["before"].get("seconds") or 0),
+                   "对比": format_duration(row["after"].get("seconds") or 0),
+                   "变化": _change_text(row["change"]),
+                   "LLM 调用": f"{row['before'].get('llm_calls', 0)} → {row['after'].get('llm_calls', 0)}",
+                   "重试": f"{row['before'].get('retries', 0)} → {row['after'].get('retries', 0)}",
+                   "行数": f"{row['before'].get('rows') or '-'} → {row['after'].get('rows') or '-'}",
+                   "退化": "⚠️" if row["regressed"] else ""}
+                  for row in comparison["workflows"]])
+        st.write(f"总计：{format_duration(baseline['total_seconds'])} → "
+                 f"{format_duration(candidate['total_seconds'])}"
+                 f"（{_change_text(comparison['total_change'])}）")
+        st.caption(f"工作流变慢至少 {REGRESSION_RATIO:.0%} 且超过 {REGRESSION_MIN_SECONDS:g} 秒时标记为退化。")
+        if comparison["settings_changed"]:
+            edits = comparison["edits"]
+            st.info("两次运行之间 settings.yaml 有变化"
+                    + (f"（期间保存了 {len(edits)} 次）。" if edits else "。"))
+            st.code(settings_diff(baseline, candidate) or "（无文本差异）", language="diff")
+
+
+# 支持 fragment 时（Streamlit 1.37.0 及以上）在后台轮询任务状态，不阻塞页面
+fragment_method = getattr(st, "fragment", None)
+if fragment_method:
+    show_index_jobs = fragment_method(run_every=3)(show_index_jobs)
 
 
 # 主界面
 st.title("GraphRAG Web UI")
 
-menu = ["知识库管理", "知识库问答"]
+menu = ["知识库管理", "知识库问答", "指标", "日志"]
 choice = st.sidebar.selectbox("选择模块", menu)
+script_page = choice
 
 if choice == "知识库管理":
     st.header("知识库管理")
@@ -295,6 +1090,8 @@ if choice == "知识库管理":
         else:
             st.info("当前没有任何知识库可以删除。")
 
+    transfer_knowledge_bases(kb_list)
+
     # 添加 Refresh button next to "现有知识库列表"
     col1, col2 = st.columns([4, 1])
     with col1:
@@ -318,8 +1115,9 @@ if choice == "知识库管理":
         if selected_kb:
             kb_path = KB_DIR / selected_kb
             st.write(f"当前管理的知识库： **{selected_kb}**")
-            tab1, tab2, tab3, tab4 = st.tabs(
-                ["修改 .env", "修改 settings.yaml", "管理知识文件", "索引知识库"])
+            tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(
+                ["修改 .env", "修改 settings.yaml", "管理知识文件", "索引知识库", "缓存与存储",
+                 "索引浏览", "图谱视图", "索引性能"])
 
             with tab1:
                 edit_env(kb_path)
@@ -329,21 +1127,80 @@ if choice == "知识库管理":
 
             with tab3:
                 manage_files(kb_path)
+                st.write("---")
+                import_archives(kb_path)
+                st.write("---")
+                find_near_duplicates(kb_path)
 
             with tab4:
                 st.subheader("索引知识库")
                 st.write("点击下方按钮，使用 graphrag 对当前知识库进行索引。")
 
+                index_mode = st.radio(
+                    "索引模式", ["全量索引", "增量索引（仅处理变化的文档）"], horizontal=True)
+                incremental = index_mode != "全量索引"
+
+                if incremental:
+                    manifest = InputManifest(kb_path).refresh()
+                    delta = manifest.diff()
+                    reprocess = delta["added"] + delta["changed"]
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("新增", len(delta["added"]))
+                    col2.metric("修改", len(delta["changed"]))
+                    col3.metric("删除", len(delta["deleted"]))
+                    st.write(f"将处理 {len(reprocess)} 个文档（约 "
+                             f"{estimate_delta(manifest, reprocess)} 个文本块）。")
+                    if manifest.indexed is None:
+                        st.warning("未找到上一次索引的记录，所有文档都将视为新增。")
+                    if delta["changed"] or delta["deleted"]:
+                        st.warning("GraphRAG 的增量更新只会添加新内容，修改或删除的文档"
+                                   "在下一次全量索引之前仍会保留在索引中。")
+
+                if not incremental:
+                    show_index_estimate(kb_path)
+
                 # 添加复选框让用户选择是否清除缓存
-                clear_cache_option = st.checkbox("清除缓存")
+                clear_cache_option = st.checkbox("清除缓存", disabled=incremental)
+                keep_llm_cache = st.checkbox(
+                    "保留 LLM 响应缓存", value=True,
+                    disabled=incremental or not clear_cache_option)
+
+                indexing = get_job_manager().active_job(selected_kb) is not None
+                if st.button("索引知识库", key=f"index_{selected_kb}",
+                             disabled=indexing):
+                    if clear_cache_option and not incremental:
+                        try:
+                            with st.spinner("正在清除缓存..."):
+                                clear_cache(kb_path, keep_llm_cache=keep_llm_cache)
+                            st.success("缓存已清除！")
+                        except KBBusyError as e:
+                            st.error(str(e))
+                            st.stop()
 
-                if st.button("索引知识库", key=f"index_{selected_kb}"):
-                    if clear_cache_option:
-                        with st.spinner("正在清除缓存..."):
-                            clear_cache(kb_path)
-                        st.success("缓存已清除！")
+                    index_knowledge_base(selected_kb, incremental=incremental)
+                    rerun_method()  # 刷新页面以显示新任务
 
-                    index_knowledge_base(selected_kb)
+                st.write("---")
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.subheader("索引进度")
+                with col2:
+                    if not fragment_method and st.button("刷新状态"):
+                        rerun_method()  # 手动轮询任务状态
+                show_index_jobs(selected_kb)
+                show_index_versions(kb_path)
+
+            with tab5:
+                manage_storage(kb_path)
+
+            with tab6:
+                explore_index(kb_path)
+
+            with tab7:
+                graph_view(kb_path)
+
+            with tab8:
+                show_index_profiles(kb_path)
     else:
         st.info("当前没有任何知识库可以管理。")
 
@@ -356,21 +1213,61 @@ elif choice == "知识库问答":
         selected_kb = st.selectbox("选择一个知识库进行提问", kb_list, key="qa_select")
         if selected_kb:
             kb_path = KB_DIR / selected_kb
-            query = st.text_input("输入你的问题")
-            method = st.selectbox("选择查询方法", ["local", "global", "drift"])
-            if st.button("提交问题"):
-                if query:
-                    with st.spinner("正在处理你的问题，请稍候..."):
-                        # 执行查询
-                        args = ["query", "--root",
-                                str(kb_path), "--method", method, "--query", query]
-                        output = run_graphrag_command(args, cwd=ROOT_DIR)
-                        # 解析响应
-                        response = parse_graphrag_response(output, method)
-                    print(f"查询输出 for {selected_kb}: {output}")
-                    if response:
-                        st.markdown(response)
+            warm_query_worker(kb_path)  # Loads in the background while the question is typed
+            single_tab, batch_tab, federated_tab = st.tabs(
+                ["单个问题", "批量问题", "多个知识库"])
+            with single_tab:
+                query = st.text_input("输入你的问题")
+                method = st.selectbox("选择查询方法", ["local", "global", "drift"])
+                if st.button("提交问题"):
+                    if query:
+                        answer_area = st.empty()
+                        try:
+                            with st.spinner("正在处理你的问题，请稍候..."):
+                                # 执行查询（依次尝试缓存答案、常驻查询进程和命令行），生成过程中即显示答案
+                                response, output = answer_query(
+                                    kb_path, method, query, cwd=ROOT_DIR,
+                                    on_partial=partial_renderer(answer_area))
+                        except (KBBusyError, TimeoutError) as e:
+                            st.warning(f"{e}，请稍后重试。")
+                            st.stop()
+                        if output:
+                            print(f"查询输出 for {selected_kb}: {output}")
+                        if response:
+                            answer_area.markdown(response)
+                        else:
+                            answer_area.empty()
+                            st.error("未找到有效的响应，可能知识库未初始化或出现其他错误。")
                     else:
-                        st.error("未找到有效的响应，可能知识库未初始化或出现其他错误。")
-                else:
-                    st.error("请输入你的问题！")
+                        st.error("请输入你的问题！")
+            with batch_tab:
+                batch_query_page(kb_path)
+            with federated_tab:
+                federated_query_page(kb_list, selected_kb)
+
+            # 查询缓存统计
+            with st.expander("查询缓存"):
+                stats = get_query_cache().stats()
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("命中", stats["hits"])
+                col2.metric("未命中", stats["misses"])
+                col3.metric("命中率", f"{stats['hit_rate']:.0%}")
+                col4.metric("缓存答案数", stats["entries"])
+                st.caption(f"缓存大小: {stats['bytes'] / 1024:.1f} KB，"
+                           f"淘汰次数: {stats['evictions']}")
+                running, waiting = get_single_flight().in_flight()
+                st.caption(f"正在执行的查询: {running}，"
+                           f"等待其结果的相同查询: {waiting}")
+                if st.button("清空查询缓存"):
+                    get_query_cache().clear()
+                    rerun_method()  # 自动刷新页面
+
+elif choice == "指标":
+    st.header("指标")
+    metrics_page()
+
+elif choice == "日志":
+    st.header("日志")
+    logs_page()
+
+record_script_run("complete")
@@ -1,12 +1,48 @@
 import streamlit as st
-import os
-import subprocess
-import shutil
+import io
 from pathlib import Path
 from dotenv import load_dotenv
 import yaml
 import pkg_resources
 import logging
+import time
+import re
+from kb_core import (answer_query, invalidate_index, list_knowledge_bases,
+                     index_knowledge_base, delete_input_files, KnowledgeBaseError,
+                     create_knowledge_base as create_kb, delete_knowledge_base as delete_kb,
+                     clear_cache as clear_kb_cache, warm_query_worker)
+from index_versions import (list_versions, rollback, VersionError,
+                            KEEP_VERSIONS as KEEP_INDEX_VERSIONS,
+                            delete_all as delete_index_versions)
+from kb_locks import writing, get_single_flight, KBBusyError
+from index_jobs import get_job_manager
+from job_spool import JobSpool
+from input_manifest import InputManifest, estimate_delta, EXCLUDED_DIR
+from index_estimate import estimate_index, estimate_cost, format_duration
+from near_duplicates import (find_duplicates, exclude_duplicates, restore_excluded,
+                             list_excluded, DedupeError, THRESHOLD as DEDUPE_THRESHOLD)
+from index_profile import (list_profiles, compare_profiles, find_regressions, settings_diff,
+                           record_settings_edit, REGRESSION_RATIO,
+                           REGRESSION_MIN_SECONDS)
+from cache_admin import (storage_usage, llm_cache_breakdown, clear_dir,
+                         prune_llm_cache, dedupe_llm_cache, format_bytes)
+from query_cache import get_query_cache
+from batch_query import (load_questions, run_batch, summarize, to_csv, to_jsonl,
+                         BatchFormatError, MAX_PARALLELISM)
+from archive_ingest import ingest_archive, ArchiveError, ARCHIVE_TYPES
+from kb_transfer import (export_to_file, import_knowledge_base, list_exports, archive_name,
+                         TransferError, EXPORT_DIR, MAX_DOWNLOAD_BYTES)
+from uploads import save_uploads, DUPLICATE_LINK, DUPLICATE_REJECT
+from metrics import get_metrics
+from kb_artifacts import list_artifacts
+from index_explorer import describe, default_columns, read_page, FILTER_OPS
+from graph_view import get_graph, vega_lite_spec, GraphError, MAX_NODES as GRAPH_MAX_NODES
+from federated_query import (query_knowledge_bases, merge_answers,
+                             DEFAULT_TIMEOUT as FEDERATED_TIMEOUT)
+from run_logs import (list_run_logs, log_files, search as search_log,
+                      tail as tail_log_file, total_size as total_log_size)
+from fs_cache import (list_files, read_text, filter_names, paginate,
+                      file_sizes)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -26,6 +62,21 @@ except AttributeError:
     rerun_method = st.experimental_rerun
     st.warning("Your Streamlit version is outdated. Please upgrade to version 1.27.0 or later to support the refresh feature.")
 
+# Time every script run; runs cut short by a rerun are recorded as such
+script_started = time.perf_counter()
+script_page = None
+_rerun = rerun_method
+
+
+def record_script_run(outcome):
+    get_metrics().observe("script_run", time.perf_counter() - script_started,
+                          {"page": script_page or "", "outcome": outcome})
+
+
+def rerun_method():
+    record_script_run("rerun")
+    _rerun()
+
 # Configure the page
 st.set_page_config(page_title="GraphRAG Web UI", layout="wide")
 
@@ -39,29 +90,20 @@ KB_DIR.mkdir(exist_ok=True)
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 
-def list_knowledge_bases():
-    """List all knowledge bases"""
-    return [d.name for d in KB_DIR.iterdir() if d.is_dir()]
-
-
 def create_knowledge_base(name):
     """Create and initialize a new knowledge base"""
-    kb_path = KB_DIR / name
-    input_path = kb_path / "input"
-    kb_path.mkdir(parents=True, exist_ok=True)
-    input_path.mkdir(parents=True, exist_ok=True)
-
     # Execute initialization command with a loading spinner
     with st.spinner("Initializing knowledge base..."):
-        output = run_graphrag_command(
-            ["init", "--root", str(kb_path)], cwd=ROOT_DIR)
+        try:
+            success, output = create_kb(name)
+        except KnowledgeBaseError as e:
+            return (False, str(e))
 
     # Output initialization result to the console
     print(f"Initialization output for {name}: {output}")
 
     # Check if initialization was successful
-    expected_message = f"Initializing project at {kb_path}"
-    if expected_message in output:
+    if success:
         return (True, "Knowledge base successfully created and initialized!")
     else:
         return (False, "Initialization failed. Please check if GraphRAG is installed and configured correctly.")
@@ -69,46 +111,110 @@ def create_knowledge_base(name):
 
 def delete_knowledge_base(name):
     """Delete a specified knowledge base"""
-    kb_path = KB_DIR / name
-    if kb_path.exists() and kb_path.is_dir():
-        shutil.rmtree(kb_path)
-        return (True, f"Knowledge base '{name}' has been deleted!")
-    else:
+    try:
+        # Waits for running queries and indexing to finish first
+        delete_kb(name)
+    except KnowledgeBaseError:
         return (False, f"Knowledge base '{name}' does not exist!")
+    except KBBusyError as e:
+        return (False, str(e))
+    return (True, f"Knowledge base '{name}' has been deleted!")
 
 
-def clear_cache(kb_path):
-    """Clear cache files and folders in the specified knowledge base, retaining input, prompts, .env, and settings.yaml"""
-    exclusions = {"input", "prompts", ".env", "settings.yaml"}
-    for item in kb_path.iterdir():
-        if item.name in exclusions:
-            logger.info(f"Retained file or folder: {item}")
-            continue
-        try:
-            if item.is_dir():
-                shutil.rmtree(item)
-                logger.info(f"Deleted directory: {item}")
+def clear_cache(kb_path, keep_llm_cache=False):
+    """Clear cache files and folders in the specified knowledge base, retaining input, prompts, .env, settings.yaml, the input manifest and the versioned index"""
+    for item, error in clear_kb_cache(kb_path, keep_llm_cache):  # Raises KBBusyError while in use
+        st.error(f"Error deleting {item}: {error}")
+
+
+def transfer_knowledge_bases(kb_list):
+    """Export knowledge bases as .tar.zst archives and import them on another node"""
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Export Knowledge Base")
+        export_kb = st.selectbox("Select a Knowledge Base to Export", [""] + kb_list,
+                                 index=0, key="export_select")
+        include_cache = st.checkbox("Include the LLM cache", key="export_cache")
+        include_env = st.checkbox("Include .env (contains the API key)", key="export_env")
+        if st.button("Export Knowledge Base"):
+            if not export_kb:
+                st.error("Please select a knowledge base to export!")
             else:
-                item.unlink()
-                logger.info(f"Deleted file: {item}")
-        except Exception as e:
-            logger.error(f"Error deleting {item}: {e}")
-            st.error(f"Error deleting {item}: {e}")
+                progress_text = st.empty()
+
+                def report(files, written):
+                    progress_text.text(f"Exported {files} files, {format_bytes(written)}...")
+
+                path = EXPORT_DIR / archive_name(export_kb)
+                try:
+                    manifest = export_to_file(KB_DIR / export_kb, path, include_cache=include_cache,
+                                              include_env=include_env, progress=report)
+                except (OSError, TransferError, KBBusyError) as e:
+                    st.error(f"Error exporting knowledge base: {e}")
+                else:
+                    progress_text.empty()
+                    st.success(f"Exported {len(manifest['files'])} files to {path} "
+                               f"({format_bytes(path.stat().st_size)})")
+        exports = list_exports()
+        if exports:
+            export = st.selectbox(
+                "Exported archives", exports, key="export_file",
+                format_func=lambda e: f"{e['name']} ({format_bytes(e['bytes'])})")
+            if export["bytes"] <= MAX_DOWNLOAD_BYTES:
+                with open(export["path"], "rb") as f:
+                    st.download_button("Download Archive", f, export["name"], "application/zstd")
+            else:
+                kb_name = export["name"].rsplit("-", 2)[0]
+                st.info(f"Too large to download through the browser. Copy {export['path']} "
+                        f"from the server or stream a fresh export from the HTTP API: "
+                        f"`curl -o {export['name']} http://<host>:8600/kbs/{kb_name}/export`")
+            if st.button("Delete Archive"):
+                Path(export["path"]).unlink(missing_ok=True)
+                rerun_method()
+    with col2:
+        st.subheader("Import Knowledge Base")
+        archive = st.file_uploader("Upload an exported archive (.tar.zst)", type=["zst", "tzst"],
+                                   key="kb_archive_upload")
+        server_path = st.text_input("Or enter the path of an exported archive on the server")
+        import_name = st.text_input("Name of the imported knowledge base")
+        if st.button("Import Knowledge Base"):
+            if not archive and not server_path:
+                st.error("Please upload an archive or enter a server path!")
+            elif not import_name:
+                st.error("Please enter a knowledge base name!")
+            else:
+                progress_text = st.empty()
+
+                def report(files, written):
+                    progress_text.text(f"Extracted and verified {files} files, "
+                                       f"{format_bytes(written)}...")
+
+                try:
+                    if archive:
+                        manifest = import_knowledge_base(archive, import_name, progress=report)
+                    else:
+                        with open(server_path, "rb") as f:
+                            manifest = import_knowledge_base(f, import_name, progress=report)
+                except (OSError, TransferError, KnowledgeBaseError) as e:
+                    st.error(f"Error importing knowledge base: {e}")
+                else:
+                    progress_text.empty()
+                    st.success(f"Imported '{manifest.get('kb')}' as '{import_name}' "
+                               f"({len(manifest['files'])} files, all checksums verified)")
+                    if not manifest.get("include_env"):
+                        st.warning("The archive has no .env; add the API key in the "
+                                   "knowledge base's .env settings before indexing or querying.")
 
 
 def edit_env(kb_path):
     """Edit the .env file"""
     env_path = kb_path / ".env"
-    load_dotenv(dotenv_path=env_path)
-    if env_path.exists():
-        try:
-            with open(env_path, "r", encoding="utf-8") as f:
-                env_content = f.read()
-        except Exception as e:
-            st.error(f"Error reading .env file: {e}")
-            env_content = ""
-    else:
+    try:
+        env_content = read_text(env_path)  # Cached until the file changes
+    except Exception as e:
+        st.error(f"Error reading .env file: {e}")
         env_content = ""
+    load_dotenv(stream=io.StringIO(env_content))
     st.subheader(".env File Editor")
     new_env = st.text_area("Edit .env file content", env_content, height=200)
     if st.button("Save .env file"):
@@ -124,14 +230,10 @@ def edit_env(kb_path):
 def edit_settings(kb_path):
     """Edit the settings.yaml file"""
     settings_path = kb_path / "settings.yaml"
-    if settings_path.exists():
-        try:
-            with open(settings_path, "r", encoding="utf-8") as f:
-                settings_content = f.read()
-        except Exception as e:
-            st.error(f"Error reading settings.yaml file: {e}")
-            settings_content = ""
-    else:
+    try:
+        settings_content = read_text(settings_path)  # Cached until the file changes
+    except Exception as e:
+        st.error(f"Error reading settings.yaml file: {e}")
         settings_content = ""
     st.subheader("settings.yaml File Editor")
     new_settings = st.text_area(
@@ -140,54 +242,98 @@ def edit_settings(kb_path):
         try:
             with open(settings_path, "w", encoding="utf-8") as f:
                 f.write(new_settings)
+            record_settings_edit(kb_path.name, new_settings)  # Lets the profiler attribute regressions
             st.success("settings.yaml file saved!")
             rerun_method()  # Automatically refresh the page
         except Exception as e:
             st.error(f"Error saving settings.yaml file: {e}")
 
 
+FILE_PAGE_SIZES = [25, 50, 100]
+
+
 def manage_files(kb_path):
     """Manage .txt files in the knowledge base"""
     input_path = kb_path / "input"
     st.subheader("Manage Knowledge Files (TXT files in input folder)")
-    # List existing files
-    files = [f.name for f in input_path.glob("*.txt")]
-    st.write("Existing files:")
+    # List existing files, one searchable page at a time
+    files = list_files(input_path, "*.txt")
+    st.write(f"Existing files ({len(files)}):")
     if files:
-        for file in files:
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            search = st.text_input("Search files", key=f"file_search_{kb_path.name}")
+        with col2:
+            page_size = st.selectbox("Files per page", FILE_PAGE_SIZES,
+                                     key=f"file_page_size_{kb_path.name}")
+        matches = filter_names(files, search)
+        with col3:
+            page = st.number_input("Page", min_value=1, key=f"file_page_{kb_path.name}")
+        page_files, page, pages = paginate(matches, page, page_size)
+        st.caption(f"{len(matches)} matching files, page {page} of {pages}")
+        sizes = file_sizes(input_path, page_files)
+        # Bumped after each deletion so the selection checkboxes start unticked
+        generation = st.session_state.get(f"file_selection_{kb_path.name}", 0)
+        selected = []
+        for file in page_files:
             col1, col2 = st.columns([4, 1])
             with col1:
-                st.text(file)
+                if st.checkbox(file, key=f"sel_{kb_path.name}_{generation}_{file}"):
+                    selected.append(file)
             with col2:
-                if st.button(f"Delete {file}", key=f"del_{file}"):
-                    try:
-                        os.remove(input_path / file)
-                        st.success(f"File '{file}' deleted!")
-                        print(f"File '{file}' deleted!")
-                        rerun_method()  # Automatically refresh the page
-                    except Exception as e:
-                        st.error(f"Error deleting file '{file}': {e}")
+                st.text(format_bytes(sizes.get(file, 0)))
+        select_all = st.checkbox(f"Select all {len(matches)} matching files",
+                                 key=f"sel_all_{kb_path.name}_{generation}")
+        targets = matches if select_all else selected
+        if st.button(f"Delete {len(targets)} selected files", disabled=not targets):
+            deleted, errors = delete_input_files(kb_path, targets)
+            for name, error in errors:
+                st.error(f"Error deleting file '{name}': {error}")
+            st.session_state[f"file_selection_{kb_path.name}"] = generation + 1
+            print(f"Deleted {len(deleted)} files from '{kb_path.name}'")
+            if len(deleted) == len(targets):
+                rerun_method()  # Automatically refresh the page
     else:
         st.info("No uploaded TXT files.")
     st.write("---")
+    # Show the result of the previous upload batch
+    upload_summary = st.session_state.pop('upload_summary', None)
+    if upload_summary:
+        st.success(upload_summary)
     # Upload files
     uploaded_files = st.file_uploader(
         "Upload new TXT files", type=["txt"], accept_multiple_files=True)
+    duplicate_policy = st.radio(
+        "Documents whose content already exists", ["Reject", "Keep as hard link"],
+        horizontal=True)
 
     # Initialize session state flag
     if 'files_uploaded' not in st.session_state:
         st.session_state['files_uploaded'] = False
 
     if uploaded_files and not st.session_state['files_uploaded']:
-        for uploaded_file in uploaded_files:
-            save_path = input_path / uploaded_file.name
-            try:
-                with open(save_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                print(f"File '{uploaded_file.name}' uploaded successfully!")
-            except Exception as e:
-                st.error(f"Error uploading file '{uploaded_file.name}': {e}")
-        st.success(f"Uploaded {len(uploaded_files)} files.")
+        # Write files in chunks on a small thread pool and skip duplicate content
+        progress_bar = st.progress(0.0, text="Uploading files...")
+        with get_metrics().timer("file_io", op="upload", kb=kb_path.name) as timing:
+            results = save_uploads(
+                kb_path, uploaded_files,
+                on_duplicate=DUPLICATE_LINK if duplicate_policy == "Keep as hard link" else DUPLICATE_REJECT,
+                progress=lambda done, total: progress_bar.progress(done / total))
+            timing["files"] = len(results)
+            timing["bytes"] = sum(result["size"] for result in results)
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            if result["status"] == "error":
+                st.error(f"Error uploading file '{result['name']}': {result['error']}")
+            elif result["status"] == "duplicate":
+                print(f"File '{result['name']}' skipped, same content as '{result['duplicate_of']}'")
+            else:
+                print(f"File '{result['name']}' uploaded successfully!")
+        st.session_state['upload_summary'] = (
+            f"Uploaded {counts.get('saved', 0)} files. "
+            f"{counts.get('duplicate', 0)} duplicates rejected, "
+            f"{counts.get('linked', 0)} linked, {counts.get('unchanged', 0)} unchanged.")
         # Set flag to indicate files have been uploaded
         st.session_state['files_uploaded'] = True
         rerun_method()  # Automatically refresh the page
@@ -197,68 +343,732 @@ def manage_files(kb_path):
         st.session_state['files_uploaded'] = False
 
 
-def run_graphrag_command(args, cwd):
-    """Call GraphRAG commands via subprocess and output results to the console"""
+def import_archives(kb_path):
+    """Bulk import knowledge files from zip/tar archives"""
+    st.subheader("Import from Archive")
+    st.write("Text files (.txt, .md) in .zip, .tar.gz or .tar.zst archives are extracted "
+             "straight into the input folder and converted to UTF-8.")
+    archive = st.file_uploader("Upload an archive", type=ARCHIVE_TYPES, key="archive_upload")
+    server_path = st.text_input(
+        "Or enter the path of an archive on the server (for very large corpora)")
+    duplicate_policy = st.radio(
+        "Documents whose content already exists", ["Reject", "Keep as hard link"],
+        horizontal=True, key="archive_duplicates")
+    if st.button("Import Archive"):
+        if not archive and not server_path:
+            st.error("Please upload an archive or enter a server path!")
+            return
+        progress_text = st.empty()
+
+        def report(members, written):
+            progress_text.text(f"Processed {members} archive members, "
+                               f"wrote {format_bytes(written)}...")
+
+        on_duplicate = DUPLICATE_LINK if duplicate_policy == "Keep as hard link" else DUPLICATE_REJECT
+        try:
+            if archive:
+                summary = ingest_archive(kb_path, archive, archive.name,
+                                         on_duplicate=on_duplicate, progress=report)
+            else:
+                with open(server_path, "rb") as f:
+                    summary = ingest_archive(kb_path, f, Path(server_path).name,
+                                             on_duplicate=on_duplicate, progress=report)
+        except (OSError, ArchiveError) as e:
+            st.error(f"Error importing archive: {e}")
+            return
+        st.success(f"Imported {summary['saved']} files ({format_bytes(summary['bytes'])}). "
+                   f"{summary['duplicate']} duplicates rejected, {summary['linked']} linked, "
+                   f"{summary['unchanged']} unchanged, {summary['skipped']} unsupported files skipped, "
+                   f"{summary['reencoded']} converted to UTF-8.")
+        if summary["error"]:
+            st.warning(f"{summary['error']} files could not be extracted, see the server log.")
+
+
+def find_near_duplicates(kb_path):
+    """Find near-duplicate documents and keep them out of indexing"""
+    st.subheader("Near-Duplicate Documents")
+    st.write("Documents that mostly repeat another one, such as revisions or copies, cost LLM "
+             "calls without adding much to the graph. Excluded documents are moved to the "
+             f"{EXCLUDED_DIR} folder, which GraphRAG does not read, and can be restored.")
+    threshold = st.slider("Similarity threshold", min_value=0.5, max_value=1.0,
+                          value=min(max(DEDUPE_THRESHOLD, 0.5), 1.0), step=0.05, key=f"dedupe_threshold_{kb_path.name}")
+    state_key = f"near_duplicates_{kb_path.name}"
+    if st.button("Find Near-Duplicates", key=f"find_duplicates_{kb_path.name}"):
+        bar = st.progress(0.0, text="Hashing input documents...")
+        labels = {"signatures": "Hashed", "tokens": "Tokenized"}
+        try:
+            st.session_state[state_key] = find_duplicates(
+                kb_path, threshold, progress=lambda stage, done, total: bar.progress(
+                    done / total, text=f"{labels[stage]} {done} of {total} documents"))
+        except DedupeError as e:
+            st.error(str(e))
+        bar.empty()
+    result = st.session_state.get(state_key)
+    if result:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Documents", f"{result['documents']:,}")
+        col2.metric("Clusters", f"{len(result['clusters']):,}")
+        col3.metric("Duplicates", f"{result['duplicate_documents']:,}")
+        col4.metric("LLM Calls Saved", f"{result['saved_llm_calls']:,}")
+        st.caption(
+            f"Excluding the duplicates saves about {result['saved_llm_prompt_tokens']:,} prompt and "
+            f"{result['saved_embedding_tokens']:,} embedding tokens "
+            f"({result['duplicate_tokens']:,} document tokens). "
+            f"{result['read_files']} documents hashed, {result['cached_files']} from cache, "
+            f"{result['empty_documents']} without text skipped.")
+        if not result["exact_tokens"]:
+            st.warning("tiktoken or its encoding is not available, so token counts are "
+                       "approximated from file sizes.")
+        duplicates = {entry["name"]: {"duplicate_of": cluster["keep"],
+                                      "similarity": entry["similarity"]}
+                      for cluster in result["clusters"] for entry in cluster["duplicates"]}
+        if not duplicates:
+            st.info(f"No documents are at least {result['threshold']:.0%} similar.")
+        else:
+            st.dataframe([{"Keep": cluster["keep"], "Duplicate": entry["name"],
+                           "Similarity": f"{entry['similarity']:.0%}", "Tokens": entry["tokens"]}
+                          for cluster in result["clusters"] for entry in cluster["duplicates"]],
+                         use_container_width=True)
+            chosen = st.multiselect("Duplicates to exclude", list(duplicates),
+                                    default=list(duplicates), key=f"exclude_{kb_path.name}")
+            if st.button(f"Exclude {len(chosen)} documents", disabled=not chosen,
+                         key=f"exclude_button_{kb_path.name}"):
+                try:
+                    excluded, errors = exclude_duplicates(
+                        kb_path, {name: duplicates[name] for name in chosen})
+                except KBBusyError as e:
+                    st.error(str(e))
+                    st.stop()
+                for name, error in errors:
+                    st.error(f"Error excluding file '{name}': {error}")
+                st.session_state.pop(state_key, None)
+                print(f"Excluded {len(excluded)} near-duplicate files from '{kb_path.name}'")
+                if not errors:
+                    rerun_method()
+
+    excluded = list_excluded(kb_path)
+    if excluded:
+        with st.expander(f"Excluded Documents ({len(excluded)})"):
+            st.dataframe([{"Document": name, "Duplicate of": entry.get("duplicate_of"),
+                           "Similarity": (f"{entry['similarity']:.0%}"
+                                          if entry.get("similarity") is not None else ""),
+                           "Excluded": time.strftime("%Y-%m-%d %H:%M",
+                                                     time.localtime(entry["excluded_at"]))}
+                          for name, entry in excluded.items()], use_container_width=True)
+            chosen = st.multiselect("Documents to restore", list(excluded),
+                                    key=f"restore_{kb_path.name}")
+            if st.button(f"Restore {len(chosen)} documents", disabled=not chosen,
+                         key=f"restore_button_{kb_path.name}"):
+                try:
+                    restored, errors = restore_excluded(kb_path, chosen)
+                except KBBusyError as e:
+                    st.error(str(e))
+                    st.stop()
+                for name, error in errors:
+                    st.error(f"Error restoring file '{name}': {error}")
+                if not errors:
+                    rerun_method()
+
+
+def manage_storage(kb_path):
+    """Show disk usage of generated folders and clean them up selectively"""
+    st.subheader("Cache and Storage")
+    usage = storage_usage(kb_path)
+    labels = {"cache": "LLM Cache", "output": "Output", "logs": "Logs"}
+    cols = st.columns(len(usage))
+    for col, (name, (size, files)) in zip(cols, usage.items()):
+        col.metric(labels[name], format_bytes(size), f"{files} files", delta_color="off")
+
+    breakdown = llm_cache_breakdown(kb_path)
+    if breakdown:
+        with st.expander("LLM Cache by Workflow"):
+            st.table([{"Workflow": name, "Size": format_bytes(size), "Files": files}
+                      for name, (size, files) in breakdown.items()])
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Clear Output", key="clear_output",
+                     help="Deletes the current index and all kept versions"):
+            try:
+                with writing(kb_path):
+                    delete_index_versions(kb_path)
+                    InputManifest(kb_path).reset_indexed()
+                    invalidate_index(kb_path)
+                st.success("Output cleared!")
+                rerun_method()  # Automatically refresh the page
+            except KBBusyError as e:
+                st.error(str(e))
+    with col2:
+        if st.button("Clear Logs", key="clear_logs"):
+            try:
+                clear_dir(kb_path, "logs")
+                st.success("Logs cleared!")
+                rerun_method()  # Automatically refresh the page
+            except KBBusyError as e:
+                st.error(str(e))
+
+    st.write("---")
+    st.write("Prune the LLM cache, least recently used entries first, "
+             "or merge identical entries to keep disk use bounded.")
+    budget_mb = st.number_input("LLM cache budget (MB)", min_value=0, value=1024, step=128)
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Prune LLM Cache"):
+            try:
+                with st.spinner("Pruning LLM cache..."):
+                    removed, freed = prune_llm_cache(kb_path, budget_mb * 1024 * 1024)
+                st.success(f"Removed {removed} cache entries, freed {format_bytes(freed)}.")
+            except KBBusyError as e:
+                st.error(str(e))
+    with col2:
+        if st.button("Deduplicate LLM Cache"):
+            try:
+                with st.spinner("Deduplicating LLM cache..."):
+                    linked, saved = dedupe_llm_cache(kb_path)
+                st.success(f"Linked {linked} identical entries, saved {format_bytes(saved)}.")
+            except KBBusyError as e:
+                st.error(str(e))
+
+
+def batch_query_page(kb_path):
+    """Run a CSV/JSONL set of questions against the knowledge base"""
+    st.write("Upload a CSV file with a `question` column or a JSONL file with "
+             "`question` fields. An optional `method` column overrides the default method.")
+    questions_file = st.file_uploader("Question set", type=["csv", "jsonl"])
+    col1, col2 = st.columns(2)
+    with col1:
+        default_method = st.selectbox("Default Query Method", ["local", "global", "drift"],
+                                      key="batch_method")
+    with col2:
+        parallelism = st.slider("Parallel queries", 1, MAX_PARALLELISM, 4)
+    if st.button("Run Batch"):
+        if not questions_file:
+            st.error("Please upload a question set!")
+            return
+        try:
+            questions = load_questions(questions_file, questions_file.name, default_method)
+        except BatchFormatError as e:
+            st.error(f"Error reading question set: {e}")
+            return
+        if not questions:
+            st.error("The question set contains no questions!")
+            return
+        progress_bar = st.progress(0.0, text="Running questions...")
+        table = st.empty()
+        results = []
+        for result in run_batch(kb_path, questions, cwd=ROOT_DIR, parallelism=parallelism):
+            results.append(result)
+            progress_bar.progress(len(results) / len(questions),
+                                  text=f"{len(results)} / {len(questions)} questions answered")
+            table.dataframe([{"#": r["index"], "Question": r["question"], "Method": r["method"],
+                              "Status": r["status"], "Latency (s)": r["latency_seconds"]}
+                             for r in sorted(results, key=lambda r: r["index"])],
+                            use_container_width=True)
+        st.session_state[f"batch_results_{kb_path.name}"] = results
+
+    results = st.session_state.get(f"batch_results_{kb_path.name}")
+    if results:
+        summary = summarize(results)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Questions", summary["count"])
+        col2.metric("Answered", summary["statuses"].get("ok", 0))
+        col3.metric("p50 Latency (s)", summary["p50"])
+        col4.metric("p95 Latency (s)", summary["p95"])
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Export CSV", to_csv(results), "batch_results.csv", "text/csv")
+        with col2:
+            st.download_button("Export JSONL", to_jsonl(results), "batch_results.jsonl",
+                               "application/jsonl")
+
+
+def explore_index(kb_path):
+    """Browse the index artifacts page by page without loading whole tables"""
+    st.subheader("Index Explorer")
+    artifacts = list_artifacts(kb_path)
+    if not artifacts:
+        st.info("This knowledge base has no index artifacts yet. Index it first.")
+        return
+    key = f"explorer_{kb_path.name}"
+    name = st.selectbox("Artifact", list(artifacts), key=f"{key}_artifact")
+    path = artifacts[name]
+    info = describe(path)
+    column_names = [column for column, _type in info["columns"]]
+    st.caption(f"{info['rows']} rows in {info['row_groups']} row groups, "
+               f"{format_bytes(path.stat().st_size)}")
+    columns = st.multiselect("Columns", column_names, default=default_columns(path),
+                             key=f"{key}_{name}_columns")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        search = st.text_input("Search text columns", key=f"{key}_{name}_search")
+    with col2:
+        sort_column = st.selectbox("Sort by", [""] + column_names, key=f"{key}_{name}_sort")
+    with col3:
+        descending = st.checkbox("Descending", key=f"{key}_{name}_desc")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        filter_column = st.selectbox("Filter column", [""] + column_names,
+                                     key=f"{key}_{name}_filter")
+    with col2:
+        filter_op = st.selectbox("Operator", FILTER_OPS, key=f"{key}_{name}_op")
+    with col3:
+        filter_value = st.text_input("Value", key=f"{key}_{name}_value")
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], key=f"{key}_page_size")
+    with col2:
+        page = st.number_input("Page", min_value=1, key=f"{key}_{name}_page")
     try:
-        result = subprocess.run(
-            ["python", "-m", "graphrag"] + args,
-            cwd=cwd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,  # Redirect stderr to stdout
-            text=True,
-            check=True
-        )
-        print(f"Command Output: {result.stdout}")
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Command Error: {e.output}")
-        return f"Error: {e.output}"
-
-
-def parse_graphrag_response(output, method):
-    """Parse the response from GraphRAG commands"""
-    markers = {
-        "local": "SUCCESS: Local Search Response:",
-        "global": "SUCCESS: Global Search Response:",
-        "drift": "SUCCESS: DRIFT Search Response:"
-    }
-    marker = markers.get(method.lower())
-    if not marker:
-        return None
-    start = output.find(marker)
-    if start == -1:
-        return None
-    return output[start + len(marker):].strip()
-
-
-def index_knowledge_base(name):
-    """Index the specified knowledge base"""
-    kb_path = KB_DIR / name
-
-    # Execute indexing command with a loading spinner
-    with st.spinner("Indexing knowledge base..."):
-        output = run_graphrag_command(
-            ["index", "--root", str(kb_path)], cwd=ROOT_DIR)
-
-    # Output indexing result to the console
-    print(f"Indexing output for {name}: {output}")
-
-    # Check if indexing was successful
-    expected_message = "All workflows completed successfully."
-    if expected_message in output:
+        with st.spinner("Reading artifact..."):
+            table, matches = read_page(
+                path, columns or None, page, page_size, search=search.strip(),
+                filter_column=filter_column if filter_value else None,
+                filter_op=filter_op, filter_value=filter_value,
+                sort_column=sort_column or None, descending=descending)
+    except (ValueError, KeyError, OSError) as e:
+        st.error(f"Error reading {name}: {e}")
+        return
+    pages = max(1, -(-matches // page_size))
+    st.caption(f"{matches} matching rows, page {min(page, pages)} of {pages}")
+    st.dataframe(table, use_container_width=True)
+
+
+def graph_view(kb_path):
+    """Level-of-detail view of the entity graph, downsampled on the server"""
+    st.subheader("Knowledge Graph")
+    try:
+        with st.spinner("Loading graph and computing layout..."):
+            graph = get_graph(kb_path)
+    except (GraphError, ValueError, KeyError, OSError) as e:
+        st.info(f"No graph to show: {e}")
+        return
+    key = f"graph_{kb_path.name}"
+    col1, col2 = st.columns(2)
+    with col1:
+        view = st.radio("Start from", ["Top entities by degree", "Communities"],
+                        horizontal=True, key=f"{key}_view")
+    with col2:
+        count = st.slider("Nodes", 20, GRAPH_MAX_NODES, 100, step=10, key=f"{key}_count")
+    if view == "Communities":
+        summary = graph.community_summary(count)
+        if summary is None:
+            st.info("The index has no community assignments; showing top entities instead.")
+            view = "Top entities by degree"
+        else:
+            options = {node["name"]: node["id"] for node in summary["nodes"]}
+            opened = st.selectbox("Open community", [""] + list(options), key=f"{key}_community")
+            if not opened:
+                st.caption(f"Showing {len(summary['nodes'])} of {summary['total_nodes']} communities")
+                st.vega_lite_chart(vega_lite_spec(summary), use_container_width=True)
+                return
+            base = graph.members(options[opened], count)
+    if view == "Top entities by degree":
+        base = [node["id"] for node in graph.top_nodes(count)["nodes"]]
+    payload = graph.neighborhood([], base=base)
+    expand = st.multiselect("Expand neighborhoods of", [node["name"] for node in payload["nodes"]],
+                            key=f"{key}_expand")
+    if expand:
+        payload = graph.neighborhood(expand, base=base)
+    st.caption(f"Showing {len(payload['nodes'])} of {payload['total_nodes']} entities and "
+               f"{len(payload['edges'])} of {payload['total_edges']} relationships")
+    st.vega_lite_chart(vega_lite_spec(payload), use_container_width=True)
+
+
+STREAM_RENDER_SECONDS = 0.1
+
+
+def partial_renderer(area):
+    """Render a streamed answer into a placeholder, at most every STREAM_RENDER_SECONDS"""
+    last_render = [0.0]
+
+    def render(text):
+        now = time.perf_counter()
+        if not text or now - last_render[0] >= STREAM_RENDER_SECONDS:
+            area.markdown(text + " ▌" if text else "")
+            last_render[0] = now
+
+    return render
+
+
+METRIC_GROUPS = [
+    ("GraphRAG Commands", "command", ["subcommand", "exit_code"]),
+    ("Queries", "query", ["method", "source"]),
+    ("Time to First Token", "query_first_token", ["method", "source"]),
+    ("Indexing Jobs", "index_job", ["kind", "status"]),
+    ("Indexing Workflows", "workflow", ["workflow"]),
+    ("File Operations", "file_io", ["op", "status"]),
+    ("Page Runs", "script_run", ["page", "outcome"]),
+]
+LOG_CHOICES = 200
+METRIC_WINDOWS = {"Last 5 minutes": 300, "Last hour": 3600, "All retained observations": None}
+
+
+def metrics_page():
+    """Rolling latency percentiles of commands, queries, indexing and file I/O"""
+    metrics = get_metrics()
+    window = st.radio("Time window", list(METRIC_WINDOWS), index=1, horizontal=True)
+    since = time.time() - METRIC_WINDOWS[window] if METRIC_WINDOWS[window] else None
+    for title, name, group_by in METRIC_GROUPS:
+        rows = [row for row in metrics.summary(since=since, group_by=group_by)
+                if row["metric"] == name]
+        st.subheader(title)
+        if rows:
+            st.table([{key: value for key, value in row.items() if key != "metric"}
+                      for row in rows])
+        else:
+            st.info("No observations in this window.")
+    with st.expander("Recent GraphRAG Commands"):
+        recent = metrics.events("command", since=since)[-20:]
+        if recent:
+            st.table([{"Time": time.strftime("%H:%M:%S", time.localtime(e["time"])),
+                       **e["labels"], "Seconds": round(e["seconds"], 2),
+                       "Peak RSS": format_bytes(e["peak_rss_bytes"]) if "peak_rss_bytes" in e else "-",
+                       "Output": format_bytes(e["output_bytes"])}
+                      for e in reversed(recent)])
+        else:
+            st.info("No GraphRAG commands in this window.")
+    st.subheader("Prometheus Export")
+    st.caption(f"Written to `{metrics.export_path}` and, when `GRAPHRAG_METRICS_PORT` is set, "
+               f"served at `http://<host>:<port>/metrics`.")
+    export = metrics.prometheus()
+    metrics.flush(force=True)
+    st.download_button("Download metrics.prom", export, "metrics.prom", "text/plain")
+    with st.expander("Prometheus Text"):
+        st.code(export, language="text")
+
+
+def logs_page():
+    """Tail and search the logs of indexing jobs and graphrag commands"""
+    source = st.radio("Source", ["Indexing Jobs", "Commands"], horizontal=True)
+    kb_filter = st.selectbox("Knowledge Base", ["All"] + list_knowledge_bases(),
+                             key="logs_kb")
+    kb_name = None if kb_filter == "All" else kb_filter
+    if source == "Indexing Jobs":
+        options = {f"{job.id} — {job.kb_name} ({job.status})": job.log_path
+                   for job in get_job_manager().jobs(kb_name, limit=LOG_CHOICES)
+                   if job.log_path.exists()}
+    else:
+        options = {f"{run['name']} ({format_bytes(run['bytes'])})": run["path"]
+                   for run in list_run_logs(kb_name)[:LOG_CHOICES]}
+    if not options:
+        st.info("No logs yet.")
+        return
+    path = options[st.selectbox("Log", list(options), key="logs_file")]
+    st.caption(f"{format_bytes(total_log_size(path))} in {len(log_files(path))} file(s)")
+    col1, col2, col3 = st.columns([4, 1, 1])
+    pattern = col1.text_input("Search", key="logs_search")
+    use_regex = col2.checkbox("Regex", key="logs_regex")
+    match_case = col3.checkbox("Match case", key="logs_case")
+    if pattern:
+        try:
+            matches, truncated = search_log(path, pattern, regex=use_regex,
+                                            ignore_case=not match_case)
+        except re.error as e:
+            st.error(f"Invalid regular expression: {e}")
+            return
+        st.write(f"{len(matches)}{'+' if truncated else ''} matching lines")
+        st.code("\n".join(f"{number:>8}  {line}" for number, line in matches)
+                or "(no matches)", language="text")
+    else:
+        lines = st.number_input("Last lines", min_value=10, max_value=5000, value=200,
+                                step=50, key="logs_lines")
+        if st.button("Refresh", key="logs_refresh"):
+            rerun_method()  # Read the newest lines again
+        st.code(tail_log_file(path, int(lines)) or "(empty)", language="text")
+
+
+def federated_query_page(kb_list, default_kb):
+    """Ask several knowledge bases the same question in parallel"""
+    selected = st.multiselect("Knowledge bases", kb_list, default=[default_kb],
+                              key="federated_kbs")
+    for name in selected:
+        warm_query_worker(KB_DIR / name)
+    query = st.text_input("Enter your question", key="federated_query")
+    col1, col2 = st.columns(2)
+    with col1:
+        method = st.selectbox("Select Query Method", ["local", "global", "drift"],
+                              key="federated_method")
+    with col2:
+        timeout = st.number_input("Timeout per knowledge base (s)", min_value=5,
+                                  value=FEDERATED_TIMEOUT, step=5)
+    if st.button("Query Selected Knowledge Bases"):
+        if not selected or not query:
+            st.error("Please select at least one knowledge base and enter your question!")
+            return
+        status = st.empty()
+        # One placeholder per knowledge base, filled in as its answer arrives
+        sections = {}
+        for name in selected:
+            st.markdown(f"### {name}")
+            sections[name] = st.empty()
+            sections[name].info("Waiting for an answer...")
+        results = []
+        for result in query_knowledge_bases([KB_DIR / name for name in selected], method,
+                                            query, cwd=ROOT_DIR, timeout=timeout):
+            results.append(result)
+            status.write(f"{len(results)} / {len(selected)} knowledge bases answered")
+            section = sections[result["knowledge_base"]]
+            if result["status"] == "ok":
+                section.markdown(f"{result['answer']}\n\n"
+                                 f"_Answered in {result['latency_seconds']}s_")
+            elif result["status"] == "no_response":
+                section.warning(f"No valid response found ({result['latency_seconds']}s).")
+            elif result["status"] == "timeout":
+                section.warning(f"No answer within {timeout}s.")
+            else:
+                section.error(f"Query failed: {result['error']}")
+        st.download_button("Export Merged Answers", merge_answers(results, order=selected),
+                           "federated_answers.md", "text/markdown")
+
+
+def _worker_status(worker):
+    if not worker["alive"]:
+        return "not responding"
+    if not worker.get("job"):
+        return "idle"
+    workflow = f" ({worker['workflow']})" if worker.get("workflow") else ""
+    return f"indexing {worker['kb']}{workflow}"
+
+
+def show_index_workers():
+    """Show the indexing workers and the jobs waiting in or claimed from the spool"""
+    spool = JobSpool()
+    workers, queue = spool.workers(), spool.queue()
+    if not workers and not queue:
+        return
+    live = sum(worker["alive"] for worker in workers)
+    with st.expander(f"Indexing Workers ({live} alive, {len(queue)} jobs queued or running)"):
+        st.caption("Workers started with `python index_worker.py` on this or other hosts "
+                   "sharing the knowledge_bases volume claim indexing jobs from the spool.")
+        if workers:
+            st.table([{"Worker": w["name"], "Host": w["host"],
+                       "Status": _worker_status(w),
+                       "Succeeded": w.get("succeeded", 0), "Failed": w.get("failed", 0),
+                       "Last Heartbeat": f"{w['heartbeat_age']:.0f}s ago"} for w in workers])
+        if queue:
+            st.table([{"Job": state["id"], "Knowledge Base": state["kb_name"],
+                       "Status": state["status"],
+                       "Worker": claim["worker"] if claim else "",
+                       "Attempts": state.get("attempts", 0),
+                       "Heartbeat": (f"{claim['heartbeat_age']:.0f}s ago"
+                                     if claim and claim.get("heartbeat_age") is not None else "")}
+                      for state, claim in queue])
+
+
+def show_index_jobs(name):
+    """Show the progress and log of the knowledge base's indexing jobs"""
+    show_index_workers()
+    manager = get_job_manager()
+    jobs = manager.jobs(name, limit=10)
+    if not jobs:
+        st.info("This knowledge base has not been indexed from the web UI yet.")
+        return
+    job = jobs[0]
+    st.write(f"Latest job: `{job.id}` — **{job.status}** "
+             f"({job.elapsed():.0f}s)" + (f" on worker `{job.worker}`" if job.worker else ""))
+    if job.active and job.spool and not job.worker:
+        st.info("Waiting for an indexing worker to take the job...")
+    if job.workflows:
+        st.table([{"Workflow": w["name"], "Duration (s)": w["seconds"]}
+                  for w in job.workflows])
+    if job.active:
+        if job.current_workflow:
+            st.write(f"Running workflow: `{job.current_workflow}`")
+        st.info(f"Indexing in progress, {len(job.workflows)} workflows completed so far.")
+        if st.button("Cancel Indexing", key=f"cancel_{job.id}"):
+            manager.cancel(job.id)
+            st.warning("Cancelling indexing job...")
+    elif job.status == "succeeded":
         st.success("Knowledge base indexed successfully!")
-        logger.info(f"Knowledge base '{name}' indexed successfully!")
-        rerun_method()  # Automatically refresh the page to display the latest content
+    elif job.status == "cancelled":
+        st.warning("Indexing was cancelled.")
     else:
         st.error(
             "Indexing failed. Please check if GraphRAG is installed and configured correctly.")
+    with st.expander("Indexing Log", expanded=job.active):
+        st.code(manager.tail(job.id) or "(no output yet)", language="text")
+    if len(jobs) > 1:
+        with st.expander("Earlier Indexing Jobs"):
+            st.table([{"Job": j.id, "Status": j.status,
+                       "Worker": j.worker or "web UI",
+                       "Workflows": len(j.workflows),
+                       "Duration (s)": round(j.elapsed())} for j in jobs[1:]])
+
+
+def show_index_estimate(kb_path):
+    """Estimate the LLM calls, tokens, wall time and cost of a full index"""
+    with st.expander("Estimate Indexing Cost and Time"):
+        st.caption("Tokenizes every input document (cached by content hash) and applies "
+                   "the chunking, model and concurrency settings of settings.yaml.")
+        col1, col2 = st.columns(2)
+        llm_price = col1.number_input("LLM price per 1M prompt tokens", min_value=0.0,
+                                      value=0.0, step=0.5, key=f"llm_price_{kb_path.name}")
+        embedding_price = col2.number_input(
+            "Embedding price per 1M tokens", min_value=0.0, value=0.0, step=0.01,
+            key=f"embedding_price_{kb_path.name}")
+        state_key = f"index_estimate_{kb_path.name}"
+        if st.button("Estimate", key=f"estimate_{kb_path.name}"):
+            bar = st.progress(0.0, text="Tokenizing input documents...")
+            estimate = estimate_index(
+                kb_path, progress=lambda done, total: bar.progress(
+                    done / total, text=f"Tokenized {done} of {total} documents"))
+            bar.empty()
+            st.session_state[state_key] = estimate
+        estimate = st.session_state.get(state_key)
+        if not estimate:
+            return
+        settings = estimate["settings"]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Documents", f"{estimate['documents']:,}")
+        col2.metric("Tokens", f"{estimate['tokens']:,}")
+        col3.metric("Chunks", f"{estimate['chunks']:,}")
+        col4.metric("Wall Time", format_duration(estimate["wall_seconds"]))
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Extraction Calls", f"{estimate['extraction_calls'] + estimate['claim_calls']:,}")
+        col2.metric("LLM Calls (total)", f"{estimate['llm_calls']:,}")
+        col3.metric("Embedding Calls", f"{estimate['embedding_calls']:,}")
+        col4.metric("Cost", f"{estimate_cost(estimate, llm_price, embedding_price):,.2f}")
+        st.caption(
+            f"Model `{settings['model']}` with {settings['concurrency']} concurrent requests, "
+            f"embeddings `{settings['embedding_model']}`, chunks of {settings['chunk_size']} "
+            f"tokens ({settings['chunk_overlap']} overlap), {settings['max_gleanings']} gleanings. "
+            f"About {estimate['llm_prompt_tokens']:,} prompt and "
+            f"{estimate['embedding_tokens']:,} embedding tokens. "
+            f"{estimate['tokenized_files']} documents tokenized, "
+            f"{estimate['cached_files']} from cache.")
+        if not estimate["exact_tokens"]:
+            st.warning("tiktoken or its encoding is not available, so token counts are "
+                       "approximated from file sizes.")
+        st.caption("Summary and community report calls and the wall time are typical "
+                   "values; they depend on the content and on the LLM's latency.")
+
+
+def show_index_versions(kb_path):
+    """List the kept index versions and roll back to one of them"""
+    versions = list_versions(kb_path)
+    if not versions:
+        return
+    with st.expander(f"Index Versions ({len(versions)})"):
+        st.table([{"Version": v["name"],
+                   "Created": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(v["created"])),
+                   "Size": format_bytes(v["bytes"]), "Files": v["files"],
+                   "Current": "✓" if v["current"] else ""} for v in versions])
+        st.caption(f"Besides the current index, the {KEEP_INDEX_VERSIONS} most recent "
+                   "versions are kept (GRAPHRAG_KEEP_INDEX_VERSIONS).")
+        previous = [v["name"] for v in versions if not v["current"]]
+        if not previous:
+            return
+        version = st.selectbox("Version", previous, key=f"rollback_{kb_path.name}")
+        if st.button("Roll Back", key=f"rollback_button_{kb_path.name}"):
+            try:
+                with writing(kb_path):
+                    snapshot = rollback(kb_path, version)
+                    if snapshot is None:
+                        InputManifest(kb_path).reset_indexed()
+                    else:
+                        InputManifest(kb_path).mark_indexed(snapshot)
+                    invalidate_index(kb_path)
+                st.success(f"Knowledge base now uses index version {version}.")
+                rerun_method()  # Automatically refresh the page
+            except (KBBusyError, VersionError) as e:
+                st.error(str(e))
+
+
+def _run_label(profile):
+    started = time.strftime("%Y-%m-%d %H:%M", time.localtime(profile["started"] or 0))
+    return f"{started} · {profile['kind']} · {format_duration(profile['total_seconds'])}"
+
+
+def _change_text(change):
+    return "" if change is None else f"{change:+.0%}"
+
+
+def show_index_profiles(kb_path):
+    """Per-workflow profiles of finished runs, compared side by side"""
+    st.subheader("Indexing Profiles")
+    profiles = list_profiles(kb_path.name)
+    if not profiles:
+        st.info("No profiled runs yet. A profile is recorded when an indexing run succeeds.")
+        return
+    for candidate, baseline, comparison in find_regressions(profiles)[:3]:
+        slower = [row["name"] for row in comparison["workflows"] if row["regressed"]]
+        st.warning(f"The run of {_run_label(candidate)} got slower after settings.yaml changed "
+                   f"({_change_text(comparison['total_change'])} in total"
+                   + (f"; slower: {', '.join(slower)}" if slower else "") + ").")
+
+    latest = profiles[0]
+    st.write(f"**Latest run:** {_run_label(latest)}"
+             + (f", {latest['documents']} documents" if latest.get("documents") else ""))
+    total = latest["total_seconds"] or 1
+    st.table([{"Workflow": w["name"],
+               "Wall Time": format_duration(w["seconds"]) if w["seconds"] is not None else "-",
+               "Share": f"{(w['seconds'] or 0) / total:.0%}",
+               "LLM Calls": w["llm_calls"], "Retries": w["retries"],
+               "Rate Limits": w["rate_limits"], "Waited": format_duration(w["wait_seconds"]),
+               "Tokens": w["input_tokens"] + w["output_tokens"],
+               "Rows": "-" if w["rows"] is None else w["rows"]} for w in latest["workflows"]])
+    if latest["tables"]:
+        st.caption("Table rows: " + ", ".join(f"{name} {rows}"
+                                                for name, rows in latest["tables"].items()))
+
+    if len(profiles) > 1:
+        st.write("**Wall time over time**")
+        values = [{"run": _run_label(p), "workflow": w["name"], "seconds": w["seconds"] or 0}
+                  for p in reversed(profiles[:20]) for w in p["workflows"]]
+        st.vega_lite_chart({
+            "data": {"values": values},
+            "mark": "bar",
+            "encoding": {
+                "x": {"field": "run", "type": "nominal", "sort": None, "title": None},
+                "y": {"field": "seconds", "type": "quantitative", "aggregate": "sum"},
+                "color": {"field": "workflow", "type": "nominal"},
+            },
+        }, use_container_width=True)
+
+        st.write("**Compare runs**")
+        labels = {p["job_id"]: _run_label(p) for p in profiles}
+        col1, col2 = st.columns(2)
+        baseline_id = col1.selectbox("Baseline", list(labels), index=1,
+                                     format_func=labels.get, key=f"profile_base_{kb_path.name}")
+        candidate_id = col2.selectbox("Candidate", list(labels), index=0,
+                                      format_func=labels.get, key=f"profile_new_{kb_path.name}")
+        by_id = {p["job_id"]: p for p in profiles}
+        baseline, candidate = by_id[baseline_id], by_id[candidate_id]
+        comparison = compare_profiles(baseline, candidate)
+        st.table([{"Workflow": row["name"],
+                   "Baseline": format_duration(row["before"].get("seconds") or 0),
+                   "Candidate": format_duration(row["after"].get("seconds") or 0),
+                   "Change": _change_text(row["change"]),
+                   "LLM Calls": f"{row['before'].get('llm_calls', 0)} → {row['after'].get('llm_calls', 0)}",
+                   "Retries": f"{row['before'].get('retries', 0)} → {row['after'].get('retries', 0)}",
+                   "Rows": f"{row['before'].get('rows') or '-'} → {row['after'].get('rows') or '-'}",
+                   "Regression": "⚠️" if row["regressed"] else ""}
+                  for row in comparison["workflows"]])
+        st.write(f"Total: {format_duration(baseline['total_seconds'])} → "
+                 f"{format_duration(candidate['total_seconds'])} "
+                 f"({_change_text(comparison['total_change'])})")
+        st.caption(f"A workflow is flagged when it got at least {REGRESSION_RATIO:.0%} and "
+                   f"{REGRESSION_MIN_SECONDS:g}s slower.")
+        if comparison["settings_changed"]:
+            edits = comparison["edits"]
+            st.info("settings.yaml differs between these runs"
+                    + (f" (saved {len(edits)} times in between)." if edits else "."))
+            st.code(settings_diff(baseline, candidate) or "(no textual difference)",
+                    language="diff")
+
+
+# Poll job state without blocking the page when fragments are available (Streamlit 1.37.0+)
+fragment_method = getattr(st, "fragment", None)
+if fragment_method:
+    show_index_jobs = fragment_method(run_every=3)(show_index_jobs)
 
 
 # Main UI
 st.title("GraphRAG Web UI")
 
-menu = ["Knowledge Base Management", "Knowledge Base Q&A"]
+menu = ["Knowledge Base Management", "Knowledge Base Q&A", "Metrics", "Logs"]
 choice = st.sidebar.selectbox("Select Module", menu)
+script_page = choice
 
 if choice == "Knowledge Base Management":
     st.header("Knowledge Base Management")
@@ -297,6 +1107,8 @@ if choice == "Knowledge Base Management":
         else:
             st.info("No knowledge bases available to delete.")
 
+    transfer_knowledge_bases(kb_list)
+
     # Add a Refresh button next to "Existing Knowledge Bases List"
     col1, col2 = st.columns([4, 1])
     with col1:
@@ -321,8 +1133,9 @@ if choice == "Knowledge Base Management":
         if selected_kb:
             kb_path = KB_DIR / selected_kb
             st.write(f"Currently managing: **{selected_kb}**")
-            tab1, tab2, tab3, tab4 = st.tabs(
-                ["Edit .env", "Edit settings.yaml", "Manage Knowledge Files", "Index Knowledge Base"])
+            tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(
+                ["Edit .env", "Edit settings.yaml", "Manage Knowledge Files", "Index Knowledge Base",
+                 "Cache and Storage", "Index Explorer", "Graph View", "Indexing Profiles"])
 
             with tab1:
                 edit_env(kb_path)
@@ -332,22 +1145,82 @@ if choice == "Knowledge Base Management":
 
             with tab3:
                 manage_files(kb_path)
+                st.write("---")
+                import_archives(kb_path)
+                st.write("---")
+                find_near_duplicates(kb_path)
 
             with tab4:
                 st.subheader("Index Knowledge Base")
                 st.write(
                     "Click the button below to index the knowledge base using GraphRAG.")
 
+                index_mode = st.radio(
+                    "Indexing Mode", ["Full", "Incremental (changed documents only)"],
+                    horizontal=True)
+                incremental = index_mode != "Full"
+
+                if incremental:
+                    manifest = InputManifest(kb_path).refresh()
+                    delta = manifest.diff()
+                    reprocess = delta["added"] + delta["changed"]
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Added", len(delta["added"]))
+                    col2.metric("Changed", len(delta["changed"]))
+                    col3.metric("Deleted", len(delta["deleted"]))
+                    st.write(f"{len(reprocess)} documents (about "
+                             f"{estimate_delta(manifest, reprocess)} chunks) will be processed.")
+                    if manifest.indexed is None:
+                        st.warning("No record of a previous index was found, so every document counts as added.")
+                    if delta["changed"] or delta["deleted"]:
+                        st.warning("GraphRAG's update path only adds new content. Changed or deleted "
+                                   "documents stay in the index until the next full index.")
+
+                if not incremental:
+                    show_index_estimate(kb_path)
+
                 # Add a checkbox for clearing the cache
-                clear_cache_option = st.checkbox("Clear Cache")
+                clear_cache_option = st.checkbox("Clear Cache", disabled=incremental)
+                keep_llm_cache = st.checkbox(
+                    "Keep LLM response cache", value=True,
+                    disabled=incremental or not clear_cache_option)
+
+                indexing = get_job_manager().active_job(selected_kb) is not None
+                if st.button("Index Knowledge Base", key=f"index_{selected_kb}",
+                             disabled=indexing):
+                    if clear_cache_option and not incremental:
+                        try:
+                            with st.spinner("Clearing cache..."):
+                                clear_cache(kb_path, keep_llm_cache=keep_llm_cache)
+                            st.success("Cache cleared!")
+                        except KBBusyError as e:
+                            st.error(str(e))
+                            st.stop()
 
-                if st.button("Index Knowledge Base", key=f"index_{selected_kb}"):
-                    if clear_cache_option:
-                        with st.spinner("Clearing cache..."):
-                            clear_cache(kb_path)
-                        st.success("Cache cleared!")
+                    index_knowledge_base(selected_kb, incremental=incremental)
+                    rerun_method()  # Refresh the page to show the new job
 
-                    index_knowledge_base(selected_kb)
+                st.write("---")
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.subheader("Indexing Progress")
+                with col2:
+                    if not fragment_method and st.button("Refresh Status"):
+                        rerun_method()  # Manually poll the job state
+                show_index_jobs(selected_kb)
+                show_index_versions(kb_path)
+
+            with tab5:
+                manage_storage(kb_path)
+
+            with tab6:
+                explore_index(kb_path)
+
+            with tab7:
+                graph_view(kb_path)
+
+            with tab8:
+                show_index_profiles(kb_path)
     else:
         st.info("No knowledge bases currently available for management.")
 
@@ -361,23 +1234,64 @@ elif choice == "Knowledge Base Q&A":
             "Select a Knowledge Base to Query", kb_list, key="qa_select")
         if selected_kb:
             kb_path = KB_DIR / selected_kb
-            query = st.text_input("Enter your question")
-            method = st.selectbox("Select Query Method", [
-                                  "local", "global", "drift"])
-            if st.button("Submit Query"):
-                if query:
-                    with st.spinner("Processing your question, please wait..."):
-                        # Execute query
-                        args = ["query", "--root",
-                                str(kb_path), "--method", method, "--query", query]
-                        output = run_graphrag_command(args, cwd=ROOT_DIR)
-                        # Parse response
-                        response = parse_graphrag_response(output, method)
-                    print(f"Query output for {selected_kb}: {output}")
-                    if response:
-                        st.markdown(response)
+            warm_query_worker(kb_path)  # Loads in the background while the question is typed
+            single_tab, batch_tab, federated_tab = st.tabs(
+                ["Single Question", "Batch Questions", "Multiple Knowledge Bases"])
+            with single_tab:
+                query = st.text_input("Enter your question")
+                method = st.selectbox("Select Query Method", [
+                                      "local", "global", "drift"])
+                if st.button("Submit Query"):
+                    if query:
+                        answer_area = st.empty()
+                        try:
+                            with st.spinner("Processing your question, please wait..."):
+                                # Execute query (cached answer, warm worker or the CLI),
+                                # showing the answer while it is generated
+                                response, output = answer_query(
+                                    kb_path, method, query, cwd=ROOT_DIR,
+                                    on_partial=partial_renderer(answer_area))
+                        except (KBBusyError, TimeoutError) as e:
+                            st.warning(f"{e}. Please try again shortly.")
+                            st.stop()
+                        if output:
+                            print(f"Query output for {selected_kb}: {output}")
+                        if response:
+                            answer_area.markdown(response)
+                        else:
+                            answer_area.empty()
+                            st.error(
+                                "No valid response found. The knowledge base might not be initialized or there might be other errors.")
                     else:
-                        st.error(
-                            "No valid response found. The knowledge base might not be initialized or there might be other errors.")
-                else:
-                    st.error("Please enter your question!")
+                        st.error("Please enter your question!")
+            with batch_tab:
+                batch_query_page(kb_path)
+            with federated_tab:
+                federated_query_page(kb_list, selected_kb)
+
+            # Query cache statistics
+            with st.expander("Query Cache"):
+                stats = get_query_cache().stats()
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Hits", stats["hits"])
+                col2.metric("Misses", stats["misses"])
+                col3.metric("Hit Rate", f"{stats['hit_rate']:.0%}")
+                col4.metric("Cached Answers", stats["entries"])
+                st.caption(f"Cache size: {stats['bytes'] / 1024:.1f} KB, "
+                           f"evictions: {stats['evictions']}")
+                running, waiting = get_single_flight().in_flight()
+                st.caption(f"Queries in flight: {running}, "
+                           f"identical queries waiting on them: {waiting}")
+                if st.button("Clear Query Cache"):
+                    get_query_cache().clear()
+                    rerun_method()  # Automatically refresh the page
+
+elif choice == "Metrics":
+    st.header("Metrics")
+    metrics_page()
+
+elif choice == "Logs":
+    st.header("Logs")
+    logs_page()
+
+record_script_run("complete")
@@ -0,0 +1,218 @@
+"""Bulk ingestion of document archives into a knowledge base
+
+Archives (.zip, .tar, .tar.gz and .tar.zst) are read member by member and
+written straight into input/ without extracting the archive anywhere first.
+Text members are re-encoded to UTF-8 on the way and deduplicated by content
+like regular uploads.
+"""
+import codecs
+import hashlib
+import logging
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from pathlib import PurePosixPath
+
+from uploads import CHUNK_SIZE, DUPLICATE_REJECT, InputWriter, temp_path_for
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SUFFIXES = {".txt", ".text", ".md", ".markdown"}
+ARCHIVE_TYPES = ["zip", "tar", "gz", "tgz", "zst", "tzst"]
+# Tried in order when a member is not valid UTF-8; latin-1 never fails
+FALLBACK_ENCODINGS = ["gb18030", "latin-1"]
+# Raw bytes of a member are kept in memory up to this size while decoding
+SPOOL_SIZE = 8 * 1024 * 1024
+
+
+class ArchiveError(Exception):
+    """Raised for archives that cannot be read"""
+
+
+def _open_zstd(fileobj):
+    try:
+        import zstandard
+    except ImportError:
+        raise ArchiveError("Reading .tar.zst archives requires the 'zstandard' package")
+    return zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+
+def _read_errors(zstd=False):
+    """Exceptions that mean the archive itself is corrupt or of another type"""
+    errors = (tarfile.TarError, zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, EOFError)
+    if zstd:
+        import zstandard
+        errors += (zstandard.ZstdError,)
+    return errors
+
+
+def iter_members(fileobj, archive_name):
+    """Yield (member name, binary stream) for every regular file in an archive
+
+    Tar archives are read as a stream, so fileobj does not need to be seekable.
+    Zip archives keep their directory at the end and need a seekable fileobj.
+    """
+    name = archive_name.lower()
+    zstd = False
+    if name.endswith(".zip"):
+        try:
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        with archive.open(info) as member:
+                            yield info.filename, member
+        except _read_errors() as e:
+            raise ArchiveError(f"Error reading {archive_name}: {e}")
+        return
+    if name.endswith((".tar.gz", ".tgz")):
+        mode, stream = "r|gz", fileobj
+    elif name.endswith((".tar.zst", ".tzst", ".tar.zstd")):
+        mode, stream = "r|", _open_zstd(fileobj)
+        zstd = True
+    elif name.endswith(".tar"):
+        mode, stream = "r|", fileobj
+    else:
+        raise ArchiveError(f"Unsupported archive type: {archive_name}")
+    try:
+        with tarfile.open(fileobj=stream, mode=mode) as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, archive.extractfile(info)
+    except _read_errors(zstd) as e:
+        raise ArchiveError(f"Error reading {archive_name}: {e}")
+
+
+def input_name(member_name, taken=None):
+    """Flatten an archive path into a .txt file name, e.g. 'a/b.md' -> 'a__b.txt'
+
+    Returns None for members that are not supported text files. Flattening
+    can map several members to one name ('a/b.md' and 'a/b.txt', or
+    'a__b/c.txt' and 'a/b__c.txt'); with taken, the set of names given out
+    so far, later ones get a numbered suffix such as 'a__b_2.txt'.
+    """
+    path = PurePosixPath(member_name.replace("\\", "/"))
+    if path.suffix.lower() not in SUPPORTED_SUFFIXES:
+        return None
+    parts = [part for part in path.parent.parts if part not in ("", ".", "..", "/")]
+    # Skip hidden files and macOS resource forks
+    if path.name.startswith(".") or "__MACOSX" in parts:
+        return None
+    stem = "__".join(parts + [path.stem])
+    if taken is None:
+        return stem + ".txt"
+    name, number = stem + ".txt", 1
+    while name in taken:
+        number += 1
+        name = f"{stem}_{number}.txt"
+    taken.add(name)
+    return name
+
+
+def _write_text(lines, tmp_path, digest):
+    size = 0
+    with open(tmp_path, "wb") as out:
+        for text in lines:
+            data = text.encode("utf-8")
+            digest.update(data)
+            out.write(data)
+            size += len(data)
+    return size
+
+
+def _decode(chunks, encoding):
+    """Incrementally decode an iterable of byte chunks"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def _read_chunks(stream):
+    return iter(lambda: stream.read(CHUNK_SIZE), b"")
+
+
+def _has_utf16_bom(raw):
+    raw.seek(0)
+    return raw.read(2) in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+def write_utf8(member, dest_path):
+    """Copy a member to a temporary file next to dest_path, re-encoded as UTF-8
+
+    The member is decoded as UTF-8 (with or without BOM) while it streams.
+    Only if that fails are its raw bytes, spooled to memory or a temporary
+    file, decoded again with the fallback encodings.
+    Returns (temp path, sha256 of the UTF-8 content, size, encoding).
+    """
+    tmp_path = temp_path_for(dest_path)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as raw:
+        def tee():
+            for chunk in _read_chunks(member):
+                raw.write(chunk)
+                yield chunk
+
+        chunks = tee()
+        digest = hashlib.sha256()
+        try:
+            size = _write_text(_decode(chunks, "utf-8-sig"), tmp_path, digest)
+            return tmp_path, digest.hexdigest(), size, "utf-8"
+        except UnicodeDecodeError:
+            # Spool the rest of the member, then retry with other encodings
+            for _chunk in chunks:
+                pass
+        candidates = FALLBACK_ENCODINGS
+        if _has_utf16_bom(raw):
+            candidates = ["utf-16"] + candidates
+        for encoding in candidates:
+            raw.seek(0)
+            digest = hashlib.sha256()
+            try:
+                size = _write_text(_decode(_read_chunks(raw), encoding),
+                                   tmp_path, digest)
+                return tmp_path, digest.hexdigest(), size, encoding
+            except UnicodeDecodeError:
+                continue
+    tmp_path.unlink(missing_ok=True)
+    raise ValueError("Could not detect the text encoding")
+
+
+def ingest_archive(kb_path, fileobj, archive_name, on_duplicate=DUPLICATE_REJECT,
+                   progress=None, progress_every=100):
+    """Extract the supported text files of an archive into input/
+
+    progress(members, bytes) is called every progress_every members.
+    Returns a summary dict with counts per status, the number of skipped
+    (unsupported) members, re-encoded members and written bytes.
+    """
+    writer = InputWriter(kb_path, on_duplicate)
+    summary = {"saved": 0, "unchanged": 0, "duplicate": 0, "linked": 0,
+               "error": 0, "skipped": 0, "reencoded": 0, "bytes": 0}
+    members = 0
+    taken = set()
+    try:
+        for member_name, member in iter_members(fileobj, archive_name):
+            members += 1
+            name = input_name(member_name, taken)
+            if name is None:
+                summary["skipped"] += 1
+            else:
+                try:
+                    tmp_path, sha256, size, encoding = write_utf8(
+                        member, writer.input_path / name)
+                    result = writer.commit(tmp_path, name, sha256, size)
+                    summary[result["status"]] += 1
+                    summary["bytes"] += size
+                    if encoding != "utf-8":
+                        summary["reencoded"] += 1
+                except Exception as e:
+                    logger.error(f"Error extracting '{member_name}': {e}")
+                    summary["error"] += 1
+            if progress and members % progress_every == 0:
+                progress(members, summary["bytes"])
+    finally:
+        writer.close()
+    if progress:
+        progress(members, summary["bytes"])
+    logger.info(f"Ingested {archive_name} into {kb_path}: {summary}")
+    return summary
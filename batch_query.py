@@ -0,0 +1,123 @@
+"""Batch querying of a knowledge base from a CSV or JSONL question set
+
+Questions run concurrently on a bounded thread pool through the same query
+path as the single question flow (kb_core.answer_query).
+"""
+import csv
+import io
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from kb_core import QUERY_METHODS, answer_query
+
+logger = logging.getLogger(__name__)
+
+MAX_PARALLELISM = 16
+QUESTION_FIELDS = ["question", "query"]
+RESULT_FIELDS = ["index", "question", "method", "status", "latency_seconds",
+                 "answer", "error"]
+
+
+class BatchFormatError(ValueError):
+    """Raised when a question file cannot be parsed"""
+
+
+def load_questions(fileobj, file_name, default_method="local"):
+    """Read questions from a CSV (with a 'question' column) or JSONL file
+
+    An optional 'method' column/field overrides default_method per question.
+    Returns a list of {"question", "method"} dicts.
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        if file_name.lower().endswith((".jsonl", ".ndjson")):
+            rows = []
+            for line_no, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError as e:
+                    raise BatchFormatError(f"Line {line_no} is not valid JSON: {e}")
+        else:
+            rows = list(csv.DictReader(text))
+    except UnicodeDecodeError as e:
+        raise BatchFormatError(f"The file is not UTF-8 encoded: {e}")
+    finally:
+        # Leave the caller's file object open
+        text.detach()
+    questions = []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise BatchFormatError(f"Row {number} is not an object")
+        row = {str(key).strip().lower(): value for key, value in row.items() if key}
+        question = next((row[field] for field in QUESTION_FIELDS if row.get(field)), None)
+        if not question or not str(question).strip():
+            continue
+        method = str(row.get("method") or default_method).strip().lower()
+        if method not in QUERY_METHODS:
+            raise BatchFormatError(f"Row {number} has an unknown method '{method}'")
+        questions.append({"question": str(question).strip(), "method": method})
+    return questions
+
+
+def _run_one(kb_path, index, item, cwd):
+    result = {"index": index, "question": item["question"],
+              "method": item["method"], "status": "ok", "latency_seconds": 0.0,
+              "answer": "", "error": ""}
+    start = time.perf_counter()
+    try:
+        response, _output = answer_query(kb_path, item["method"], item["question"],
+                                         cwd=cwd)
+        if response:
+            result["answer"] = response
+        else:
+            result["status"] = "no_response"
+    except Exception as e:
+        logger.error(f"Batch question {index} failed: {e}")
+        result.update(status="error", error=str(e))
+    result["latency_seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(kb_path, questions, cwd, parallelism=4):
+    """Run questions concurrently and yield each result as soon as it finishes"""
+    parallelism = max(1, min(int(parallelism), MAX_PARALLELISM))
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = [executor.submit(_run_one, kb_path, index, item, cwd)
+                   for index, item in enumerate(questions, start=1)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def summarize(results):
+    """Status counts and latency percentiles of a batch"""
+    latencies = sorted(r["latency_seconds"] for r in results)
+    statuses = {}
+    for r in results:
+        statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))]
+
+    return {"count": len(results), "statuses": statuses,
+            "p50": percentile(0.5), "p95": percentile(0.95),
+            "max": latencies[-1] if latencies else 0.0}
+
+
+def to_csv(results):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RESULT_FIELDS)
+    writer.writeheader()
+    for result in sorted(results, key=lambda r: r["index"]):
+        writer.writerow(result)
+    return buffer.getvalue()
+
+
+def to_jsonl(results):
+    return "".join(json.dumps(result, ensure_ascii=False) + "\n"
+                   for result in sorted(results, key=lambda r: r["index"]))
@@ -0,0 +1,515 @@
+"""Local OpenAI-compatible stand-in for the LLM and embedding APIs graphrag calls
+
+Serves the chat completions and embeddings endpoints (OpenAI and Azure
+OpenAI paths) with deterministic answers shaped like the ones graphrag's
+prompts expect: entity/relationship records for graph extraction, plain
+summaries, JSON community reports, global search map points, DRIFT follow-up
+queries and fixed-dimension unit embeddings. The same request always gets the
+same answer, so index and query runs are repeatable without network access
+or API budget.
+
+Latency per request and per output token, and per-model request and token
+rate limits (answered with 429 and Retry-After like the real API) are
+configurable, so graphrag's concurrency and retry settings can be load-tested
+on one machine. GET /stats returns the request counts per kind.
+
+Usage:
+    python benchmarks/mock_llm_server.py --port 8765 --latency 0.5 --rpm 600
+    python benchmarks/mock_llm_server.py --configure knowledge_bases/my_kb \
+        --base-url http://127.0.0.1:8765/v1
+    python benchmarks/mock_llm_server.py --restore knowledge_bases/my_kb
+"""
+import argparse
+import base64
+import hashlib
+import json
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import yaml
+
+DEFAULT_PORT = 8765
+EMBEDDING_DIMENSIONS = 1536
+ENTITIES_PER_CHUNK = 5
+DEFAULT_ENTITY_TYPES = ["ORGANIZATION", "PERSON", "GEO", "EVENT"]
+MOCK_API_KEY = "mock-llm-key"
+BACKUP_SUFFIX = ".before-mock"
+
+TUPLE_DELIMITER = "<|>"
+RECORD_DELIMITER = "##"
+COMPLETION_DELIMITER = "<|COMPLETE|>"
+
+
+def _digest(*parts):
+    return hashlib.sha256("\0".join(parts).encode("utf-8", "replace")).digest()
+
+
+def _number(seed, low, high):
+    """Deterministic integer in [low, high] derived from a seed string"""
+    return low + int.from_bytes(_digest(seed)[:4], "big") % (high - low + 1)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+# ---------------------------------------------------------------------------
+# Responses
+# ---------------------------------------------------------------------------
+
+def _between(text, start, end):
+    begin = text.rfind(start)
+    if begin < 0:
+        return ""
+    begin += len(start)
+    stop = text.find(end, begin)
+    return text[begin:stop if stop >= 0 else None]
+
+
+def _entity_names(text, limit=ENTITIES_PER_CHUNK):
+    """Capitalized words of the text, or its most frequent words, as entity names"""
+    names = []
+    for word in re.findall(r"\b[A-Z][A-Za-z]{2,}\b", text):
+        name = word.upper()
+        if name not in names:
+            names.append(name)
+        if len(names) == limit:
+            return names
+    if len(names) < 2:
+        words = Counter(word.upper() for word in re.findall(r"\b\w{4,}\b", text))
+        names += [word for word, _count in words.most_common(limit)
+                  if word not in names][:limit - len(names)]
+    return names or ["DOCUMENT"]
+
+
+def graph_extraction(prompt):
+    text = _between(prompt, "Text:", "######################")
+    types_line = _between(prompt, "Entity_types:", "\n").strip()
+    types = [t.strip().upper() for t in types_line.strip("[]").split(",") if t.strip()]
+    types = types or DEFAULT_ENTITY_TYPES
+    names = _entity_names(text)
+    records = []
+    for name in names:
+        entity_type = types[_number(name, 0, len(types) - 1)]
+        records.append(f'("entity"{TUPLE_DELIMITER}{name}{TUPLE_DELIMITER}{entity_type}'
+                       f'{TUPLE_DELIMITER}{name.title()} is a {entity_type.lower()} '
+                       f'mentioned in the source text.)')
+    for source, target in zip(names, names[1:]):
+        strength = _number(source + target, 1, 10)
+        records.append(f'("relationship"{TUPLE_DELIMITER}{source}{TUPLE_DELIMITER}{target}'
+                       f'{TUPLE_DELIMITER}{source.title()} and {target.title()} appear '
+                       f'together in the source text.{TUPLE_DELIMITER}{strength})')
+    return RECORD_DELIMITER.join(records) + COMPLETION_DELIMITER
+
+
+def summary(prompt):
+    entity = _between(prompt, "Entities:", "\n").strip() or "the entity"
+    return (f"{entity} is described consistently across the source documents; "
+            "this summary merges all of its descriptions into one.")
+
+
+def community_report(prompt):
+    names = _entity_names(_between(prompt, "Text:", "Output:") or prompt, limit=3)
+    title = " and ".join(name.title() for name in names)
+    return json.dumps({
+        "title": f"Community around {title}",
+        "summary": f"This community is centered on {title} and their relationships.",
+        "rating": float(_number(title, 1, 10)),
+        "rating_explanation": "The impact rating is a deterministic mock value.",
+        "findings": [{"summary": f"{name.title()} is a key entity",
+                      "explanation": f"{name.title()} is connected to the other "
+                                     "entities of this community."} for name in names],
+    })
+
+
+def global_map(prompt):
+    return json.dumps({"points": [
+        {"description": "The knowledge base contains information relevant to the "
+                        "question [Data: Reports (0)].", "score": _number(prompt, 20, 90)}]})
+
+
+def drift_answer(prompt):
+    question = _between(prompt, "Query:", "\n").strip() or "the question"
+    return json.dumps({
+        "intermediate_answer": f"A mock intermediate answer to {question}.",
+        "response": f"A mock answer to {question}.",
+        "score": _number(prompt, 20, 90),
+        "follow_up_queries": [f"What else is known about {question}?"],
+    })
+
+
+def answer(prompt):
+    question = prompt.strip().splitlines()[-1][:200] if prompt.strip() else ""
+    return ("## Mock Answer\n\nThis deterministic answer was generated by the local mock "
+            f"LLM server for: {question}\n\nIt cites the knowledge base [Data: Entities (0)].")
+
+
+def classify(messages):
+    """The kind of graphrag request and the text the response is derived from"""
+    prompt = "\n".join(str(message.get("content") or "") for message in messages)
+    last = str(messages[-1].get("content") or "") if messages else ""
+    if "Answer Y if there are still entities" in last or "Answer YES | NO" in last:
+        return "gleaning_check", prompt
+    if "MANY entities" in last:
+        return "gleaning", prompt
+    if '("entity"' in prompt and "Text:" in prompt:
+        return "extract_graph", prompt
+    if "-Target activity-" in prompt:
+        return "extract_claims", prompt
+    if '"findings"' in prompt:
+        return "community_report", prompt
+    if "comprehensive summary" in prompt:
+        return "summarize", prompt
+    if '"points"' in prompt:
+        return "global_map", prompt
+    if "follow_up_queries" in prompt:
+        return "drift", prompt
+    return "answer", prompt
+
+
+RESPONDERS = {
+    "gleaning_check": lambda prompt: "N",
+    "gleaning": lambda prompt: COMPLETION_DELIMITER,
+    "extract_graph": graph_extraction,
+    "extract_claims": lambda prompt: COMPLETION_DELIMITER,
+    "summarize": summary,
+    "community_report": community_report,
+    "global_map": global_map,
+    "drift": drift_answer,
+    "answer": answer,
+}
+
+
+def embedding(text, dimensions):
+    """Deterministic unit vector for a text"""
+    values, counter = [], 0
+    while len(values) < dimensions:
+        block = _digest(text, str(counter))
+        values += [byte / 127.5 - 1.0 for byte in block]
+        counter += 1
+    values = values[:dimensions]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+# ---------------------------------------------------------------------------
+# Rate limits
+# ---------------------------------------------------------------------------
+
+class RateLimiter:
+    """Sliding one-minute window of requests and tokens per model"""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, model, tokens):
+        """Record a request; returns 0, or the seconds to wait when over a limit"""
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(model, deque())
+            while window and now - window[0][0] >= 60:
+                window.popleft()
+            over_requests = (self.requests_per_minute
+                             and len(window) + 1 > self.requests_per_minute)
+            over_tokens = (self.tokens_per_minute
+                           and sum(t for _time, t in window) + tokens > self.tokens_per_minute)
+            if over_requests or over_tokens:
+                return max(0.1, 60 - (now - window[0][0])) if window else 1.0
+            window.append((now, tokens))
+            return 0.0
+
+
+# ---------------------------------------------------------------------------
+# HTTP server
+# ---------------------------------------------------------------------------
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, token_latency=0.0, embedding_latency=0.0,
+                 requests_per_minute=0, tokens_per_minute=0,
+                 dimensions=EMBEDDING_DIMENSIONS):
+        super().__init__(address, MockHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.embedding_latency = embedding_latency
+        self.dimensions = dimensions
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+
+    def count(self, **increments):
+        with self.counts_lock:
+            self.counts.update(increments)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate the output under load
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _rate_limited(self, model, tokens):
+        wait = self.server.limiter.acquire(model, tokens)
+        if not wait:
+            return False
+        self.server.count(rate_limited=1)
+        self._send_json(429, {"error": {
+            "message": f"Rate limit reached for {model}. Please try again in {wait:.1f}s.",
+            "type": "requests", "code": "rate_limit_exceeded"}},
+            {"Retry-After": str(max(1, round(wait))),
+             "retry-after-ms": str(int(wait * 1000))})
+        return True
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif path in ("/stats", "/v1/stats"):
+            with self.server.counts_lock:
+                self._send_json(200, dict(self.server.counts))
+        elif path in ("", "/health"):
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Request body is not JSON"}})
+            return
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/chat/completions"):
+            self.chat(request, self._deployment(path))
+        elif path.endswith("/embeddings"):
+            self.embeddings(request, self._deployment(path))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    @staticmethod
+    def _deployment(path):
+        match = re.search(r"/deployments/([^/]+)/", path)
+        return match.group(1) if match else None
+
+    def chat(self, request, deployment):
+        model = request.get("model") or deployment or "mock"
+        messages = request.get("messages") or []
+        kind, prompt = classify(messages)
+        if kind == "answer" and (request.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps({"response": answer(prompt)})
+        else:
+            content = RESPONDERS[kind](prompt)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(content)
+        if self._rate_limited(model, prompt_tokens + completion_tokens):
+            return
+        self.server.count(**{kind: 1, "chat_requests": 1,
+                             "prompt_tokens": prompt_tokens,
+                             "completion_tokens": completion_tokens})
+        completion_id = "chatcmpl-" + _digest(model, prompt).hex()[:24]
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        time.sleep(self.server.latency)
+        if request.get("stream"):
+            self._stream(completion_id, model, content, usage, request)
+            return
+        time.sleep(self.server.token_latency * completion_tokens)
+        self._send_json(200, {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+            "model": model, "usage": usage,
+            "choices": [{"index": 0, "finish_reason": "stop", "logprobs": None,
+                         "message": {"role": "assistant", "content": content}}]})
+
+    def _stream(self, completion_id, model, content, usage, request):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(delta, finish_reason=None, **extra):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk",
+                     "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": delta,
+                                  "finish_reason": finish_reason}], **extra}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send({"role": "assistant", "content": ""})
+        for piece in re.findall(r"\S+\s*|\s+", content):
+            time.sleep(self.server.token_latency * estimate_tokens(piece))
+            send({"content": piece})
+        extra = {"usage": usage} if (request.get("stream_options") or {}).get("include_usage") else {}
+        send({}, "stop", **extra)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def embeddings(self, request, deployment):
+        model = request.get("model") or deployment or "mock"
+        inputs = request.get("input")
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        texts = [item if isinstance(item, str) else json.dumps(item) for item in inputs or []]
+        tokens = sum(estimate_tokens(text) for text in texts)
+        if self._rate_limited(model, tokens):
+            return
+        self.server.count(embedding_requests=1, embedded_texts=len(texts),
+                          embedding_tokens=tokens)
+        time.sleep(self.server.embedding_latency)
+        dimensions = int(request.get("dimensions") or self.server.dimensions)
+        as_base64 = request.get("encoding_format") == "base64"
+        data = []
+        for index, text in enumerate(texts):
+            vector = embedding(text, dimensions)
+            if as_base64:  # The openai client asks for packed float32 by default
+                vector = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode()
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        self._send_json(200, {"object": "list", "data": data, "model": model,
+                              "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+
+# ---------------------------------------------------------------------------
+# Knowledge base wiring
+# ---------------------------------------------------------------------------
+
+def _point_model(config, base_url, model_type):
+    config["type"] = model_type
+    config["api_base"] = base_url
+    config["api_key"] = "${GRAPHRAG_API_KEY}"
+    for key in ("api_version", "deployment_name", "organization", "proxy", "audience"):
+        config.pop(key, None)
+
+
+def configure_knowledge_base(kb_path, base_url):
+    """Point a knowledge base's settings.yaml and .env at the mock server
+
+    The original files are kept next to them with a .before-mock suffix
+    (once), so restore_knowledge_base can undo the change. Note that
+    rewriting settings.yaml drops its comments.
+    """
+    kb_path = Path(kb_path)
+    settings_path, env_path = kb_path / "settings.yaml", kb_path / ".env"
+    for path in (settings_path, env_path):
+        backup = path.with_name(path.name + BACKUP_SUFFIX)
+        if path.exists() and not backup.exists():
+            shutil.copy2(path, backup)
+    with open(settings_path, "r", encoding="utf-8") as f:
+        settings = yaml.safe_load(f) or {}
+    if isinstance(settings.get("models"), dict):  # graphrag 1.x and newer
+        for name, config in settings["models"].items():
+            embedding_model = "embedding" in name or "embedding" in str(config.get("type"))
+            _point_model(config, base_url,
+                         "openai_embedding" if embedding_model else "openai_chat")
+    else:
+        _point_model(settings.setdefault("llm", {}), base_url, "openai_chat")
+        embeddings = settings.setdefault("embeddings", {})
+        _point_model(embeddings.setdefault("llm", {}), base_url, "openai_embedding")
+    with open(settings_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(settings, f, sort_keys=False, allow_unicode=True)
+
+    lines = env_path.read_text(encoding="utf-8").splitlines() if env_path.exists() else []
+    lines = [line for line in lines if not line.startswith("GRAPHRAG_API_KEY=")]
+    lines.append(f"GRAPHRAG_API_KEY={MOCK_API_KEY}")
+    env_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def restore_knowledge_base(kb_path):
+    """Put back the settings.yaml and .env saved by configure_knowledge_base"""
+    restored = []
+    for name in ("settings.yaml", ".env"):
+        backup = Path(kb_path) / (name + BACKUP_SUFFIX)
+        if backup.exists():
+            shutil.move(backup, Path(kb_path) / name)
+            restored.append(name)
+    return restored
+
+
+def start_server(host="127.0.0.1", port=DEFAULT_PORT, **options):
+    """Start the server on a background thread and return it (port 0 picks a free one)"""
+    server = MockServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds before every chat completion")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="additional seconds per generated token")
+    parser.add_argument("--embedding-latency", type=float, default=0.0,
+                        help="seconds per embeddings request")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute per model (0: unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute per model (0: unlimited)")
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS,
+                        help="embedding vector size")
+    parser.add_argument("--configure", metavar="KB_PATH",
+                        help="point a knowledge base at the server and exit")
+    parser.add_argument("--restore", metavar="KB_PATH",
+                        help="undo --configure for a knowledge base and exit")
+    parser.add_argument("--base-url", help="URL written by --configure "
+                                           "(default: http://<host>:<port>/v1)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.configure:
+        url = args.base_url or f"http://{args.host}:{args.port}/v1"
+        configure_knowledge_base(args.configure, url)
+        print(f"{args.configure} now uses the mock LLM server at {url}")
+        return
+    if args.restore:
+        restored = restore_knowledge_base(args.restore)
+        print(f"Restored {', '.join(restored) or 'nothing'} in {args.restore}")
+        return
+    server = MockServer((args.host, args.port), latency=args.latency,
+                        token_latency=args.token_latency,
+                        embedding_latency=args.embedding_latency,
+                        requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                        dimensions=args.dimensions)
+    print(f"Mock LLM server listening on {base_url(server)}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(server.counts), indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Offline benchmarks of the web UI's knowledge base operations
+
+Runs query, index, init and upload through the same code the web UI uses
+(kb_core and uploads) against a stub graphrag package, so the numbers reflect
+the web UI's own overhead (process startup, output handling, file I/O,
+threading) rather than LLM latency. Each operation is run at several
+concurrency levels and the latency percentiles and throughput are written to a
+JSON file that can be compared with an earlier run.
+
+With --mock-llm the installed graphrag is run instead, against the local
+mock LLM server (mock_llm_server.py), which measures the real indexing and
+query pipeline end to end without network access or API costs.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --mock-llm --llm-latency 0.2 --ops index,query
+    python benchmarks/run_benchmarks.py --ops query,upload --concurrency 1,8 \
+        --iterations 40 --compare benchmarks/results/previous.json
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent.resolve()
+ROOT_DIR = BENCH_DIR.parent
+STUB_DIR = BENCH_DIR / "stub_graphrag"
+RESULTS_DIR = BENCH_DIR / "results"
+
+OPERATIONS = ["query", "index", "init", "upload"]
+PERCENTILES = [50, 95, 99]
+
+sys.path.insert(0, str(ROOT_DIR))
+
+from mock_llm_server import base_url, configure_knowledge_base, start_server  # noqa: E402
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, wall_seconds, errors):
+    latencies = sorted(latencies)
+    summary = {f"p{p}": round(percentile(latencies, p), 4) for p in PERCENTILES}
+    summary.update(
+        count=len(latencies),
+        errors=errors,
+        mean=round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+        max=round(latencies[-1], 4) if latencies else 0.0,
+        wall_seconds=round(wall_seconds, 4),
+        throughput_per_second=round(len(latencies) / wall_seconds, 3)
+        if wall_seconds else 0.0,
+    )
+    return summary
+
+
+class Bench:
+    """Prepared knowledge bases and one callable per operation"""
+
+    def __init__(self, work_dir, documents, document_bytes, llm_url=None):
+        import kb_core
+        import uploads
+
+        self.kb_core = kb_core
+        self.uploads = uploads
+        self.work_dir = Path(work_dir)
+        self.documents = documents
+        self.document_bytes = document_bytes
+        self.llm_url = llm_url
+        self.counter = itertools.count(1)
+        self.query_kb = self.new_kb("query")
+        if llm_url:
+            # A real graphrag needs an index to answer from
+            self.index_kb(self.query_kb, 0)
+
+    def new_kb(self, prefix):
+        kb_path = self.work_dir / f"{prefix}_{next(self.counter)}"
+        success, output = self.kb_core.init_knowledge_base(kb_path)
+        if not success:
+            raise RuntimeError(f"graphrag init failed: {output}")
+        if self.llm_url:
+            configure_knowledge_base(kb_path, self.llm_url)
+        return kb_path
+
+    def make_files(self, seed):
+        files = []
+        for number in range(self.documents):
+            data = (f"{seed}-{number} " * (self.document_bytes // 8 + 1)).encode()
+            f = io.BytesIO(data[:self.document_bytes])
+            f.name = f"doc_{number}.txt"
+            files.append(f)
+        return files
+
+    def query(self, i):
+        args = ["query", "--root", str(self.query_kb), "--method", "local",
+                "--query", f"benchmark question {i}"]
+        output = self.kb_core.run_graphrag_command(args, cwd=ROOT_DIR)
+        if not self.kb_core.parse_graphrag_response(output, "local"):
+            raise RuntimeError("No response in query output")
+
+    def index_kb(self, kb_path, seed):
+        self.uploads.save_uploads(kb_path, self.make_files(seed))
+        job = self.kb_core.start_indexing(kb_path)
+        while job.active:
+            time.sleep(0.01)
+        if job.status != "succeeded":
+            raise RuntimeError(f"Indexing job ended as {job.status}")
+
+    def index(self, i):
+        self.index_kb(self.new_kb("index"), i)
+
+    def init(self, i):
+        self.new_kb("init")
+
+    def upload(self, i):
+        kb_path = self.work_dir / f"upload_{i}_{time.monotonic_ns()}"
+        results = self.uploads.save_uploads(kb_path, self.make_files(i))
+        if any(r["status"] == "error" for r in results):
+            raise RuntimeError("Upload failed")
+
+
+def run_operation(bench, name, concurrency, iterations):
+    operation = getattr(bench, name)
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            operation(i)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, str(e)
+
+    start = time.perf_counter()
+    # kb_core echoes every command's output; keep it off the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, range(iterations)))
+    wall = time.perf_counter() - start
+    errors = [error for _latency, error in results if error]
+    if errors:
+        print(f"  {len(errors)} errors, first: {errors[0]}", file=sys.stderr)
+    return summarize([latency for latency, error in results if not error],
+                     wall, len(errors))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the p95 and throughput change of every operation against a baseline"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print(f"\nCompared with {baseline_path}:")
+    for name, levels in results.items():
+        for level, summary in levels.items():
+            before = baseline.get(name, {}).get(level)
+            if not before or not before["p95"] or not before["throughput_per_second"]:
+                continue
+            p95 = (summary["p95"] / before["p95"] - 1) * 100
+            throughput = (summary["throughput_per_second"]
+                          / before["throughput_per_second"] - 1) * 100
+            print(f"  {name:<7} c={level:<3} p95 {p95:+6.1f}%  "
+                  f"throughput {throughput:+6.1f}%")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", default=",".join(OPERATIONS),
+                        help="comma separated operations to run")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="comma separated concurrency levels")
+    parser.add_argument("--iterations", type=int, default=32,
+                        help="operations per concurrency level")
+    parser.add_argument("--delay", type=float, default=0.05,
+                        help="seconds the stub graphrag sleeps per command/workflow")
+    parser.add_argument("--output-bytes", type=int, default=2048,
+                        help="size of the stub's query response and workflow logs")
+    parser.add_argument("--documents", type=int, default=8,
+                        help="documents per upload/index operation")
+    parser.add_argument("--document-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--mock-llm", action="store_true",
+                        help="run the installed graphrag against the local mock LLM server")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="seconds the mock LLM server waits per chat completion")
+    parser.add_argument("--llm-rpm", type=int, default=0,
+                        help="requests per minute the mock LLM server allows (0: unlimited)")
+    parser.add_argument("--out", help="results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    operations = [op.strip() for op in args.ops.split(",") if op.strip()]
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        sys.exit(f"Unknown operations: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    llm_server = llm_url = None
+    if args.mock_llm:
+        llm_server = start_server(port=0, latency=args.llm_latency,
+                                  requests_per_minute=args.llm_rpm)
+        llm_url = base_url(llm_server)
+        print(f"Mock LLM server listening on {llm_url}")
+    else:
+        # graphrag is run as "python -m graphrag"; put the stub first on its path
+        os.environ["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [str(STUB_DIR), os.environ.get("PYTHONPATH")]))
+        os.environ["GRAPHRAG_STUB_DELAY"] = str(args.delay)
+        os.environ["GRAPHRAG_STUB_OUTPUT_BYTES"] = str(args.output_bytes)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="graphrag_bench_"))
+    try:
+        # Keep everything the benchmark writes out of the real folders; module
+        # state added to the code base that points at a real folder goes here
+        import index_estimate
+        import index_jobs
+        import index_profile
+        import job_spool
+        import kb_locks
+        import metrics
+        import near_duplicates
+        import query_cache
+        import run_logs
+        index_jobs.JOBS_DIR = work_dir / "jobs"
+        run_logs.RUN_LOG_DIR = work_dir / "command_logs"
+        metrics.METRICS_FILE = work_dir / "metrics.prom"
+        query_cache.CACHE_PATH = work_dir / "query_cache" / "queries.sqlite3"
+        index_profile.PROFILE_DIR = work_dir / "profiles"
+        index_estimate.CACHE_PATH = work_dir / "estimates" / "token_counts.sqlite3"
+        near_duplicates.CACHE_PATH = work_dir / "estimates" / "signatures.sqlite3"
+        kb_locks.LOCK_DIR = work_dir / "locks"
+        job_spool.SPOOL_DIR = work_dir / "spool"
+        # Live indexing workers must not pick up the benchmark's jobs
+        job_spool.INDEX_MODE = "local"
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            bench = Bench(work_dir, args.documents, args.document_bytes, llm_url)
+        results = {}
+        for name in operations:
+            results[name] = {}
+            for level in levels:
+                print(f"{name:<7} concurrency={level:<3}", end=" ", flush=True)
+                summary = run_operation(bench, name, level, args.iterations)
+                results[name][str(level)] = summary
+                print(f"p50={summary['p50']:.3f}s p95={summary['p95']:.3f}s "
+                      f"p99={summary['p99']:.3f}s "
+                      f"{summary['throughput_per_second']:.1f}/s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if llm_server:
+            llm_server.shutdown()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {key: value for key, value in vars(args).items()
+                       if key not in ("out", "compare")},
+        "results": results,
+    }
+    if llm_server:
+        report["mock_llm_requests"] = dict(llm_server.counts)
+    out_path = Path(args.out) if args.out else (
+        RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out_path}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Deterministic stand-in for graphrag used by the benchmark suite"""
@@ -0,0 +1,90 @@
+"""Stand-in for `python -m graphrag` with configurable delay and output size
+
+It understands the subcommands and options the web UI passes (init, index,
+update and query with --root/--method/--query) and prints the same success
+markers as graphrag, without importing anything or calling an LLM.
+
+Environment variables:
+    GRAPHRAG_STUB_DELAY         seconds each command (or workflow) sleeps, default 0.05
+    GRAPHRAG_STUB_OUTPUT_BYTES  size of the query response / per-workflow log, default 2048
+    GRAPHRAG_STUB_WORKFLOWS     number of index workflows, default 4
+"""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+DELAY = float(os.environ.get("GRAPHRAG_STUB_DELAY", "0.05"))
+OUTPUT_BYTES = int(os.environ.get("GRAPHRAG_STUB_OUTPUT_BYTES", "2048"))
+WORKFLOWS = int(os.environ.get("GRAPHRAG_STUB_WORKFLOWS", "4"))
+
+SEARCH_MARKERS = {
+    "local": "SUCCESS: Local Search Response:",
+    "global": "SUCCESS: Global Search Response:",
+    "drift": "SUCCESS: DRIFT Search Response:",
+}
+
+
+def option(args, name, default=None):
+    if name in args:
+        return args[args.index(name) + 1]
+    return default
+
+
+def filler(size, seed):
+    """Deterministic text of the given size"""
+    line = f"{seed} lorem ipsum dolor sit amet consectetur adipiscing elit\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def init(args):
+    root = Path(option(args, "--root", "."))
+    print(f"Initializing project at {root}")
+    (root / "input").mkdir(parents=True, exist_ok=True)
+    (root / "prompts").mkdir(exist_ok=True)
+    (root / ".env").write_text("GRAPHRAG_API_KEY=stub\n", encoding="utf-8")
+    (root / "settings.yaml").write_text(
+        "chunks:\n  size: 1200\n  overlap: 100\n", encoding="utf-8")
+    time.sleep(DELAY)
+
+
+def index(args):
+    root = Path(option(args, "--root", "."))
+    output = Path(option(args, "--output", root / "output"))
+    output.mkdir(parents=True, exist_ok=True)
+    stats = {"total_runtime": 0.0, "workflows": {}}
+    for number in range(WORKFLOWS):
+        name = f"stub_workflow_{number}"
+        print(f"Running workflow: {name}...", flush=True)
+        start = time.perf_counter()
+        time.sleep(DELAY)
+        print(filler(OUTPUT_BYTES, name), end="")
+        print(f"🚀 {name}", flush=True)
+        elapsed = time.perf_counter() - start
+        stats["workflows"][name] = {"overall": elapsed}
+        stats["total_runtime"] += elapsed
+    (output / "stats.json").write_text(json.dumps(stats), encoding="utf-8")
+    print("🚀 All workflows completed successfully.")
+
+
+def query(args):
+    method = option(args, "--method", "local").lower()
+    question = option(args, "--query", "")
+    time.sleep(DELAY)
+    print("INFO: Reading settings from settings.yaml")
+    print(SEARCH_MARKERS.get(method, SEARCH_MARKERS["local"]))
+    print(filler(OUTPUT_BYTES, question))
+
+
+def main(args):
+    commands = {"init": init, "index": index, "update": index, "query": query}
+    if not args or args[0] not in commands:
+        print(f"Unknown command: {args[:1]}")
+        return 2
+    commands[args[0]](args[1:])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
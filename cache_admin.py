@@ -0,0 +1,180 @@
+"""Disk usage and selective cleanup of a knowledge base's generated folders
+
+graphrag's LLM response cache (cache/) is what makes re-runs cheap, so it is
+pruned down to a byte budget instead of being deleted wholesale. Clearing,
+pruning and deduplicating hold the knowledge base's exclusive lock, so they
+wait for running builds and queries and raise kb_locks.KBBusyError if the
+knowledge base stays in use.
+"""
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+
+from kb_locks import LOCK_TIMEOUT, writing
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_DIR = "cache"
+OUTPUT_DIR = "output"
+LOGS_DIR = "logs"
+STORAGE_DIRS = [LLM_CACHE_DIR, OUTPUT_DIR, LOGS_DIR]
+
+
+def _walk_files(path):
+    """Yield (path, stat) for every regular file below path"""
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            file_path = Path(root) / name
+            try:
+                yield file_path, file_path.stat()
+            except OSError:
+                continue
+
+
+def dir_size(path):
+    """Return (bytes, files) of a directory, counting hard-linked files once"""
+    total, count, seen = 0, 0, set()
+    for _path, stat in _walk_files(path):
+        count += 1
+        inode = (stat.st_dev, stat.st_ino)
+        if inode in seen:
+            continue
+        seen.add(inode)
+        total += stat.st_size
+    return total, count
+
+
+def storage_usage(kb_path):
+    """Disk usage of the cache, output and logs folders of a knowledge base"""
+    kb_path = Path(kb_path)
+    return {name: dir_size(kb_path / name) for name in STORAGE_DIRS}
+
+
+def llm_cache_breakdown(kb_path):
+    """Disk usage of the LLM cache per graphrag workflow"""
+    cache_path = Path(kb_path) / LLM_CACHE_DIR
+    if not cache_path.is_dir():
+        return {}
+    usage = {}
+    for entry in sorted(cache_path.iterdir()):
+        if entry.is_dir():
+            usage[entry.name] = dir_size(entry)
+        else:
+            bytes_, files = usage.get(".", (0, 0))
+            usage["."] = (bytes_ + entry.stat().st_size, files + 1)
+    return usage
+
+
+def clear_dir(kb_path, name):
+    """Delete one of the generated folders (output or logs) of a knowledge base"""
+    if name not in (OUTPUT_DIR, LOGS_DIR):
+        raise ValueError(f"Refusing to clear '{name}'")
+    path = Path(kb_path) / name
+    with writing(kb_path, timeout=LOCK_TIMEOUT):
+        if path.is_symlink():
+            path.unlink()  # A versioned output; the versions are left to index_versions
+            logger.info(f"Removed link: {path}")
+        elif path.is_dir():
+            shutil.rmtree(path)
+            logger.info(f"Deleted directory: {path}")
+
+
+def prune_llm_cache(kb_path, max_bytes):
+    """Delete least recently used LLM cache entries until the cache fits max_bytes
+
+    Recency is the later of access and modification time, since many file
+    systems only update access times lazily. Returns (removed files, freed bytes).
+    """
+    with writing(kb_path, timeout=LOCK_TIMEOUT):
+        return _prune_llm_cache(kb_path, max_bytes)
+
+
+def _prune_llm_cache(kb_path, max_bytes):
+    cache_path = Path(kb_path) / LLM_CACHE_DIR
+    entries, seen, total = [], {}, 0
+    for path, stat in _walk_files(cache_path):
+        inode = (stat.st_dev, stat.st_ino)
+        # Hard-linked duplicates share their space; it is only freed with the last link
+        seen.setdefault(inode, []).append(path)
+        if len(seen[inode]) == 1:
+            total += stat.st_size
+        entries.append((max(stat.st_atime, stat.st_mtime), path, stat.st_size, inode))
+    entries.sort()
+    removed, freed = 0, 0
+    for _last_used, path, size, inode in entries:
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.error(f"Error deleting {path}: {e}")
+            continue
+        removed += 1
+        seen[inode].remove(path)
+        if not seen[inode]:
+            total -= size
+            freed += size
+    logger.info(f"Pruned {removed} LLM cache entries ({freed} bytes) in {cache_path}")
+    return removed, freed
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dedupe_llm_cache(kb_path):
+    """Replace byte-identical LLM cache entries with hard links to one copy
+
+    Files are grouped by size first so only candidates are hashed.
+    Returns (linked files, saved bytes).
+    """
+    with writing(kb_path, timeout=LOCK_TIMEOUT):
+        return _dedupe_llm_cache(kb_path)
+
+
+def _dedupe_llm_cache(kb_path):
+    cache_path = Path(kb_path) / LLM_CACHE_DIR
+    by_size = {}
+    for path, stat in _walk_files(cache_path):
+        by_size.setdefault(stat.st_size, []).append((path, stat))
+    linked, saved = 0, 0
+    for size, files in by_size.items():
+        if len(files) < 2 or size == 0:
+            continue
+        originals = {}
+        for path, stat in files:
+            try:
+                digest = _file_hash(path)
+            except OSError:
+                continue
+            original = originals.setdefault(digest, (path, stat))
+            if original[0] == path:
+                continue
+            if (original[1].st_dev, original[1].st_ino) == (stat.st_dev, stat.st_ino):
+                continue  # Already linked
+            tmp_path = path.with_name(path.name + ".dedupe")
+            try:
+                os.link(original[0], tmp_path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not deduplicate {path}: {e}")
+                tmp_path.unlink(missing_ok=True)
+                continue
+            linked += 1
+            saved += size
+    logger.info(f"Deduplicated {linked} LLM cache entries ({saved} bytes) in {cache_path}")
+    return linked, saved
+
+
+def format_bytes(size):
+    """Human readable size, e.g. '1.5 MB'"""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
@@ -0,0 +1,77 @@
+"""One question answered by several knowledge bases at once
+
+Every knowledge base is queried on its own thread through the same path as
+the single question flow (kb_core.answer_query), each with its own timeout,
+and results are yielded as they finish. The total latency is that of the
+slowest knowledge base instead of the sum of all of them.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from kb_core import answer_query
+
+logger = logging.getLogger(__name__)
+
+MAX_PARALLELISM = 8
+DEFAULT_TIMEOUT = 300
+
+
+def _query_one(kb_path, method, query, cwd, timeout):
+    result = {"knowledge_base": Path(kb_path).name, "status": "ok", "answer": "",
+              "latency_seconds": 0.0, "error": ""}
+    start = time.perf_counter()
+    try:
+        response, _output = answer_query(kb_path, method, query, cwd=cwd,
+                                         timeout=timeout)
+        if response:
+            result["answer"] = response
+        else:
+            result["status"] = "no_response"
+    except TimeoutError as e:
+        result.update(status="timeout", error=str(e))
+    except Exception as e:
+        logger.error(f"Query of '{result['knowledge_base']}' failed: {e}")
+        result.update(status="error", error=str(e))
+    result["latency_seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def query_knowledge_bases(kb_paths, method, query, cwd, timeout=DEFAULT_TIMEOUT,
+                          parallelism=MAX_PARALLELISM):
+    """Ask every knowledge base the same question; yield each result when it finishes
+
+    Results are dicts with the keys knowledge_base, status ('ok',
+    'no_response', 'timeout' or 'error'), answer, latency_seconds and error.
+    """
+    kb_paths = list(kb_paths)
+    if not kb_paths:
+        return
+    parallelism = max(1, min(int(parallelism), MAX_PARALLELISM, len(kb_paths)))
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = [executor.submit(_query_one, kb_path, method, query, cwd, timeout)
+                   for kb_path in kb_paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def merge_answers(results, order=None):
+    """Combine the answers into one Markdown document with a section per knowledge base
+
+    order lists knowledge base names; by default sections follow the results.
+    """
+    by_name = {result["knowledge_base"]: result for result in results}
+    sections = []
+    for name in order or list(by_name):
+        result = by_name.get(name)
+        if result is None:
+            continue
+        if result["status"] == "ok":
+            body = result["answer"]
+        elif result["status"] == "no_response":
+            body = "_No answer found._"
+        else:
+            body = f"_{result['status']}: {result['error']}_"
+        sections.append(f"### {name}\n\n{body}")
+    return "\n\n".join(sections)
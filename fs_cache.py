@@ -0,0 +1,141 @@
+"""Directory listings and small file reads cached on their modification time
+
+Streamlit re-runs the whole script on every interaction, so listing the
+knowledge bases, globbing input/ and reading .env/settings.yaml would
+otherwise hit the file system on each click. Cached results are reused while
+the path's modification time, size and inode are unchanged.
+
+Like git's "racily clean" check, a result is not trusted while the path was
+modified within the last RACY_SECONDS, because a second change inside the same
+timestamp tick would not change the modification time.
+"""
+import fnmatch
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+MAX_ENTRIES = 256
+RACY_SECONDS = 2.0
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class StatCache:
+    """LRU cache of values computed from a path, validated by its stat signature"""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind, path, loader):
+        """Return loader(path), recomputed only when the path changed"""
+        key = (kind, str(path))
+        signature = _signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature and signature is not None:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = loader(path)
+        racy = signature is not None and time.time() - signature[0] / 1e9 < RACY_SECONDS
+        with self._lock:
+            if racy:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = (signature, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, path=None):
+        """Forget the cached values of a path, or of every path"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[1] == str(path)]:
+                del self._entries[key]
+
+
+_cache = StatCache()
+
+
+def _scan_dirs(path):
+    try:
+        with os.scandir(path) as entries:
+            return tuple(sorted(entry.name for entry in entries if entry.is_dir()))
+    except FileNotFoundError:
+        return ()
+
+
+def _scan_files(path, pattern):
+    try:
+        with os.scandir(path) as entries:
+            return tuple(sorted(entry.name for entry in entries
+                                if fnmatch.fnmatch(entry.name, pattern) and entry.is_file()))
+    except FileNotFoundError:
+        return ()
+
+
+def _read_text(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+def list_dirs(path):
+    """Sorted names of the sub-directories of path"""
+    return _cache.get("dirs", path, _scan_dirs)
+
+
+def list_files(path, pattern="*.txt"):
+    """Sorted names of the files in path matching a glob pattern"""
+    return _cache.get(f"files:{pattern}", path, lambda p: _scan_files(p, pattern))
+
+
+def read_text(path):
+    """Content of a UTF-8 text file, or an empty string if it does not exist"""
+    return _cache.get("text", path, _read_text)
+
+
+def invalidate(path=None):
+    _cache.invalidate(path)
+
+
+def filter_names(names, query):
+    """Names containing query, case-insensitively"""
+    if not query:
+        return list(names)
+    needle = query.casefold()
+    return [name for name in names if needle in name.casefold()]
+
+
+def paginate(names, page, page_size):
+    """Return (names on the page, clamped page number, number of pages)"""
+    pages = max(1, -(-len(names) // page_size))
+    page = min(max(1, int(page)), pages)
+    start = (page - 1) * page_size
+    return list(names[start:start + page_size]), page, pages
+
+
+def file_sizes(path, names):
+    """Sizes of the given files in path; missing files are left out"""
+    sizes = {}
+    for name in names:
+        try:
+            sizes[name] = (Path(path) / name).stat().st_size
+        except OSError:
+            continue
+    return sizes
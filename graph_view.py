@@ -0,0 +1,388 @@
+"""Level-of-detail views of a knowledge base's entity graph
+
+The entity and relationship artifacts are loaded once per index fingerprint
+into integer edge arrays, and a layout of the whole graph is computed with
+vectorized NumPy: communities are placed by a force-directed layout of the
+community graph and their members on a sunflower spiral around the
+community's center, highest degree first. Views (top-degree nodes, a
+community summary, expanded neighborhoods) only ever select from the cached
+graph, so the payload sent to the browser is bounded by MAX_NODES and
+MAX_EDGES however large the graph is, and nodes keep their position as the
+view is expanded.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from kb_artifacts import index_fingerprint, list_artifacts
+
+logger = logging.getLogger(__name__)
+
+MAX_NODES = 400
+MAX_EDGES = 2000
+# Pairwise repulsion is O(n^2), so only this many groups get a force layout
+MAX_FORCE_NODES = 600
+LAYOUT_ITERATIONS = 60
+CACHED_GRAPHS = 4
+GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+
+
+class GraphError(Exception):
+    """Raised when a knowledge base has no usable graph artifacts"""
+
+
+def _read_columns(path, wanted):
+    """Read the first available column of each alternative list in wanted"""
+    names = set(pq.ParquetFile(path, memory_map=True).schema_arrow.names)
+    picked = {}
+    for key, candidates in wanted.items():
+        picked[key] = next((name for name in candidates if name in names), None)
+    columns = sorted({name for name in picked.values() if name})
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return {key: table.column(name) if name else None for key, name in picked.items()}
+
+
+def force_layout(count, src, dst, weight=None, iterations=LAYOUT_ITERATIONS, seed=0):
+    """Fruchterman-Reingold layout of a small graph, returns (count, 2) positions"""
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(-1, 1, (count, 2))
+    if count < 2:
+        return np.zeros((count, 2))
+    weight = np.ones(len(src)) if weight is None else np.asarray(weight, float)
+    weight = weight / (weight.max() or 1.0)
+    k = np.sqrt(4.0 / count)
+    temperature = 0.2
+    for _ in range(iterations):
+        delta = pos[:, None, :] - pos[None, :, :]
+        distance = np.maximum(np.linalg.norm(delta, axis=-1), 1e-3)
+        displacement = ((k * k / distance ** 2)[:, :, None] * delta).sum(axis=1)
+        edge_delta = pos[src] - pos[dst]
+        edge_distance = np.maximum(np.linalg.norm(edge_delta, axis=-1), 1e-3)
+        pull = (edge_distance * weight / k)[:, None] * edge_delta
+        np.subtract.at(displacement, src, pull)
+        np.add.at(displacement, dst, pull)
+        length = np.maximum(np.linalg.norm(displacement, axis=-1), 1e-9)
+        pos += displacement / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature *= 0.95
+    pos -= pos.mean(axis=0)
+    return pos / (np.abs(pos).max() or 1.0)
+
+
+class KnowledgeGraph:
+    """Entity graph of one index, as NumPy arrays with a precomputed layout"""
+
+    def __init__(self, names, types, src, dst, weight, community, community_titles):
+        self.names = names
+        self.types = types
+        self.src = src
+        self.dst = dst
+        self.weight = weight
+        self.community = community
+        self.community_titles = community_titles
+        count = len(names)
+        self.index = {name: i for i, name in enumerate(names)}
+        self.degree = np.bincount(np.concatenate([src, dst]), minlength=count)
+        # CSR adjacency over both edge directions for neighborhood lookups
+        ends = np.concatenate([src, dst])
+        others = np.concatenate([dst, src])
+        order = np.argsort(ends, kind="stable")
+        self.neighbors = others[order]
+        self.offsets = np.searchsorted(ends[order], np.arange(count + 1))
+        self.positions, self.community_positions = self._layout()
+
+    def _layout(self):
+        count = len(self.names)
+        positions = np.zeros((count, 2))
+        if count == 0:
+            return positions, {}
+        # Groups are communities; nodes without one form their own group
+        groups = np.where(self.community >= 0, self.community, -1)
+        group_ids, group_of = np.unique(groups, return_inverse=True)
+        sizes = np.bincount(group_of, minlength=len(group_ids))
+        if group_ids[-1] < 0:
+            return self._layout_without_communities(), {}
+        # Force layout of the largest groups, weighted by the edges between them
+        ranked = np.argsort(-sizes, kind="stable")
+        placed = ranked[:MAX_FORCE_NODES]
+        slot = np.full(len(group_ids), -1)
+        slot[placed] = np.arange(len(placed))
+        gs, gd = slot[group_of[self.src]], slot[group_of[self.dst]]
+        between = (gs >= 0) & (gd >= 0) & (gs != gd)
+        centers = np.zeros((len(group_ids), 2))
+        centers[placed] = force_layout(len(placed), gs[between], gd[between])
+        # Remaining (small) groups go on an outer ring
+        rest = ranked[MAX_FORCE_NODES:]
+        angle = np.linspace(0, 2 * np.pi, len(rest), endpoint=False)
+        centers[rest] = 1.3 * np.column_stack([np.cos(angle), np.sin(angle)])
+        radius = 0.6 * np.sqrt(sizes / sizes.max()) * np.sqrt(4.0 / len(placed))
+        # Members spiral out from the center, highest degree first
+        order = np.lexsort((-self.degree, group_of))
+        start = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        rank = np.arange(count) - start[group_of[order]]
+        r = radius[group_of[order]] * np.sqrt((rank + 0.5) / sizes[group_of[order]])
+        theta = rank * GOLDEN_ANGLE
+        positions[order] = centers[group_of[order]] + np.column_stack(
+            [r * np.cos(theta), r * np.sin(theta)])
+        community_positions = {int(g): centers[i] for i, g in enumerate(group_ids) if g >= 0}
+        return positions, community_positions
+
+    def _layout_without_communities(self):
+        """Force layout of the top-degree nodes, the rest on a ring around them"""
+        count = len(self.names)
+        positions = np.zeros((count, 2))
+        ranked = np.argsort(-self.degree, kind="stable")
+        top, rest = ranked[:MAX_FORCE_NODES], ranked[MAX_FORCE_NODES:]
+        slot = np.full(count, -1)
+        slot[top] = np.arange(len(top))
+        inside = (slot[self.src] >= 0) & (slot[self.dst] >= 0)
+        positions[top] = force_layout(len(top), slot[self.src[inside]],
+                                      slot[self.dst[inside]], self.weight[inside])
+        # Lower degree nodes fill an annulus, the least connected outermost
+        fraction = (np.arange(len(rest)) + 0.5) / max(len(rest), 1)
+        r = np.sqrt(1.2 ** 2 + fraction * (1.8 ** 2 - 1.2 ** 2))
+        theta = np.arange(len(rest)) * GOLDEN_ANGLE
+        positions[rest] = np.column_stack([r * np.cos(theta), r * np.sin(theta)])
+        return positions
+
+    def _payload(self, nodes, highlight=()):
+        """Nodes and the heaviest edges among them, as plain lists"""
+        nodes = np.asarray(sorted(set(int(n) for n in nodes)), dtype=np.int64)
+        if len(nodes) > MAX_NODES:
+            # Keep the focused nodes, then the best connected ones
+            focused = np.isin(nodes, list(highlight))
+            nodes = nodes[np.lexsort((-self.degree[nodes], ~focused))[:MAX_NODES]]
+        selected = np.zeros(len(self.names), bool)
+        selected[nodes] = True
+        edges = np.flatnonzero(selected[self.src] & selected[self.dst])
+        if len(edges) > MAX_EDGES:
+            edges = edges[np.argsort(-self.weight[edges], kind="stable")[:MAX_EDGES]]
+        highlight = set(highlight)
+        node_rows = [{
+            "id": int(i), "name": self.names[i],
+            "type": self.types[i] if self.types is not None else "",
+            "degree": int(self.degree[i]),
+            "community": int(self.community[i]),
+            "x": float(self.positions[i, 0]), "y": float(self.positions[i, 1]),
+            "focus": i in highlight,
+        } for i in nodes]
+        edge_rows = [{
+            "source": self.names[self.src[e]], "target": self.names[self.dst[e]],
+            "weight": float(self.weight[e]),
+            "x": float(self.positions[self.src[e], 0]), "y": float(self.positions[self.src[e], 1]),
+            "x2": float(self.positions[self.dst[e], 0]), "y2": float(self.positions[self.dst[e], 1]),
+        } for e in edges]
+        return {"nodes": node_rows, "edges": edge_rows,
+                "total_nodes": len(self.names), "total_edges": len(self.src)}
+
+    def top_nodes(self, count=100):
+        """The highest-degree nodes and the edges among them"""
+        count = min(count, MAX_NODES)
+        return self._payload(np.argsort(-self.degree, kind="stable")[:count])
+
+    def neighborhood(self, names, base=(), limit=50):
+        """base nodes plus up to limit highest-degree neighbors of each named node"""
+        nodes, focus = set(int(i) for i in base), []
+        for name in names:
+            i = self.index.get(name)
+            if i is None:
+                continue
+            focus.append(i)
+            neighbors = np.unique(self.neighbors[self.offsets[i]:self.offsets[i + 1]])
+            neighbors = neighbors[np.argsort(-self.degree[neighbors], kind="stable")][:limit]
+            nodes.add(i)
+            nodes.update(int(n) for n in neighbors)
+        return self._payload(nodes, highlight=focus)
+
+    def community_summary(self, count=100):
+        """The largest communities as nodes, linked by their inter-community edges"""
+        members = self.community >= 0
+        if not members.any():
+            return None
+        ids, sizes = np.unique(self.community[members], return_counts=True)
+        top = ids[np.argsort(-sizes, kind="stable")[:min(count, MAX_NODES)]]
+        size_of = dict(zip(ids.tolist(), sizes.tolist()))
+        slot = {int(c): i for i, c in enumerate(top)}
+        cs, cd = self.community[self.src], self.community[self.dst]
+        keep = np.isin(cs, top) & np.isin(cd, top) & (cs != cd)
+        pairs = np.stack([np.minimum(cs[keep], cd[keep]), np.maximum(cs[keep], cd[keep])], axis=1)
+        links, counts = (np.unique(pairs, axis=0, return_counts=True) if len(pairs)
+                         else (np.zeros((0, 2), int), np.zeros(0, int)))
+        strongest = np.argsort(-counts, kind="stable")[:MAX_EDGES]
+        node_rows = [{
+            "id": int(c), "name": self.community_titles.get(int(c), f"Community {int(c)}"),
+            "type": "community", "degree": int(size_of[int(c)]), "community": int(c),
+            "x": float(self.community_positions[int(c)][0]),
+            "y": float(self.community_positions[int(c)][1]), "focus": False,
+        } for c in top]
+        edge_rows = []
+        for e in strongest:
+            a, b = int(links[e, 0]), int(links[e, 1])
+            first, second = node_rows[slot[a]], node_rows[slot[b]]
+            edge_rows.append({"source": first["name"], "target": second["name"],
+                              "weight": float(counts[e]),
+                              "x": first["x"], "y": first["y"],
+                              "x2": second["x"], "y2": second["y"]})
+        return {"nodes": node_rows, "edges": edge_rows,
+                "total_nodes": len(ids), "total_edges": int(keep.sum())}
+
+    def members(self, community, limit=MAX_NODES):
+        """The highest-degree entities of one community"""
+        nodes = np.flatnonzero(self.community == community)
+        return nodes[np.argsort(-self.degree[nodes], kind="stable")][:limit]
+
+
+def _load_communities(artifacts, entity_ids, names):
+    """Community per node at the coarsest level, and community titles"""
+    community = np.full(len(names), -1, dtype=np.int64)
+    titles = {}
+    if "communities" in artifacts:
+        cols = _read_columns(artifacts["communities"], {
+            "community": ["community", "id"], "level": ["level"],
+            "entity_ids": ["entity_ids"], "title": ["title"]})
+        if cols["entity_ids"] is not None and entity_ids is not None:
+            level = cols["level"].to_numpy() if cols["level"] is not None else None
+            # Coarsest level first; finer levels never overwrite an assignment
+            order = np.argsort(level, kind="stable") if level is not None else range(
+                len(cols["community"]))
+            id_index = {value: i for i, value in enumerate(entity_ids)}
+            communities = cols["community"].to_pylist()
+            members = cols["entity_ids"].to_pylist()
+            top_level = level[order[0]] if level is not None and len(level) else None
+            for row in order:
+                if level is not None and level[row] != top_level:
+                    break
+                for entity in members[row] or []:
+                    node = id_index.get(entity)
+                    if node is not None and community[node] < 0:
+                        community[node] = int(communities[row])
+    if (community < 0).all() and "nodes" in artifacts:
+        # Older releases store the community of every node in the nodes table
+        cols = _read_columns(artifacts["nodes"], {
+            "title": ["title", "name"], "community": ["community"], "level": ["level"]})
+        if cols["title"] is not None and cols["community"] is not None:
+            level = cols["level"].to_numpy() if cols["level"] is not None else None
+            keep = level == level.min() if level is not None and len(level) else None
+            index = {name: i for i, name in enumerate(names)}
+            for i, (title, value) in enumerate(zip(cols["title"].to_pylist(),
+                                                   cols["community"].to_pylist())):
+                if (keep is None or keep[i]) and title in index and value is not None:
+                    community[index[title]] = int(value)
+    if "community_reports" in artifacts:
+        cols = _read_columns(artifacts["community_reports"], {
+            "community": ["community"], "title": ["title"]})
+        if cols["community"] is not None and cols["title"] is not None:
+            for value, title in zip(cols["community"].to_pylist(), cols["title"].to_pylist()):
+                if value is not None and title:
+                    titles[int(value)] = title
+    return community, titles
+
+
+def _as_strings(column):
+    return pc.cast(column, pa.string()).combine_chunks()
+
+
+def load_graph(kb_path):
+    """Build the KnowledgeGraph of a knowledge base from its parquet artifacts"""
+    artifacts = list_artifacts(kb_path)
+    if "relationships" not in artifacts:
+        raise GraphError("The knowledge base has no relationships artifact. Index it first.")
+    rel = _read_columns(artifacts["relationships"], {
+        "source": ["source"], "target": ["target"], "weight": ["weight"]})
+    if rel["source"] is None or rel["target"] is None:
+        raise GraphError("The relationships artifact has no source/target columns")
+    ent = {"title": None, "id": None, "type": None}
+    if "entities" in artifacts:
+        ent = _read_columns(artifacts["entities"], {
+            "title": ["title", "name"], "id": ["id"], "type": ["type"]})
+    sources, targets = _as_strings(rel["source"]), _as_strings(rel["target"])
+    # Entity titles and relationship ends share one dictionary of node ids
+    known = [sources, targets]
+    if ent["title"] is not None:
+        known.insert(0, _as_strings(ent["title"]))
+    names = pc.unique(pc.drop_null(pa.concat_arrays(known)))
+    src = pc.index_in(sources, value_set=names)
+    dst = pc.index_in(targets, value_set=names)
+    valid = pc.and_(pc.is_valid(src), pc.is_valid(dst))
+    src = src.filter(valid).to_numpy().astype(np.int64)
+    dst = dst.filter(valid).to_numpy().astype(np.int64)
+    if rel["weight"] is not None:
+        weight = pc.cast(rel["weight"].combine_chunks().filter(valid), pa.float64())
+        weight = np.nan_to_num(weight.to_numpy(zero_copy_only=False), nan=1.0)
+    else:
+        weight = np.ones(len(src))
+    names = names.to_pylist()
+    if not names:
+        raise GraphError("The index has no entities or relationships to draw.")
+    node_types, entity_ids = None, None
+    if ent["title"] is not None:
+        position = {name: i for i, name in enumerate(names)}
+        titles = ent["title"].to_pylist()
+        if ent["type"] is not None:
+            node_types = [""] * len(names)
+            for title, kind in zip(titles, ent["type"].to_pylist()):
+                if title in position:
+                    node_types[position[title]] = kind or ""
+        if ent["id"] is not None:
+            # Communities reference entities by id
+            entity_ids = [None] * len(names)
+            for title, entity_id in zip(titles, ent["id"].to_pylist()):
+                if title in position:
+                    entity_ids[position[title]] = entity_id
+    community, community_titles = _load_communities(artifacts, entity_ids, names)
+    return KnowledgeGraph(names, node_types, src, dst, weight, community, community_titles)
+
+
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()
+
+
+def get_graph(kb_path):
+    """Return the cached KnowledgeGraph of a knowledge base, rebuilt when its index changes"""
+    key = (str(kb_path), index_fingerprint(kb_path))
+    with _graphs_lock:
+        graph = _graphs.get(key)
+        if graph is not None:
+            _graphs.move_to_end(key)
+            return graph
+    graph = load_graph(kb_path)
+    logger.info(f"Loaded graph of '{kb_path}' with {len(graph.names)} nodes "
+                f"and {len(graph.src)} edges")
+    with _graphs_lock:
+        _graphs[key] = graph
+        while len(_graphs) > CACHED_GRAPHS:
+            _graphs.popitem(last=False)
+    return graph
+
+
+def vega_lite_spec(payload, height=600):
+    """Vega-Lite spec drawing the payload's edges as rules and nodes as circles"""
+    return {
+        "height": height,
+        "layer": [
+            {"data": {"values": payload["edges"]},
+             "mark": {"type": "rule", "opacity": 0.25},
+             "encoding": {
+                 "x": {"field": "x", "type": "quantitative", "axis": None},
+                 "y": {"field": "y", "type": "quantitative", "axis": None},
+                 "x2": {"field": "x2"}, "y2": {"field": "y2"},
+                 "strokeWidth": {"field": "weight", "type": "quantitative",
+                                 "scale": {"range": [0.5, 3]}, "legend": None}}},
+            {"data": {"values": payload["nodes"]},
+             "mark": {"type": "circle", "opacity": 0.85, "stroke": "black"},
+             "encoding": {
+                 "x": {"field": "x", "type": "quantitative", "axis": None},
+                 "y": {"field": "y", "type": "quantitative", "axis": None},
+                 "size": {"field": "degree", "type": "quantitative",
+                          "scale": {"range": [20, 600]}, "legend": None},
+                 "color": {"field": "community", "type": "nominal", "legend": None},
+                 "strokeWidth": {"condition": {"test": "datum.focus", "value": 2},
+                                 "value": 0},
+                 "tooltip": [{"field": "name"}, {"field": "type"},
+                             {"field": "degree"}, {"field": "community"}]}},
+        ],
+    }
@@ -0,0 +1,375 @@
+"""Indexing cost and time estimates from a tokenized input corpus
+
+Every input document is tokenized with the encoding graphrag chunks with,
+streamed in blocks so large files never sit in memory whole, on a process
+pool so big corpora use every core. Token counts are cached by the file's
+content hash (from the input manifest), so re-estimating after adding a few
+documents only tokenizes those.
+
+From the token counts and the knowledge base's settings.yaml (chunking,
+gleanings, claim extraction, models, concurrency and rate limits) the
+estimate derives the chunk count, the LLM and embedding calls and a rough
+wall time. Chunks and extraction calls follow graphrag's pipeline exactly;
+entity, summary and community report counts depend on the content and use
+the typical ratios below.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
+import yaml
+
+from input_manifest import (BYTES_PER_TOKEN, DEFAULT_CHUNK_OVERLAP,
+                            DEFAULT_CHUNK_SIZE, InputManifest, estimate_chunks)
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = Path(__file__).parent.resolve() / "estimates" / "token_counts.sqlite3"
+READ_BLOCK_CHARS = 1024 * 1024
+MAX_PROCESSES = os.cpu_count() or 1
+# Below this much uncached text, starting worker processes costs more than it saves
+POOL_MIN_BYTES = 4 * 1024 * 1024
+
+# graphrag's defaults when settings.yaml leaves a value out
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_MAX_GLEANINGS = 1
+DEFAULT_CONCURRENCY = 25
+DEFAULT_EMBEDDING_BATCH_SIZE = 16
+DEFAULT_EMBEDDING_BATCH_TOKENS = 8191
+
+# Typical ratios of a graphrag run; the real numbers depend on the content
+ENTITIES_PER_CHUNK = 4
+SUMMARIZED_ENTITY_SHARE = 0.3
+ENTITIES_PER_COMMUNITY = 5
+EXTRACTION_PROMPT_TOKENS = 2000
+SUMMARY_PROMPT_TOKENS = 500
+REPORT_PROMPT_TOKENS = 4000
+DESCRIPTION_TOKENS = 60
+REPORT_TOKENS = 1000
+LLM_CALL_SECONDS = float(os.environ.get("GRAPHRAG_ESTIMATE_LLM_SECONDS", "8"))
+EMBEDDING_CALL_SECONDS = float(os.environ.get("GRAPHRAG_ESTIMATE_EMBEDDING_SECONDS", "1"))
+
+
+# ---------------------------------------------------------------------------
+# Settings
+# ---------------------------------------------------------------------------
+
+def _section(settings, *path):
+    for name in path:
+        settings = settings.get(name) if isinstance(settings, dict) else None
+    return settings if isinstance(settings, dict) else {}
+
+
+def _number(value, default, kind=int):
+    """A setting as a number; unset, "auto" or ${ENV} placeholders give the default"""
+    try:
+        return kind(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _first(*values):
+    return next((value for value in values if value not in (None, "")), None)
+
+
+def read_index_settings(kb_path):
+    """The settings.yaml values the estimate depends on
+
+    Understands both the flat `llm:`/`embeddings.llm:` layout of graphrag 0.x
+    and the `models:` layout of graphrag 1.x and newer.
+    """
+    try:
+        with open(Path(kb_path) / "settings.yaml", "r", encoding="utf-8") as f:
+            settings = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError):
+        settings = {}
+    if not isinstance(settings, dict):
+        settings = {}
+    chat = _section(settings, "models", "default_chat_model") or _section(settings, "llm")
+    embedding = (_section(settings, "models", "default_embedding_model")
+                 or _section(settings, "embeddings", "llm"))
+    chunks = _section(settings, "chunks")
+    extraction = _section(settings, "extract_graph") or _section(settings, "entity_extraction")
+    claims = _section(settings, "extract_claims") or _section(settings, "claim_extraction")
+    embed = _section(settings, "embed_text") or _section(settings, "embeddings")
+    encoding = _first(chunks.get("encoding_model"), settings.get("encoding_model"),
+                      chat.get("encoding_model"))
+    return {
+        "chunk_size": _number(chunks.get("size"), DEFAULT_CHUNK_SIZE),
+        "chunk_overlap": _number(chunks.get("overlap"), DEFAULT_CHUNK_OVERLAP),
+        "encoding": encoding if isinstance(encoding, str) else DEFAULT_ENCODING,
+        "model": str(chat.get("model") or "unknown"),
+        "embedding_model": str(embedding.get("model") or "unknown"),
+        "max_gleanings": _number(extraction.get("max_gleanings"), DEFAULT_MAX_GLEANINGS),
+        "claims": bool(claims.get("enabled", False)),
+        "claim_gleanings": _number(claims.get("max_gleanings"), DEFAULT_MAX_GLEANINGS),
+        "concurrency": max(1, _number(chat.get("concurrent_requests"), DEFAULT_CONCURRENCY)),
+        "requests_per_minute": _number(chat.get("requests_per_minute"), 0),
+        "tokens_per_minute": _number(chat.get("tokens_per_minute"), 0),
+        "embedding_concurrency": max(1, _number(embedding.get("concurrent_requests"),
+                                                DEFAULT_CONCURRENCY)),
+        "embedding_batch_size": max(1, _number(embed.get("batch_size"),
+                                               DEFAULT_EMBEDDING_BATCH_SIZE)),
+        "embedding_batch_tokens": max(1, _number(embed.get("batch_max_tokens"),
+                                                 DEFAULT_EMBEDDING_BATCH_TOKENS)),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Tokenization
+# ---------------------------------------------------------------------------
+
+_encodings = {}
+
+
+def _get_encoding(name):
+    """The tiktoken encoding, or None when tiktoken or the encoding is unavailable"""
+    if name not in _encodings:
+        try:
+            import tiktoken
+            _encodings[name] = tiktoken.get_encoding(name)
+        except Exception as e:  # Not installed, unknown name or no network for the BPE file
+            logger.warning(f"Cannot load tiktoken encoding '{name}', "
+                           f"estimating {BYTES_PER_TOKEN} bytes per token: {e}")
+            _encodings[name] = None
+    return _encodings[name]
+
+
+def count_tokens(path, encoding_name):
+    """Return (tokens, exact) for a text file, read block by block
+
+    Blocks end at a line break so no token is split between two blocks.
+    Without tiktoken the count is approximated from the file size.
+    """
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return math.ceil(Path(path).stat().st_size / BYTES_PER_TOKEN), False
+    tokens, carry = 0, ""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_CHARS), ""):
+            block = carry + block
+            cut = block.rfind("\n") + 1
+            if cut == 0:
+                carry = block
+                continue
+            tokens += len(encoding.encode_ordinary(block[:cut]))
+            carry = block[cut:]
+    if carry:
+        tokens += len(encoding.encode_ordinary(carry))
+    return tokens, True
+
+
+class TokenCache:
+    """Token counts stored in SQLite by encoding and content hash"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS tokens ("
+                         " encoding TEXT NOT NULL, sha256 TEXT NOT NULL,"
+                         " tokens INTEGER NOT NULL, PRIMARY KEY (encoding, sha256))")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, encoding, hashes):
+        """Map the cached hashes among the given ones to their token counts"""
+        hashes = list(set(hashes))
+        found = {}
+        with self._lock, self._connect() as conn:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = conn.execute(
+                    "SELECT sha256, tokens FROM tokens WHERE encoding = ? AND sha256 IN "
+                    f"({','.join('?' * len(batch))})", [encoding] + batch)
+                found.update(rows)
+        return found
+
+    def put_many(self, encoding, counts):
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tokens (encoding, sha256, tokens) VALUES (?, ?, ?)",
+                [(encoding, sha256, tokens) for sha256, tokens in counts.items()])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Return the process-level token count cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TokenCache(CACHE_PATH)
+        return _cache
+
+
+def tokenize_inputs(kb_path, encoding, progress=None):
+    """Token counts of the knowledge base's input documents, keyed by file name
+
+    Returns (counts, stats) where stats holds how many files came from the
+    cache, how many were tokenized and whether every count is exact.
+    progress(done, total) is called as files are tokenized.
+    """
+    manifest = InputManifest(kb_path).refresh()
+    files = manifest.files
+    cache = get_token_cache()
+    cached = cache.get_many(encoding, [entry["sha256"] for entry in files.values()])
+    pending = {}
+    for name, entry in files.items():
+        if entry["sha256"] not in cached:
+            pending.setdefault(entry["sha256"], manifest.input_path / name)
+    counted, exact = {}, True
+    total_bytes = sum(files[path.name]["size"] for path in pending.values())
+    if len(pending) > 1 and total_bytes >= POOL_MIN_BYTES:
+        # spawn, since forking the multi-threaded Streamlit server is unsafe
+        context = multiprocessing.get_context("spawn")
+        workers = min(MAX_PROCESSES, len(pending))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {executor.submit(count_tokens, path, encoding): sha256
+                       for sha256, path in pending.items()}
+            for done, future in enumerate(as_completed(futures), 1):
+                counted[futures[future]], file_exact = future.result()
+                exact = exact and file_exact
+                if progress:
+                    progress(done, len(pending))
+    else:
+        for done, (sha256, path) in enumerate(pending.items(), 1):
+            counted[sha256], file_exact = count_tokens(path, encoding)
+            exact = exact and file_exact
+            if progress:
+                progress(done, len(pending))
+    if counted and exact:
+        cache.put_many(encoding, counted)  # Size-based guesses are not worth keeping
+    cached.update(counted)
+    counts = {name: cached[entry["sha256"]] for name, entry in files.items()}
+    stats = {"cached_files": len(files) - len(pending), "tokenized_files": len(pending),
+             "exact": exact, "bytes": sum(entry["size"] for entry in files.values())}
+    return counts, stats
+
+
+# ---------------------------------------------------------------------------
+# Estimate
+# ---------------------------------------------------------------------------
+
+def _embedding_calls(items, tokens, batch_size, batch_tokens):
+    if not items:
+        return 0
+    return max(math.ceil(items / batch_size), math.ceil(tokens / batch_tokens))
+
+
+def _extraction_calls(chunks, gleanings):
+    """One extraction per chunk, plus per gleaning a continuation and a loop check"""
+    return chunks * (1 + gleanings + max(gleanings - 1, 0))
+
+
+def _call_seconds(calls, tokens, seconds_per_call, concurrency,
+                  requests_per_minute=0, tokens_per_minute=0):
+    seconds = calls * seconds_per_call / concurrency
+    if requests_per_minute:
+        seconds = max(seconds, calls / requests_per_minute * 60)
+    if tokens_per_minute:
+        seconds = max(seconds, tokens / tokens_per_minute * 60)
+    return seconds
+
+
+def estimate_index(kb_path, progress=None):
+    """Estimate chunks, LLM and embedding calls and wall time of a full index
+
+    Returns a dict; counts that depend on the content (entities, summaries,
+    community reports) are typical values rather than exact ones.
+    """
+    settings = read_index_settings(kb_path)
+    counts, stats = tokenize_inputs(kb_path, settings["encoding"], progress)
+    return estimate_counts(counts, settings, stats)
+
+
+def estimate_counts(counts, settings, stats=None):
+    """The estimate of estimate_index for given per-document token counts
+
+    Lets callers price a subset of the documents, e.g. without duplicates.
+    """
+    stats = stats or {"bytes": 0, "exact": True, "cached_files": 0, "tokenized_files": 0}
+    size, overlap = settings["chunk_size"], settings["chunk_overlap"]
+    chunks = sum(estimate_chunks(tokens, size, overlap) for tokens in counts.values())
+    tokens = sum(counts.values())
+    # Overlapping chunks repeat `overlap` tokens each
+    chunk_tokens = tokens + max(chunks - len(counts), 0) * overlap
+
+    extraction_calls = _extraction_calls(chunks, settings["max_gleanings"])
+    claim_calls = (_extraction_calls(chunks, settings["claim_gleanings"])
+                   if settings["claims"] else 0)
+    entities = chunks * ENTITIES_PER_CHUNK
+    summary_calls = math.ceil(entities * SUMMARIZED_ENTITY_SHARE)
+    report_calls = math.ceil(entities / ENTITIES_PER_COMMUNITY)
+    llm_calls = extraction_calls + claim_calls + summary_calls + report_calls
+    average_chunk = chunk_tokens / chunks if chunks else 0
+    llm_tokens = round((extraction_calls + claim_calls) * (EXTRACTION_PROMPT_TOKENS + average_chunk)
+                       + summary_calls * SUMMARY_PROMPT_TOKENS
+                       + report_calls * REPORT_PROMPT_TOKENS)
+
+    batch_size, batch_tokens = settings["embedding_batch_size"], settings["embedding_batch_tokens"]
+    embedding_tokens = (chunk_tokens + entities * DESCRIPTION_TOKENS
+                        + report_calls * REPORT_TOKENS)
+    embedding_calls = (
+        _embedding_calls(chunks, chunk_tokens, batch_size, batch_tokens)
+        + _embedding_calls(entities, entities * DESCRIPTION_TOKENS, batch_size, batch_tokens)
+        + _embedding_calls(report_calls, report_calls * REPORT_TOKENS, batch_size, batch_tokens))
+
+    wall_seconds = (
+        _call_seconds(llm_calls, llm_tokens, LLM_CALL_SECONDS, settings["concurrency"],
+                      settings["requests_per_minute"], settings["tokens_per_minute"])
+        + _call_seconds(embedding_calls, embedding_tokens, EMBEDDING_CALL_SECONDS,
+                        settings["embedding_concurrency"]))
+    return {
+        "settings": settings,
+        "documents": len(counts),
+        "bytes": stats["bytes"],
+        "tokens": tokens,
+        "exact_tokens": stats["exact"],
+        "cached_files": stats["cached_files"],
+        "tokenized_files": stats["tokenized_files"],
+        "chunks": chunks,
+        "extraction_calls": extraction_calls,
+        "claim_calls": claim_calls,
+        "summary_calls": summary_calls,
+        "report_calls": report_calls,
+        "llm_calls": llm_calls,
+        "llm_prompt_tokens": llm_tokens,
+        "embedding_calls": embedding_calls,
+        "embedding_tokens": embedding_tokens,
+        "wall_seconds": wall_seconds,
+    }
+
+
+def estimate_cost(estimate, llm_price, embedding_price):
+    """Cost of an estimate given prices per million prompt and embedding tokens"""
+    return (estimate["llm_prompt_tokens"] * llm_price
+            + estimate["embedding_tokens"] * embedding_price) / 1_000_000
+
+
+def format_duration(seconds):
+    """Human readable duration such as '2h 05m' or '45s'"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
@@ -0,0 +1,169 @@
+"""Lazy, paginated reads of a knowledge base's parquet index artifacts
+
+Tables are opened memory-mapped and only the requested columns and row
+groups are read, so a page of a multi-GB entities or community_reports table
+costs about one row group. Filtering, sorting and text search stream through
+the table batch by batch and keep only the matching row numbers (plus the
+sort key), which are cached per artifact and query until the file changes.
+"""
+import bisect
+import logging
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from fs_cache import StatCache
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 64 * 1024
+DEFAULT_COLUMN_COUNT = 8
+FILTER_OPS = ["contains", "==", "!=", ">", ">=", "<", "<="]
+_COMPARE = {"==": pc.equal, "!=": pc.not_equal, ">": pc.greater,
+            ">=": pc.greater_equal, "<": pc.less, "<=": pc.less_equal}
+
+# Matching row numbers per (artifact, query), dropped when the artifact changes
+_matches = StatCache(max_entries=64)
+
+
+def open_artifact(path):
+    return pq.ParquetFile(path, memory_map=True)
+
+
+def _is_text(data_type):
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+
+def _is_nested(data_type):
+    return pa.types.is_nested(data_type) or pa.types.is_binary(data_type)
+
+
+def describe(path):
+    """Row count, row groups and column types of an artifact, from its footer only"""
+    parquet = open_artifact(path)
+    metadata = parquet.metadata
+    return {
+        "rows": metadata.num_rows,
+        "row_groups": metadata.num_row_groups,
+        "columns": [(field.name, str(field.type)) for field in parquet.schema_arrow],
+    }
+
+
+def default_columns(path, limit=DEFAULT_COLUMN_COUNT):
+    """The first scalar columns; embeddings and other lists are left out"""
+    schema = open_artifact(path).schema_arrow
+    return [field.name for field in schema if not _is_nested(field.type)][:limit]
+
+
+def _row_group_offsets(parquet):
+    offsets, total = [], 0
+    for index in range(parquet.metadata.num_row_groups):
+        offsets.append(total)
+        total += parquet.metadata.row_group(index).num_rows
+    return offsets, total
+
+
+def _batch_mask(batch, search, filter_column, filter_op, filter_value):
+    mask = None
+    if search:
+        for name, column in zip(batch.schema.names, batch.columns):
+            if _is_text(column.type):
+                found = pc.match_substring(column, search, ignore_case=True)
+                mask = found if mask is None else pc.or_kleene(mask, found)
+        if mask is None:
+            mask = pa.array([False] * batch.num_rows)
+    if filter_column:
+        column = batch.column(batch.schema.get_field_index(filter_column))
+        if filter_op == "contains":
+            matched = pc.match_substring(pc.cast(column, pa.string()),
+                                         str(filter_value), ignore_case=True)
+        else:
+            value = pa.scalar(filter_value).cast(column.type)
+            matched = _COMPARE[filter_op](column, value)
+        mask = matched if mask is None else pc.and_kleene(mask, matched)
+    return pc.fill_null(mask, False) if mask is not None else None
+
+
+def _find_rows(path, search, filter_column, filter_op, filter_value,
+               sort_column, descending):
+    """Row numbers matching the query, in sort order"""
+    parquet = open_artifact(path)
+    schema = parquet.schema_arrow
+    needed = []
+    if search:
+        needed += [field.name for field in schema if _is_text(field.type)]
+    for name in (filter_column, sort_column):
+        if name and name not in needed:
+            needed.append(name)
+    row_ids, sort_keys, offset = [], [], 0
+    for batch in parquet.iter_batches(batch_size=BATCH_SIZE, columns=needed or None):
+        ids = pa.array(range(offset, offset + batch.num_rows), pa.int64())
+        offset += batch.num_rows
+        mask = _batch_mask(batch, search, filter_column, filter_op, filter_value)
+        if mask is not None:
+            ids = ids.filter(mask)
+        row_ids.append(ids)
+        if sort_column:
+            keys = batch.column(batch.schema.get_field_index(sort_column))
+            sort_keys.append(keys.filter(mask) if mask is not None else keys)
+    if not row_ids:
+        return pa.array([], pa.int64())
+    rows = pa.concat_arrays(row_ids)
+    if sort_column:
+        keys = pa.table({"key": pa.concat_arrays(sort_keys), "row": rows})
+        order = pc.sort_indices(keys, sort_keys=[
+            ("key", "descending" if descending else "ascending"), ("row", "ascending")])
+        rows = rows.take(order)
+    return rows
+
+
+def _read_rows(parquet, rows, columns):
+    """Read the given row numbers, touching only the row groups that hold them"""
+    offsets, _total = _row_group_offsets(parquet)
+    wanted = {}
+    for position, row in enumerate(rows):
+        group = bisect.bisect_right(offsets, row) - 1
+        wanted.setdefault(group, []).append((position, row - offsets[group]))
+    pieces, positions = [], []
+    for group, items in sorted(wanted.items()):
+        table = parquet.read_row_group(group, columns=columns)
+        pieces.append(table.take([local for _position, local in items]))
+        positions += [position for position, _local in items]
+    if not pieces:
+        return parquet.schema_arrow.empty_table().select(columns)
+    table = pa.concat_tables(pieces)
+    # Restore the requested (sorted) order
+    order = sorted(range(len(positions)), key=positions.__getitem__)
+    return table.take(order)
+
+
+def read_page(path, columns=None, page=1, page_size=50, search="",
+              filter_column=None, filter_op="==", filter_value=None,
+              sort_column=None, descending=False):
+    """Return (page table, matching row count) of an artifact
+
+    Without a search, filter or sort the page is read straight from the row
+    groups that contain it. Otherwise the matching row numbers are computed
+    once per query and cached until the artifact changes.
+    """
+    parquet = open_artifact(path)
+    columns = list(columns or default_columns(path))
+    if filter_column and filter_op not in FILTER_OPS:
+        raise ValueError(f"Unknown filter operator '{filter_op}'")
+    start = (max(1, page) - 1) * page_size
+    if not (search or filter_column or sort_column):
+        _offsets, total = _row_group_offsets(parquet)
+        rows = range(start, min(start + page_size, total))
+        return _read_rows(parquet, list(rows), columns), total
+    spec = (search, filter_column, filter_op, str(filter_value), sort_column, descending)
+    try:
+        matches = _matches.get(
+            f"rows:{spec!r}", path,
+            lambda p: _find_rows(p, search, filter_column, filter_op, filter_value,
+                                 sort_column, descending))
+    except pa.ArrowException as e:
+        # e.g. a filter value that cannot be cast to a list or struct column
+        raise ValueError(f"Cannot apply this filter or sort: {e}")
+    rows = matches.slice(start, page_size).to_pylist()
+    return _read_rows(parquet, rows, columns), len(matches)
@@ -0,0 +1,490 @@
+"""Background indexing jobs
+
+Indexing runs in a child process owned by a background thread, so the
+Streamlit script never blocks on it. Every job has a JSON state file and a log
+file under jobs/, which lets any session (or a restarted server) see what ran,
+how far each run got and why it failed.
+
+The state files are shared by every process using jobs/, e.g. the web UI and
+the HTTP API: each process re-reads the jobs the others changed, at most one
+job per knowledge base is active across all of them, and an active job is
+only marked interrupted once the process that owns it has exited.
+
+When indexing workers are running (see job_spool and index_worker.py), the
+job's graphrag run is handed to one of them through the spool instead, and
+the background thread here only mirrors its progress and then applies the
+result like a local run.
+"""
+import contextlib
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from job_spool import (ACTIVE_STATES, POLL_SECONDS, STALE_SECONDS, JobSpool, use_spool,
+                       log_path as spool_log_path)
+from kb_locks import file_lock, owner_alive, process_owner
+from metrics import get_metrics, wait_for_child
+from run_logs import OutputTail, RotatingLog, read_chunks, tail as tail_log, total_size
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = Path(__file__).parent.resolve() / "jobs"
+
+SUBMIT_LOCK = ".submit.lock"
+SUCCESS_MESSAGE = "All workflows completed successfully."
+# Progress a worker reports through the spool, copied into the local job
+MIRRORED = ["started", "finished", "pid", "returncode", "error", "current_workflow",
+            "workflows", "worker", "attempts"]
+
+# graphrag reports each finished workflow as "🚀 <workflow>" and newer
+# releases also log "Workflow complete: <workflow>"
+WORKFLOW_DONE_PATTERNS = [
+    re.compile(r"🚀\s+([A-Za-z_][\w]*)\s*$"),
+    re.compile(r"Workflow complete:\s*([A-Za-z_][\w]*)"),
+]
+WORKFLOW_START_PATTERN = re.compile(r"Running workflow:\s*([A-Za-z_][\w]*)")
+
+
+class IndexJob:
+    """State of one indexing run"""
+
+    def __init__(self, kb_name, kb_path, args, kind="index", job_id=None,
+                 jobs_dir=JOBS_DIR):
+        self._jobs_dir = Path(jobs_dir)
+        self.id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.kb_name = kb_name
+        self.kb_path = str(kb_path)
+        self.args = list(args)
+        self.kind = kind
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.returncode = None
+        self.error = None
+        self.pid = None
+        self.current_workflow = None
+        self.workflows = []
+        self.worker = None  # Name of the indexing worker running it
+        self.spool = None  # Spool folder of a job handed to the workers
+        self.attempts = 0
+        self.owner = None  # Host and pid of the process whose thread runs the job
+
+    @property
+    def state_path(self):
+        return self._jobs_dir / f"{self.id}.json"
+
+    @property
+    def log_path(self):
+        if self.spool:
+            return spool_log_path(self.spool, self.id)
+        return self._jobs_dir / f"{self.id}.log"
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATES
+
+    def elapsed(self):
+        if not self.started:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def to_dict(self):
+        return {key: value for key, value in vars(self).items()
+                if not key.startswith("_")}
+
+    @classmethod
+    def from_dict(cls, data, jobs_dir=JOBS_DIR):
+        job = cls(data["kb_name"], data["kb_path"], data["args"],
+                  data.get("kind", "index"), data["id"], jobs_dir)
+        for key, value in data.items():
+            setattr(job, key, value)
+        return job
+
+    def save(self):
+        """Write the job state atomically so readers never see a partial file"""
+        # Unique, since a worker and a reclaiming process may write a spooled job
+        tmp_path = self.state_path.with_name(f"{self.id}.json.{uuid.uuid4().hex[:8]}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+
+class JobManager:
+    """Runs indexing jobs in background threads and tracks their state"""
+
+    def __init__(self, jobs_dir=JOBS_DIR):
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._jobs = {}
+        self._local = set()  # Jobs whose thread runs in this process
+        self._mtimes = {}
+        self._processes = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        """Pick up the jobs other processes started or changed since the last call
+
+        Jobs run by this process are kept as they are in memory. An active job
+        whose owning process has exited (e.g. an earlier server run) was
+        interrupted. Called with self._lock held.
+        """
+        seen = set()
+        for state_path in self.jobs_dir.glob("*.json"):
+            job_id = state_path.stem
+            seen.add(job_id)
+            if job_id in self._local:
+                continue
+            try:
+                mtime = state_path.stat().st_mtime_ns
+            except OSError:
+                continue
+            if self._mtimes.get(job_id) == mtime:
+                continue
+            self._mtimes[job_id] = mtime
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    self._jobs[job_id] = IndexJob.from_dict(json.load(f), self.jobs_dir)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable job file {state_path}: {e}")
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if job_id in self._local:
+                continue
+            if job_id not in seen:
+                del self._jobs[job_id]
+                self._mtimes.pop(job_id, None)
+            elif job.active and not owner_alive(job.owner):
+                job.status = "interrupted"
+                job.finished = job.finished or time.time()
+                try:
+                    job.save()
+                except OSError as e:
+                    logger.warning(f"Cannot save the state of indexing job {job.id}: {e}")
+
+    def _active(self, kb_name):
+        for job in self._jobs.values():
+            if job.kb_name == kb_name and job.active:
+                return job
+        return None
+
+    def submit(self, kb_name, kb_path, args, cwd, kind="index", on_success=None,
+               on_failure=None, lock=None):
+        """Start an indexing job, or return the job already running for the knowledge base
+
+        on_success and on_failure are called with the finished job, before its
+        final state is saved; a failing on_success hook fails the job. lock is
+        an optional callable returning a context manager (see kb_locks) that
+        is held while graphrag runs; the job stays queued until it is entered.
+        """
+        # The file lock makes checking and saving atomic across processes
+        with self._lock, file_lock(self.jobs_dir / SUBMIT_LOCK):
+            self._refresh()
+            running = self._active(kb_name)
+            if running:
+                return running
+            job = IndexJob(kb_name, kb_path, args, kind, jobs_dir=self.jobs_dir)
+            job.owner = process_owner()
+            self._jobs[job.id] = job
+            self._local.add(job.id)
+            job.save()
+        thread = threading.Thread(target=self._run,
+                                  args=(job, cwd, on_success, on_failure, lock),
+                                  name=f"index-{job.id}", daemon=True)
+        thread.start()
+        return job
+
+    def _run(self, job, cwd, on_success, on_failure, lock):
+        try:
+            with lock() if lock else contextlib.nullcontext():
+                if use_spool():
+                    status, peak_rss = self._execute_spooled(job, cwd, JobSpool())
+                else:
+                    status, peak_rss = self._execute(job, cwd)
+        except Exception as e:
+            # Never leave the job active, it would block every later run of the knowledge base
+            logger.error(f"Indexing job {job.id} failed: {e}")
+            status, peak_rss = "failed", None
+            job.error = str(e) or type(e).__name__
+            job.finished = job.finished or time.time()
+            job.current_workflow = None
+        # The job stays active until its hook is done, so no new job starts meanwhile
+        hook = on_success if status == "succeeded" else on_failure
+        if hook:
+            try:
+                hook(job)
+            except Exception as e:
+                logger.error(f"Post-indexing hook of job {job.id} failed: {e}")
+                if status == "succeeded":
+                    status = "failed"
+                    job.error = f"Indexing finished but its result could not be applied: {e}"
+        job.status = status
+        try:
+            job.save()
+        except OSError as e:
+            logger.error(f"Cannot save the state of indexing job {job.id}: {e}")
+        with self._lock:
+            self._local.discard(job.id)
+        get_metrics().observe(
+            "index_job", job.elapsed(),
+            {"kb": job.kb_name, "kind": job.kind, "status": job.status},
+            peak_rss_bytes=peak_rss, workflows=len(job.workflows),
+            log_bytes=total_size(job.log_path))
+        logger.info(f"Indexing job {job.id} for '{job.kb_name}' {job.status} "
+                    f"after {job.elapsed():.1f}s")
+
+    def _execute(self, job, cwd):
+        """Run graphrag for the job; returns its final status and the peak RSS"""
+        def track(process):
+            with self._lock:
+                self._processes[job.id] = process
+
+        try:
+            succeeded, peak_rss = execute(job, cwd, on_start=track)
+        finally:
+            with self._lock:
+                self._processes.pop(job.id, None)
+                cancelled = job.id in self._cancelled
+        marker = self._cancel_marker(job.id)
+        if marker.exists():  # Cancelled by another process
+            cancelled = True
+            marker.unlink(missing_ok=True)
+        if cancelled:
+            return "cancelled", peak_rss
+        if succeeded and job.returncode == 0:
+            return "succeeded", peak_rss
+        return "failed", peak_rss
+
+    def _execute_spooled(self, job, cwd, spool):
+        """Hand the job to the indexing workers and follow it until one has finished it
+
+        If no worker is alive for STALE_SECONDS while the job waits in the
+        queue, it is taken back and run here, and so is a job the spool does
+        not accept. A job whose spool stays unreachable for STALE_SECONDS fails.
+        """
+        try:
+            spool.enqueue(job.to_dict())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot queue indexing job {job.id} for the workers, "
+                           f"running it here: {e}")
+            return self._execute(job, cwd)
+        job.spool = str(spool.root)
+        job.save()
+        logger.info(f"Indexing job {job.id} for '{job.kb_name}' queued for the workers")
+        no_workers_since = reachable_since = time.time()
+        unreachable = False
+        while True:
+            try:
+                state = self._follow_spooled(job, spool)
+            except OSError as e:
+                if time.time() - reachable_since > STALE_SECONDS:
+                    job.error = f"Lost contact with the job spool {spool.root}: {e}"
+                    job.finished = time.time()
+                    job.current_workflow = None
+                    return "failed", None
+                if not unreachable:
+                    logger.warning(f"Cannot reach the job spool for job {job.id}: {e}")
+                unreachable = True
+                time.sleep(POLL_SECONDS)
+                continue
+            reachable_since, unreachable = time.time(), False
+            status = state["status"]
+            if status not in ACTIVE_STATES:
+                return status, None  # The job stays active locally until its hook has run
+            if state["workers"] or status != "queued":
+                no_workers_since = time.time()
+            elif time.time() - no_workers_since > STALE_SECONDS and spool.withdraw(job.id):
+                logger.warning(f"No indexing worker took job {job.id}, running it here")
+                job.spool = None
+                job.worker = None
+                return self._execute(job, cwd)
+            time.sleep(POLL_SECONDS)
+
+    def _follow_spooled(self, job, spool):
+        """Mirror a spooled job's progress into the job; returns its spool state
+
+        The state gets 'workers', telling if any worker is alive. Raises
+        OSError while the spool or the jobs folder cannot be reached.
+        """
+        state = spool.read(job.id)
+        if state is None:
+            raise OSError(f"cannot read {spool.job_path(job.id)}")
+        state.setdefault("status", "failed")
+        changed = [key for key in MIRRORED if key in state and state[key] != getattr(job, key)]
+        for key in changed:
+            setattr(job, key, state[key])
+        if state["status"] in ACTIVE_STATES and (state["status"] != job.status or changed):
+            job.status = state["status"]
+            job.save()
+        spool.reclaim_stale()
+        state["workers"] = bool(spool.live_workers())
+        return state
+
+    def _cancel_marker(self, job_id):
+        return self.jobs_dir / f"{job_id}.cancel"
+
+    def cancel(self, job_id):
+        """Stop a running job; returns False if it is not running
+
+        A job run by another process on this host is stopped by signalling
+        its graphrag process and leaving a marker its owner picks up.
+        """
+        with self._lock:
+            self._refresh()
+            process = self._processes.get(job_id)
+            job = self._jobs.get(job_id)
+            spooled = process is None and job is not None and job.spool and job.active
+            foreign = (process is None and not spooled and job is not None and job.active
+                       and job_id not in self._local and job.pid
+                       and job.owner and job.owner.get("host") == process_owner()["host"])
+            if not spooled and not foreign and (process is None or process.poll() is not None):
+                return False
+            self._cancelled.add(job_id)
+        if spooled:
+            JobSpool(job.spool).request_cancel(job_id)  # Its worker stops graphrag
+        elif foreign:
+            self._cancel_marker(job_id).touch()
+            terminate_pid(job.pid)
+        else:
+            terminate(process)
+        logger.info(f"Cancelled indexing job {job_id}")
+        return True
+
+    def get(self, job_id):
+        with self._lock:
+            self._refresh()
+            return self._jobs.get(job_id)
+
+    def jobs(self, kb_name=None, limit=None):
+        """List jobs of every process, newest first"""
+        with self._lock:
+            self._refresh()
+            jobs = sorted(self._jobs.values(), key=lambda j: j.created, reverse=True)
+        if kb_name is not None:
+            jobs = [job for job in jobs if job.kb_name == kb_name]
+        return jobs[:limit] if limit else jobs
+
+    def active_job(self, kb_name):
+        with self._lock:
+            self._refresh()
+            return self._active(kb_name)
+
+    def tail(self, job_id, lines=200):
+        """Return the last lines of a job's log, read from the end of the file"""
+        job = self.get(job_id)
+        if job is None or not job.log_path.exists():
+            return ""
+        return tail_log(job.log_path, lines)
+
+
+def execute(job, cwd, on_start=None):
+    """Run graphrag for a job, writing its log and progress; returns (succeeded, peak RSS)
+
+    on_start(process) is called once the child is running. Used by the job
+    manager and by the indexing workers.
+    """
+    command = ["python", "-m", "graphrag"] + job.args
+    popen_kwargs = {}
+    if os.name == "posix":
+        # Own process group so cancelling also stops graphrag's children
+        popen_kwargs["start_new_session"] = True
+    job.status = "running"
+    job.started = time.time()
+    last_done = job.started
+    succeeded = False
+    peak_rss = None
+    try:
+        with RotatingLog(job.log_path) as log:
+            log.write(f"$ {' '.join(command)}\n")
+            process = subprocess.Popen(
+                command, cwd=cwd, stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT, text=True, encoding="utf-8",
+                errors="replace", bufsize=1, **popen_kwargs)
+            if on_start:
+                on_start(process)
+            job.pid = process.pid
+            job.save()
+            output_tail = OutputTail(markers=[SUCCESS_MESSAGE], max_bytes=0)
+            for line in read_chunks(process.stdout):
+                log.write(line)
+                log.flush()
+                output_tail.feed(line)  # Spots the marker even in a split line
+                succeeded = output_tail.seen(SUCCESS_MESSAGE)
+                workflow = _match_workflow_done(line)
+                if workflow:
+                    now = time.time()
+                    job.workflows.append({
+                        "name": workflow,
+                        "finished": now,
+                        "seconds": round(now - last_done, 2),
+                    })
+                    get_metrics().observe("workflow", now - last_done,
+                                          {"kb": job.kb_name, "workflow": workflow})
+                    last_done = now
+                    job.current_workflow = None
+                    job.save()
+                    continue
+                match = WORKFLOW_START_PATTERN.search(line)
+                if match:
+                    job.current_workflow = match.group(1)
+                    job.save()
+            job.returncode, peak_rss = wait_for_child(process)
+    except Exception as e:
+        logger.error(f"Indexing job {job.id} failed to run: {e}")
+        job.error = str(e)
+    job.finished = time.time()
+    job.current_workflow = None
+    return succeeded, peak_rss
+
+
+def terminate(process):
+    """Stop a graphrag child and the processes it started"""
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+    except ProcessLookupError:
+        pass
+
+
+def terminate_pid(pid):
+    """terminate() for a graphrag process started by another process"""
+    try:
+        if os.name == "posix":
+            os.killpg(pid, signal.SIGTERM)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _match_workflow_done(line):
+    for pattern in WORKFLOW_DONE_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return match.group(1)
+    return None
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-level job manager shared by all sessions"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(JOBS_DIR)
+        return _manager
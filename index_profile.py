@@ -0,0 +1,417 @@
+"""Per-workflow profiles of finished indexing runs
+
+When an index run succeeds, graphrag's stats.json (wall time per workflow),
+the part of its engine logs written during the run (LLM calls, retries and
+rate-limit waits) and the row counts of the new tables are combined into
+one profile per run under profiles/. Profiles outlive the index versions
+and job logs they were built from, so runs can be compared over time.
+
+Each profile records a digest of settings.yaml as it was when the run
+started, and every save through the settings editor is appended to a
+settings history, so a run that got slower can be traced back to the
+settings edit made before it.
+"""
+import difflib
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+from index_jobs import WORKFLOW_START_PATTERN
+from kb_artifacts import artifact_key, list_artifacts
+from run_logs import log_files
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = Path(__file__).parent.resolve() / "profiles"
+SETTINGS_HISTORY = "settings_history.jsonl"
+ENGINE_LOG_DIRS = ["logs", "output/reports"]
+# A workflow counts as regressed when it got this much slower, relatively and absolutely
+REGRESSION_RATIO = float(os.environ.get("GRAPHRAG_PROFILE_REGRESSION_RATIO", "0.2"))
+REGRESSION_MIN_SECONDS = float(os.environ.get("GRAPHRAG_PROFILE_REGRESSION_SECONDS", "5"))
+UNATTRIBUTED = "(other)"
+
+# graphrag 0.x logs every LLM invocation as
+#   perf - llm.chat "extract-continuation-0" with 1 retries took 2.3. input_tokens=812, output_tokens=96
+LLM_PERF_PATTERN = re.compile(
+    r"perf - llm\.\w+ .*? with (\d+) retries took (\d+(?:\.\d+)?)"
+    r"(?:\. input_tokens=(\d+), output_tokens=(\d+))?")
+# Newer releases (fnllm) only log failed attempts and backoff
+RETRY_PATTERN = re.compile(r"\bretry(?:ing)?\b|\battempt \d+", re.IGNORECASE)
+RATE_LIMIT_PATTERN = re.compile(r"rate.?limit|\b429\b|too many requests", re.IGNORECASE)
+WAIT_PATTERN = re.compile(
+    r"(?:sleep(?:ing)?|wait(?:ing)?|retry(?:ing)? in|after)\s+(?:for\s+)?(\d+(?:\.\d+)?)\s*s(?:ec|econds?)?\b",
+    re.IGNORECASE)
+TIMESTAMP_PATTERN = re.compile(r"(?:(\d{4}-\d{2}-\d{2})[ T])?(\d{2}):(\d{2}):(\d{2})")
+
+# Tables written by workflows whose name does not match the table's
+WORKFLOW_TABLES = {
+    "create_base_text_units": ["text_units"],
+    "create_final_text_units": ["text_units"],
+    "extract_graph": ["entities", "relationships"],
+    "create_base_entity_graph": ["entities", "relationships"],
+    "finalize_graph": ["entities", "relationships"],
+    "create_communities": ["communities"],
+    "create_community_reports": ["community_reports"],
+    "extract_covariates": ["covariates"],
+    "create_final_documents": ["documents"],
+}
+
+
+def _profile_dir():
+    path = Path(PROFILE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def read_settings(kb_path):
+    """settings.yaml's text, or "" if it cannot be read"""
+    try:
+        with open(Path(kb_path) / "settings.yaml", "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def settings_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def record_settings_edit(kb_name, text):
+    """Append a save of settings.yaml to the settings history"""
+    entry = {"kb": kb_name, "time": time.time(), "digest": settings_digest(text)}
+    with open(_profile_dir() / SETTINGS_HISTORY, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def settings_edits(kb_name, since=None, until=None):
+    """Saves of a knowledge base's settings.yaml, oldest first"""
+    path = Path(PROFILE_DIR) / SETTINGS_HISTORY
+    if not path.exists():
+        return []
+    edits = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("kb") != kb_name:
+                continue
+            if since is not None and entry["time"] <= since:
+                continue
+            if until is not None and entry["time"] > until:
+                continue
+            edits.append(entry)
+    return edits
+
+
+def _engine_logs(kb_path):
+    """graphrag's own log files in a knowledge base"""
+    files = []
+    for name in ENGINE_LOG_DIRS:
+        folder = Path(kb_path) / name
+        if folder.is_dir():
+            files.extend(sorted(folder.glob("*.log")))
+    return files
+
+
+def log_offsets(build_root):
+    """Current sizes of the engine logs a run will append to, taken before it starts
+
+    build_root is the root graphrag writes to: the knowledge base itself or
+    its staging root, where logs/ is shared with the knowledge base and a
+    full build's output/reports starts empty. Offsets are keyed by the path
+    relative to the root, which stays valid once the staging root's output
+    becomes the knowledge base's.
+    """
+    build_root = Path(build_root)
+    offsets = {}
+    for path in _engine_logs(build_root):
+        try:
+            offsets[path.relative_to(build_root).as_posix()] = path.stat().st_size
+        except OSError:
+            continue
+    return offsets
+
+
+def _new_log_lines(kb_path, offsets):
+    """Lines the engine logs gained since offsets were taken"""
+    kb_path = Path(kb_path)
+    for path in _engine_logs(kb_path):
+        start = offsets.get(path.relative_to(kb_path).as_posix(), 0)
+        try:
+            if path.stat().st_size < start:
+                start = 0  # Truncated and rewritten by this run
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                f.seek(start)
+                yield from f
+        except OSError:
+            continue
+
+
+def _job_log_lines(job_log):
+    for path in log_files(job_log):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            yield from f
+
+
+class _Attributor:
+    """Map log lines to the workflow that was running when they were written
+
+    Lines with a timestamp are placed by the workflows' finish times, other
+    lines belong to the last "Running workflow" marker seen.
+    """
+
+    def __init__(self, workflows, started):
+        self.ends = [(entry["finished"], entry["name"]) for entry in workflows]
+        self.day = datetime.fromtimestamp(started or time.time()).date()
+        self.previous = None
+        self.current = None
+
+    def _timestamp(self, line):
+        match = TIMESTAMP_PATTERN.search(line[:40])
+        if not match:
+            return None
+        date, hour, minute, second = match.groups()
+        if date:
+            day = datetime.strptime(date, "%Y-%m-%d").date()
+        else:
+            day = self.day
+        moment = datetime(day.year, day.month, day.day, int(hour), int(minute), int(second))
+        if not date and self.previous and moment < self.previous - timedelta(hours=12):
+            moment += timedelta(days=1)  # The run went past midnight
+            self.day = moment.date()
+        self.previous = moment
+        return moment.timestamp()
+
+    def workflow(self, line):
+        match = WORKFLOW_START_PATTERN.search(line)
+        if match:
+            self.current = match.group(1)
+        stamp = self._timestamp(line) if self.ends else None
+        if stamp is not None:
+            for finished, name in self.ends:
+                if stamp <= finished:  # Timestamps are truncated to whole seconds
+                    return name
+        return self.current or UNATTRIBUTED
+
+
+def _new_counters():
+    return {"llm_calls": 0, "retries": 0, "rate_limits": 0, "wait_seconds": 0.0,
+            "llm_seconds": 0.0, "input_tokens": 0, "output_tokens": 0}
+
+
+def count_llm_activity(lines, workflows, started):
+    """LLM calls, retries and rate-limit waits per workflow from log lines"""
+    attributor = _Attributor(workflows, started)
+    counters = {}
+    for line in lines:
+        perf = LLM_PERF_PATTERN.search(line)
+        rate_limited = RATE_LIMIT_PATTERN.search(line)
+        retried = RETRY_PATTERN.search(line)
+        if not (perf or rate_limited or retried or WORKFLOW_START_PATTERN.search(line)):
+            continue
+        name = attributor.workflow(line)
+        if not (perf or rate_limited or retried):
+            continue
+        counter = counters.setdefault(name, _new_counters())
+        if perf:
+            retries, seconds, input_tokens, output_tokens = perf.groups()
+            counter["llm_calls"] += 1
+            counter["retries"] += int(retries)
+            counter["llm_seconds"] += float(seconds)
+            counter["input_tokens"] += int(input_tokens or 0)
+            counter["output_tokens"] += int(output_tokens or 0)
+            continue
+        if rate_limited:
+            counter["rate_limits"] += 1
+        elif retried:
+            counter["retries"] += 1
+        wait = WAIT_PATTERN.search(line)
+        if wait:
+            try:
+                counter["wait_seconds"] += float(wait.group(1))
+            except ValueError:
+                pass
+    return counters
+
+
+def _read_stats(kb_path):
+    try:
+        with open(Path(kb_path) / "output" / "stats.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def table_rows(kb_path):
+    """Row counts of the index tables, read from the parquet footers"""
+    rows = {}
+    for name, path in list_artifacts(kb_path).items():
+        try:
+            rows[name] = pq.read_metadata(path).num_rows
+        except Exception as e:
+            logger.warning(f"Cannot read the row count of {path}: {e}")
+    return rows
+
+
+def _workflow_rows(name, rows):
+    tables = WORKFLOW_TABLES.get(name) or [artifact_key(name)]
+    found = {table: rows[table] for table in tables if table in rows}
+    return sum(found.values()) if found else None
+
+
+def build_profile(job, kb_path, offsets, settings_text):
+    """Combine stats.json, the run's logs and the table sizes into a profile"""
+    stats = _read_stats(kb_path)
+    stats_workflows = stats.get("workflows") or {}
+    seconds = {name: round(float(values.get("overall", 0.0)), 2)
+               for name, values in stats_workflows.items() if isinstance(values, dict)}
+    for entry in job.workflows:
+        seconds.setdefault(entry["name"], entry["seconds"])
+
+    lines = _new_log_lines(kb_path, offsets)
+    counters = count_llm_activity(lines, job.workflows, job.started)
+    if not any(counter["llm_calls"] for counter in counters.values()):
+        # Some releases only write their logs to the console
+        job_counters = count_llm_activity(_job_log_lines(job.log_path), job.workflows,
+                                          job.started)
+        if job_counters:
+            counters = job_counters
+
+    rows = table_rows(kb_path)
+    workflows = []
+    for name in list(seconds) + [name for name in counters if name not in seconds]:
+        entry = {"name": name, "seconds": seconds.get(name), "rows": _workflow_rows(name, rows)}
+        entry.update(counters.get(name, _new_counters()))
+        entry["wait_seconds"] = round(entry["wait_seconds"], 2)
+        entry["llm_seconds"] = round(entry["llm_seconds"], 2)
+        workflows.append(entry)
+    return {
+        "job_id": job.id,
+        "kb_name": job.kb_name,
+        "kind": job.kind,
+        "started": job.started,
+        "finished": job.finished or time.time(),
+        "total_seconds": round(float(stats.get("total_runtime") or job.elapsed()), 2),
+        "documents": stats.get("num_documents"),
+        "settings_digest": settings_digest(settings_text),
+        "settings": settings_text,
+        "workflows": workflows,
+        "tables": rows,
+    }
+
+
+def save_profile(profile):
+    path = _profile_dir() / f"{profile['job_id']}.json"
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def record_run(job, kb_path, offsets, settings_text):
+    """Build and store the profile of a finished run; never fails the run"""
+    try:
+        save_profile(build_profile(job, kb_path, offsets, settings_text))
+    except Exception as e:
+        logger.warning(f"Could not profile indexing job {job.id}: {e}")
+
+
+def list_profiles(kb_name):
+    """Profiles of a knowledge base's runs, newest first"""
+    folder = Path(PROFILE_DIR)
+    if not folder.is_dir():
+        return []
+    profiles = []
+    for path in folder.glob("*.json"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if profile.get("kb_name") == kb_name:
+            profiles.append(profile)
+    return sorted(profiles, key=lambda profile: profile.get("started") or 0, reverse=True)
+
+
+def delete_profiles(kb_name):
+    for profile in list_profiles(kb_name):
+        try:
+            (Path(PROFILE_DIR) / f"{profile['job_id']}.json").unlink()
+        except OSError:
+            pass
+
+
+def _regressed(before, after, ratio, min_seconds):
+    if before is None or after is None:
+        return False
+    return after - before >= min_seconds and after > before * (1 + ratio)
+
+
+def compare_profiles(baseline, candidate, ratio=REGRESSION_RATIO,
+                     min_seconds=REGRESSION_MIN_SECONDS):
+    """Side-by-side comparison of two runs
+
+    Returns a dict with one row per workflow (both runs' figures, the change
+    in wall time and a regression flag), the total, whether settings.yaml
+    differed and the settings edits saved between the two runs.
+    """
+    before = {entry["name"]: entry for entry in baseline["workflows"]}
+    after = {entry["name"]: entry for entry in candidate["workflows"]}
+    rows = []
+    for name in list(after) + [name for name in before if name not in after]:
+        old, new = before.get(name, {}), after.get(name, {})
+        old_seconds, new_seconds = old.get("seconds"), new.get("seconds")
+        change = None
+        if old_seconds and new_seconds is not None:
+            change = (new_seconds - old_seconds) / old_seconds
+        rows.append({
+            "name": name,
+            "before": old, "after": new,
+            "change": change,
+            "regressed": _regressed(old_seconds, new_seconds, ratio, min_seconds),
+        })
+    settings_changed = baseline.get("settings_digest") != candidate.get("settings_digest")
+    return {
+        "workflows": rows,
+        "total_change": ((candidate["total_seconds"] - baseline["total_seconds"])
+                         / baseline["total_seconds"] if baseline["total_seconds"] else None),
+        "total_regressed": _regressed(baseline["total_seconds"], candidate["total_seconds"],
+                                      ratio, min_seconds),
+        "settings_changed": settings_changed,
+        "edits": settings_edits(candidate["kb_name"], baseline.get("started"),
+                                candidate.get("started")),
+    }
+
+
+def settings_diff(baseline, candidate):
+    """Unified diff of settings.yaml between two runs"""
+    return "".join(difflib.unified_diff(
+        baseline.get("settings", "").splitlines(keepends=True),
+        candidate.get("settings", "").splitlines(keepends=True),
+        fromfile=f"settings.yaml ({baseline['job_id']})",
+        tofile=f"settings.yaml ({candidate['job_id']})"))
+
+
+def find_regressions(profiles, ratio=REGRESSION_RATIO, min_seconds=REGRESSION_MIN_SECONDS):
+    """Runs (newest first) that regressed against the run before them after a settings change
+
+    Returns (profile, previous profile, comparison) tuples.
+    """
+    found = []
+    for candidate, baseline in zip(profiles, profiles[1:]):
+        comparison = compare_profiles(baseline, candidate, ratio, min_seconds)
+        if not comparison["settings_changed"]:
+            continue
+        if comparison["total_regressed"] or any(row["regressed"]
+                                                for row in comparison["workflows"]):
+            found.append((candidate, baseline, comparison))
+    return found
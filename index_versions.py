@@ -0,0 +1,275 @@
+"""Staged index builds with an atomic swap and a few versions kept for rollback
+
+A build runs in a staging root under index_versions/ whose settings, .env,
+input, prompts, cache and logs are symlinks to the knowledge base's own, so
+graphrag writes the new output (tables and vector store) into the staging
+root while queries keep reading the current index. A successful build is
+renamed to a version directory and the knowledge base's `output` becomes a
+symlink to it, replaced in one rename so readers see either the old or the
+new index and never a half-written one:
+
+    output -> index_versions/<version>/output
+
+The last KEEP_VERSIONS versions besides the current one are kept for
+rollback, older ones are deleted. Where symlinks cannot be created (e.g.
+Windows without developer mode) indexing falls back to writing output/ in place.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from cache_admin import dir_size
+from kb_locks import owner_alive, process_owner
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_DIR = "index_versions"
+OUTPUT_DIR = "output"
+STAGING_PREFIX = ".staging-"
+SNAPSHOT_NAME = "input_snapshot.json"
+# Process that builds in a staging root; garbage collection leaves it alone while it runs
+OWNER_NAME = ".owner.json"
+KEEP_VERSIONS = int(os.getenv("GRAPHRAG_KEEP_INDEX_VERSIONS", "2"))
+# Generated by graphrag per build, so never shared with the staging root
+NOT_LINKED = {OUTPUT_DIR, VERSIONS_DIR, "update_output"}
+# Folders graphrag would otherwise create inside the staging root and lose
+SHARED_DIRS = ["cache", "logs"]
+# Vector store files that are written once and never modified; an incremental
+# build hard-links them instead of copying. Everything else is copied, since
+# graphrag rewrites its parquet tables in place, which would change the
+# current version's file through a shared inode.
+IMMUTABLE_SUFFIXES = (".lance", ".idx", ".txn")
+
+_symlinks_supported = {}
+
+
+class VersionError(Exception):
+    """Raised for unknown versions or a staging root that cannot be promoted"""
+
+
+def versions_dir(kb_path):
+    return Path(kb_path) / VERSIONS_DIR
+
+
+def supports_symlinks(kb_path):
+    """Whether directory symlinks can be created in the knowledge base"""
+    key = str(Path(kb_path).resolve())
+    if key not in _symlinks_supported:
+        probe = Path(kb_path) / f".symlink-probe-{uuid.uuid4().hex[:8]}"
+        try:
+            os.symlink(".", probe, target_is_directory=True)
+            probe.unlink()
+            _symlinks_supported[key] = True
+        except (OSError, NotImplementedError):
+            _symlinks_supported[key] = False
+    return _symlinks_supported[key]
+
+
+def is_versioned(kb_path):
+    """Whether the knowledge base's output is a symlink to a kept version"""
+    return (Path(kb_path) / OUTPUT_DIR).is_symlink()
+
+
+def current_version(kb_path):
+    """Name of the version the output points to, or None"""
+    output = Path(kb_path) / OUTPUT_DIR
+    if not output.is_symlink():
+        return None
+    return Path(os.readlink(output)).parent.name
+
+
+def _new_version_id(timestamp=None):
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(timestamp))
+    return f"{stamp}-{uuid.uuid4().hex[:6]}"
+
+
+def _link(target, link):
+    os.symlink(os.path.relpath(target, link.parent), link,
+               target_is_directory=target.is_dir())
+
+
+def _link_or_copy(src, dst):
+    """copytree copy function: hard-link immutable files, copy the rest"""
+    if str(src).endswith(IMMUTABLE_SUFFIXES):
+        try:
+            os.link(src, dst)
+            return dst
+        except OSError:
+            pass  # Another file system, or no hard links here
+    return shutil.copy2(src, dst)
+
+
+def prepare_staging(kb_path, incremental=False):
+    """Create a staging root for a build and return its path
+
+    For an incremental build the current output is copied into the staging
+    root, since graphrag's update path merges the new documents into it.
+    The vector store's data files are hard-linked rather than copied.
+    """
+    kb_path = Path(kb_path)
+    stage = versions_dir(kb_path) / f"{STAGING_PREFIX}{_new_version_id()}"
+    stage.mkdir(parents=True)
+    with open(stage / OWNER_NAME, "w", encoding="utf-8") as f:
+        json.dump(process_owner(), f)
+    for name in SHARED_DIRS:
+        (kb_path / name).mkdir(exist_ok=True)
+    for entry in kb_path.iterdir():
+        if entry.name in NOT_LINKED or entry.name.startswith("."):
+            continue
+        _link(entry, stage / entry.name)
+    env_path = kb_path / ".env"
+    if env_path.exists():
+        _link(env_path, stage / ".env")
+    output = kb_path / OUTPUT_DIR
+    if incremental and output.is_dir():
+        shutil.copytree(output, stage / OUTPUT_DIR, symlinks=True,
+                        copy_function=_link_or_copy)
+    logger.info(f"Staging index build of '{kb_path.name}' in {stage}")
+    return stage
+
+
+def _remove_version(path):
+    """Delete a version or staging root without following its symlinks"""
+    if not path.exists() and not path.is_symlink():
+        return
+    for entry in path.iterdir():
+        if entry.is_symlink():
+            entry.unlink()
+    shutil.rmtree(path)
+
+
+def discard_staging(stage):
+    _remove_version(Path(stage))
+    logger.info(f"Discarded staging root {stage}")
+
+
+def _adopt_legacy_output(kb_path):
+    """Move an output folder written in place into a version of its own"""
+    output = Path(kb_path) / OUTPUT_DIR
+    if output.is_symlink() or not output.is_dir():
+        return None
+    version = versions_dir(kb_path) / _new_version_id(output.stat().st_mtime)
+    version.mkdir(parents=True)
+    os.rename(output, version / OUTPUT_DIR)
+    logger.info(f"Moved the existing output of '{Path(kb_path).name}' to {version}")
+    return version.name
+
+
+def _point_output_to(kb_path, version):
+    """Atomically replace the output symlink with one to the given version"""
+    kb_path = Path(kb_path)
+    output = kb_path / OUTPUT_DIR
+    temporary = kb_path / f".{OUTPUT_DIR}-{uuid.uuid4().hex[:8]}"
+    _link(versions_dir(kb_path) / version / OUTPUT_DIR, temporary)
+    os.replace(temporary, output)
+
+
+def promote(kb_path, stage, snapshot=None):
+    """Make a finished staging root the current version and return its name
+
+    snapshot is the input manifest state the build indexed; it is stored
+    with the version so a rollback can restore it.
+    """
+    kb_path, stage = Path(kb_path), Path(stage)
+    if not (stage / OUTPUT_DIR).is_dir():
+        raise VersionError(f"The build in {stage} did not write an output folder")
+    version = stage.name[len(STAGING_PREFIX):]
+    if snapshot is not None:
+        with open(stage / SNAPSHOT_NAME, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+    (stage / OWNER_NAME).unlink(missing_ok=True)
+    os.rename(stage, versions_dir(kb_path) / version)
+    _adopt_legacy_output(kb_path)
+    _point_output_to(kb_path, version)
+    logger.info(f"Knowledge base '{kb_path.name}' now serves index version {version}")
+    return version
+
+
+def list_versions(kb_path):
+    """Kept versions, newest first, as dicts with name, created, bytes, files and current"""
+    root = versions_dir(kb_path)
+    if not root.is_dir():
+        return []
+    current = current_version(kb_path)
+    versions = []
+    for entry in sorted(root.iterdir(), reverse=True):
+        if entry.name.startswith(STAGING_PREFIX) or not (entry / OUTPUT_DIR).is_dir():
+            continue
+        size, files = dir_size(entry / OUTPUT_DIR)
+        versions.append({"name": entry.name, "created": (entry / OUTPUT_DIR).stat().st_mtime,
+                         "bytes": size, "files": files, "current": entry.name == current})
+    return versions
+
+
+def rollback(kb_path, version):
+    """Serve an earlier version again; returns its input snapshot, if it has one"""
+    path = versions_dir(kb_path) / version
+    if not (path / OUTPUT_DIR).is_dir() or version.startswith(STAGING_PREFIX):
+        raise VersionError(f"Index version '{version}' does not exist")
+    _adopt_legacy_output(kb_path)
+    _point_output_to(kb_path, version)
+    logger.info(f"Rolled knowledge base '{Path(kb_path).name}' back to index version {version}")
+    try:
+        with open(path / SNAPSHOT_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _staging_abandoned(stage):
+    """Whether the process that created a staging root has exited"""
+    try:
+        with open(Path(stage) / OWNER_NAME, "r", encoding="utf-8") as f:
+            owner = json.load(f)
+    except (OSError, ValueError):
+        return True  # Not created by prepare_staging, or left half-written
+    return not owner_alive(owner)
+
+
+def collect_garbage(kb_path, keep=KEEP_VERSIONS, keep_staging=()):
+    """Delete versions beyond the newest `keep` besides the current one
+
+    Staging roots of interrupted builds are deleted too: those whose process
+    has exited, except the ones listed in keep_staging (builds that are still
+    active, e.g. handed to an indexing worker). Returns the names of the
+    removed entries.
+    """
+    root = versions_dir(kb_path)
+    if not root.is_dir():
+        return []
+    current = current_version(kb_path)
+    keep_staging = {Path(stage).name for stage in keep_staging}
+    removed, kept = [], 0
+    for entry in sorted(root.iterdir(), reverse=True):
+        if entry.name == current:
+            continue
+        if entry.name.startswith(STAGING_PREFIX):
+            if entry.name in keep_staging or not _staging_abandoned(entry):
+                continue
+        elif kept < keep:
+            kept += 1
+            continue
+        _remove_version(entry)
+        removed.append(entry.name)
+    if removed:
+        logger.info(f"Removed old index versions of '{Path(kb_path).name}': {removed}")
+    return removed
+
+
+def delete_all(kb_path):
+    """Remove the output and every kept version of a knowledge base"""
+    kb_path = Path(kb_path)
+    output = kb_path / OUTPUT_DIR
+    if output.is_symlink():
+        output.unlink()
+    elif output.is_dir():
+        shutil.rmtree(output)
+    root = versions_dir(kb_path)
+    if root.is_dir():
+        for entry in root.iterdir():
+            _remove_version(entry)
+        root.rmdir()
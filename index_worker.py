@@ -0,0 +1,192 @@
+"""Indexing worker that runs graphrag for jobs claimed from the job spool
+
+    python index_worker.py [--name NAME] [--spool DIR] [--kb-dir DIR] [--once]
+
+Start any number of workers, on this host or on other hosts that mount the
+same knowledge_bases volume and spool folder (see job_spool). Each worker
+claims one job at a time, runs graphrag for it in the job's staging root and
+writes its progress and result back to the spool, where the web UI or HTTP
+API that submitted the job picks it up and swaps the new index in. While any
+worker is alive, indexing no longer runs in the UI's own process.
+
+A background thread refreshes the worker's registration and the claim of the
+running job every HEARTBEAT_SECONDS. It stops graphrag when the job is
+cancelled or when its claim was reclaimed by another process. SIGTERM and
+Ctrl-C put a running job back into the queue for another worker.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+
+from index_jobs import IndexJob, execute, terminate
+from job_spool import HEARTBEAT_SECONDS, POLL_SECONDS, JobSpool
+from kb_core import KB_DIR, ROOT_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def _with_root(args, root):
+    args = list(args)
+    args[args.index("--root") + 1] = str(root)
+    return args
+
+
+class IndexWorker:
+    def __init__(self, spool_dir=None, kb_dir=KB_DIR, name=None, cwd=ROOT_DIR):
+        self.spool = JobSpool(spool_dir)
+        self.kb_dir = Path(kb_dir)
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.cwd = cwd
+        self.started = time.time()
+        self.succeeded = 0
+        self.failed = 0
+        self._job = None
+        self._token = None
+        self._process = None
+        self._outcome = None  # "cancelled", "lost" or "released" once the run was stopped
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _register(self):
+        job = self._job
+        self.spool.register_worker(
+            self.name, started=self.started, succeeded=self.succeeded, failed=self.failed,
+            job=job.id if job else None, kb=job.kb_name if job else None,
+            workflow=job.current_workflow if job else None,
+            workflows_done=len(job.workflows) if job else 0)
+
+    def _heartbeat(self):
+        with self._lock:
+            job, token = self._job, self._token
+        if job:
+            if not self.spool.heartbeat(job.id, token):
+                logger.warning(f"Lost the claim on job {job.id}, stopping graphrag")
+                self._abort("lost")
+            elif self.spool.cancel_requested(job.id):
+                logger.info(f"Job {job.id} was cancelled")
+                self._abort("cancelled")
+        self._register()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                self._heartbeat()
+            except OSError as e:
+                logger.error(f"Heartbeat failed: {e}")
+
+    def _abort(self, outcome):
+        with self._lock:
+            if self._job is None or self._outcome:
+                return
+            self._outcome = outcome
+            process = self._process
+        if process:
+            terminate(process)
+
+    def _started(self, process):
+        with self._lock:
+            self._process = process
+            stopped = self._outcome is not None
+        if stopped:
+            terminate(process)
+
+    def run_job(self, job_id, token):
+        """Run a claimed job and report its result to the spool"""
+        state = self.spool.read(job_id)
+        if state is None:
+            logger.error(f"Job {job_id} has no state file, dropping it")
+            self.spool.finish(job_id, token)
+            return
+        job = IndexJob.from_dict(state, self.spool.jobs_dir)
+        root = self.kb_dir / job.kb_name / state.get("root", ".")
+        job.args = _with_root(job.args, root)
+        job.worker = self.name
+        job.attempts = state.get("attempts", 0) + 1
+        job.workflows, job.error, job.returncode, job.finished = [], None, None, None
+        with self._lock:
+            self._job, self._token, self._process, self._outcome = job, token, None, None
+        job.save()
+        self._register()
+        logger.info(f"Running job {job.id} for '{job.kb_name}' (attempt {job.attempts})")
+        succeeded = False
+        try:
+            if root.is_dir():
+                succeeded, _peak_rss = execute(job, self.cwd, on_start=self._started)
+            else:
+                job.error = f"{root} does not exist on worker '{self.name}'"
+        finally:
+            with self._lock:
+                outcome = self._outcome
+                self._job = self._token = self._process = None
+        if outcome == "lost":
+            return  # Another process has the job now
+        if outcome == "released":
+            self.spool.release(job_id, token)
+            logger.info(f"Put job {job_id} back into the queue")
+            return
+        if outcome == "cancelled":
+            job.status = "cancelled"
+        elif succeeded and job.returncode == 0:
+            job.status = "succeeded"
+        else:
+            job.status = "failed"
+        job.finished = job.finished or time.time()
+        if self.spool.holds(job_id, token):
+            job.save()
+            self.spool.finish(job_id, token)
+        if job.status == "succeeded":
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self._register()
+        logger.info(f"Job {job.id} for '{job.kb_name}' {job.status} after {job.elapsed():.1f}s")
+
+    def run(self, once=False):
+        """Claim and run jobs until stop() is called, or until the queue is empty with once"""
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="heartbeat", daemon=True)
+        heartbeat.start()
+        self._register()
+        logger.info(f"Indexing worker '{self.name}' watching {self.spool.root}")
+        try:
+            while not self._stop.is_set():
+                self.spool.reclaim_stale()
+                claimed = self.spool.claim_next(self.name)
+                if claimed:
+                    self.run_job(*claimed)
+                elif once:
+                    break
+                else:
+                    self._stop.wait(POLL_SECONDS)
+        finally:
+            self._stop.set()
+            heartbeat.join()
+            self.spool.unregister_worker(self.name)
+
+    def stop(self):
+        self._stop.set()
+        self._abort("released")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run indexing jobs from the GraphRAG job spool")
+    parser.add_argument("--name", help="worker name (default: <host>-<pid>)")
+    parser.add_argument("--spool", help="spool folder (default: GRAPHRAG_SPOOL_DIR or ./spool)")
+    parser.add_argument("--kb-dir", default=str(KB_DIR),
+                        help="where the shared knowledge_bases volume is mounted")
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    worker = IndexWorker(args.spool, args.kb_dir, args.name)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: worker.stop())
+    worker.run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Content-hash manifest of a knowledge base's input documents
+
+The manifest records the SHA-256, size and modification time of every
+input/*.txt file, together with a snapshot of the files as they were at the
+last successful index. Comparing the two tells which documents were added,
+changed or deleted since then.
+"""
+import copy
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+import yaml
+
+MANIFEST_NAME = "input_manifest.json"
+# Input documents kept out of indexing, e.g. near-duplicates (see near_duplicates)
+EXCLUDED_DIR = "input_excluded"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# graphrag defaults for text chunking, in tokens
+DEFAULT_CHUNK_SIZE = 1200
+DEFAULT_CHUNK_OVERLAP = 100
+# Rough bytes-per-token ratio used before any real tokenization
+BYTES_PER_TOKEN = 4
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _kb_lock(kb_path):
+    """Serialize manifest updates per knowledge base within this process"""
+    key = str(Path(kb_path).resolve())
+    with _locks_lock:
+        return _locks.setdefault(key, threading.RLock())
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_entry(path, sha256=None):
+    stat = Path(path).stat()
+    return {
+        "sha256": sha256 or hash_file(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+class InputManifest:
+    """Manifest of input/*.txt files stored in the knowledge base directory"""
+
+    def __init__(self, kb_path):
+        self.kb_path = Path(kb_path)
+        self.input_path = self.kb_path / "input"
+        self.path = self.kb_path / MANIFEST_NAME
+        self.lock = _kb_lock(self.kb_path)
+        self.files = {}
+        self.indexed = None
+        self.indexed_at = None
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.files = data.get("files", {})
+        self.indexed = data.get("indexed")
+        self.indexed_at = data.get("indexed_at")
+
+    def save(self):
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "indexed": self.indexed,
+                       "indexed_at": self.indexed_at}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def record(self, name, sha256=None):
+        """Add or update the entry of an input file written by the web UI"""
+        with self.lock:
+            self._load()
+            self.files[name] = file_entry(self.input_path / name, sha256)
+            self.save()
+
+    def record_many(self, entries):
+        """Add or update several entries at once, e.g. after a batch upload"""
+        with self.lock:
+            self._load()
+            self.files.update(entries)
+            self.save()
+
+    def remove(self, name):
+        """Drop the entry of a deleted input file"""
+        with self.lock:
+            self._load()
+            if self.files.pop(name, None) is not None:
+                self.save()
+
+    def remove_many(self, names):
+        """Drop the entries of several deleted input files at once"""
+        with self.lock:
+            self._load()
+            removed = [name for name in names if self.files.pop(name, None) is not None]
+            if removed:
+                self.save()
+
+    def refresh(self):
+        """Sync the manifest with the input folder
+
+        Files whose size and modification time are unchanged keep their hash;
+        only new or modified files are re-hashed.
+        """
+        with self.lock:
+            self._load()
+            current = {}
+            for path in self.input_path.glob("*.txt"):
+                stat = path.stat()
+                entry = self.files.get(path.name)
+                if (entry and entry["size"] == stat.st_size
+                        and entry["mtime_ns"] == stat.st_mtime_ns):
+                    current[path.name] = entry
+                else:
+                    current[path.name] = file_entry(path)
+            if current != self.files:
+                self.files = current
+                self.save()
+            return self
+
+    def by_hash(self):
+        """Map content hashes to the file names holding that content"""
+        hashes = {}
+        for name, entry in self.files.items():
+            hashes.setdefault(entry["sha256"], []).append(name)
+        return hashes
+
+    def snapshot(self):
+        return copy.deepcopy(self.files)
+
+    def mark_indexed(self, snapshot=None):
+        """Remember the given (or current) files as the last indexed state"""
+        with self.lock:
+            self._load()
+            self.indexed = snapshot if snapshot is not None else self.snapshot()
+            self.indexed_at = time.time()
+            self.save()
+
+    def reset_indexed(self):
+        """Forget the last indexed state, e.g. after the output was cleared"""
+        with self.lock:
+            self._load()
+            self.indexed = None
+            self.indexed_at = None
+            self.save()
+
+    def diff(self):
+        """Compare the input folder with the last indexed state
+
+        Returns a dict with the 'added', 'changed' and 'deleted' file names.
+        Without an indexed snapshot every file counts as added.
+        """
+        indexed = self.indexed or {}
+        added, changed = [], []
+        for name, entry in self.files.items():
+            previous = indexed.get(name)
+            if previous is None:
+                added.append(name)
+            elif previous["sha256"] != entry["sha256"]:
+                changed.append(name)
+        deleted = [name for name in indexed if name not in self.files]
+        return {"added": sorted(added), "changed": sorted(changed),
+                "deleted": sorted(deleted)}
+
+
+def read_chunk_settings(kb_path):
+    """Read the chunk size and overlap (in tokens) from settings.yaml"""
+    size, overlap = DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+    settings_path = Path(kb_path) / "settings.yaml"
+    try:
+        with open(settings_path, "r", encoding="utf-8") as f:
+            settings = yaml.safe_load(f) or {}
+        chunks = settings.get("chunks") or {}
+        size = int(chunks.get("size", size))
+        overlap = int(chunks.get("overlap", overlap))
+    except (OSError, ValueError, TypeError, AttributeError, yaml.YAMLError):
+        pass
+    return size, overlap
+
+
+def estimate_chunks(tokens, chunk_size, overlap):
+    """Number of chunks graphrag's token splitter produces for a document"""
+    if tokens <= 0:
+        return 0
+    step = max(chunk_size - overlap, 1)
+    return max(1, math.ceil(max(tokens - overlap, 1) / step))
+
+
+def estimate_delta(manifest, names):
+    """Estimate how many chunks the given documents will be split into"""
+    chunk_size, overlap = read_chunk_settings(manifest.kb_path)
+    return sum(
+        estimate_chunks(math.ceil(manifest.files[name]["size"] / BYTES_PER_TOKEN),
+                        chunk_size, overlap)
+        for name in names if name in manifest.files)
@@ -0,0 +1,287 @@
+"""Directory-backed queue that hands indexing jobs to worker processes
+
+The spool is a folder shared by the web UI, the HTTP API and the indexing
+workers (index_worker.py), which may run on this host or on other hosts that
+mount the same knowledge_bases volume:
+
+    spool/jobs/<id>.json        job state, written by the submitter and then by the claiming worker
+    spool/jobs/<id>.log         graphrag output of the job
+    spool/queue/<id>            jobs that are waiting for or held by a worker
+    spool/claims/<id>.json      the worker holding a job; its modification time is the heartbeat
+    spool/cancel/<id>           cancellation requests
+    spool/workers/<name>.json   registered workers, refreshed with every heartbeat
+
+A job is claimed by creating its claim file with O_CREAT | O_EXCL, which only
+one process can win, also on NFS. A claim whose heartbeat is older than
+STALE_SECONDS is reclaimed by renaming the claim file away (again only one
+process wins) and the job goes back to the queue, up to MAX_ATTEMPTS times.
+A worker that finds its claim gone stops its graphrag run. Jobs refer to
+their knowledge base by name and to the staging root by a path relative to
+it, so workers can mount the volume anywhere.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = Path(os.environ.get("GRAPHRAG_SPOOL_DIR",
+                                Path(__file__).parent.resolve() / "spool"))
+# "auto" hands jobs to the workers while any is alive, "spool" always, "local" never
+INDEX_MODE = os.environ.get("GRAPHRAG_INDEX_MODE", "auto").lower()
+HEARTBEAT_SECONDS = float(os.environ.get("GRAPHRAG_SPOOL_HEARTBEAT", "5"))
+STALE_SECONDS = float(os.environ.get("GRAPHRAG_SPOOL_STALE", "60"))
+MAX_ATTEMPTS = int(os.environ.get("GRAPHRAG_SPOOL_MAX_ATTEMPTS", "3"))
+POLL_SECONDS = 1.0
+# Workers silent for this long are dropped from the list
+WORKER_EXPIRY = 24 * 3600
+
+ACTIVE_STATES = {"queued", "running"}
+
+
+def log_path(spool_root, job_id):
+    return Path(spool_root) / "jobs" / f"{job_id}.log"
+
+
+def _write_json(path, data):
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _age(path, now=None):
+    try:
+        return (now or time.time()) - path.stat().st_mtime
+    except OSError:
+        return None
+
+
+class JobSpool:
+    """Submit, claim, heartbeat and finish indexing jobs in a spool folder"""
+
+    def __init__(self, root=None):
+        self.root = Path(root or SPOOL_DIR)
+        self.jobs_dir = self.root / "jobs"
+        for name in ("jobs", "queue", "claims", "cancel", "workers"):
+            (self.root / name).mkdir(parents=True, exist_ok=True)
+
+    def job_path(self, job_id):
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _claim_path(self, job_id):
+        return self.root / "claims" / f"{job_id}.json"
+
+    def _queue_path(self, job_id):
+        return self.root / "queue" / job_id
+
+    def _cancel_path(self, job_id):
+        return self.root / "cancel" / job_id
+
+    # Submitting
+
+    def enqueue(self, job):
+        """Queue a job given as IndexJob.to_dict()"""
+        state = dict(job, status="queued", worker=None, spool=str(self.root))
+        root = job["args"][job["args"].index("--root") + 1]
+        state["root"] = os.path.relpath(root, job["kb_path"])
+        _write_json(self.job_path(job["id"]), state)
+        self._queue_path(job["id"]).touch()
+
+    def read(self, job_id):
+        return _read_json(self.job_path(job_id))
+
+    def request_cancel(self, job_id):
+        """Cancel a job: at once if no worker holds it, otherwise by its worker"""
+        self._cancel_path(job_id).touch()
+        token = self.claim(job_id, "cancel")
+        if token:
+            self._update(job_id, status="cancelled", finished=time.time())
+            self.finish(job_id, token)
+        elif not self._queue_path(job_id).exists():
+            self._cancel_path(job_id).unlink(missing_ok=True)  # Already finished
+
+    def withdraw(self, job_id):
+        """Take a queued job back from the spool; False if a worker claimed it first"""
+        token = self.claim(job_id, "withdrawn")
+        if token is None:
+            return False
+        self._update(job_id, status="withdrawn")
+        self.finish(job_id, token)
+        return True
+
+    # Claiming
+
+    def pending(self):
+        """Queued job ids without a claim, oldest first"""
+        return [path.name for path in sorted((self.root / "queue").iterdir())
+                if not self._claim_path(path.name).exists()]
+
+    def claim(self, job_id, worker):
+        """Claim a queued job for worker; returns the claim's token or None"""
+        if not self._queue_path(job_id).exists():
+            return None
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(self._claim_path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"worker": worker, "host": socket.gethostname(), "pid": os.getpid(),
+                       "token": token, "claimed": time.time()}, f)
+        if not self._queue_path(job_id).exists():  # Finished between the check and the claim
+            self._claim_path(job_id).unlink(missing_ok=True)
+            return None
+        return token
+
+    def claim_next(self, worker):
+        """Claim the oldest unclaimed job; returns (job id, token) or None"""
+        for job_id in self.pending():
+            token = self.claim(job_id, worker)
+            if token:
+                return job_id, token
+        return None
+
+    def holds(self, job_id, token):
+        claim = _read_json(self._claim_path(job_id))
+        return bool(claim) and claim.get("token") == token
+
+    def heartbeat(self, job_id, token):
+        """Refresh a claim; False once it was reclaimed by another process"""
+        if not self.holds(job_id, token):
+            return False
+        try:
+            os.utime(self._claim_path(job_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def cancel_requested(self, job_id):
+        return self._cancel_path(job_id).exists()
+
+    def release(self, job_id, token):
+        """Put a claimed job back into the queue, e.g. when its worker shuts down"""
+        if self.holds(job_id, token):
+            self._update(job_id, status="queued", worker=None, current_workflow=None)
+            self._claim_path(job_id).unlink(missing_ok=True)
+
+    def finish(self, job_id, token):
+        """Remove a finished job from the queue; its state file stays as the result"""
+        if not self.holds(job_id, token):
+            return False
+        self._queue_path(job_id).unlink(missing_ok=True)
+        self._cancel_path(job_id).unlink(missing_ok=True)
+        self._claim_path(job_id).unlink(missing_ok=True)
+        return True
+
+    def _update(self, job_id, **fields):
+        state = self.read(job_id)
+        if state is not None:
+            state.update(fields)
+            _write_json(self.job_path(job_id), state)
+        return state
+
+    def reclaim_stale(self, stale_seconds=STALE_SECONDS):
+        """Requeue jobs whose worker stopped sending heartbeats; returns their ids
+
+        A job whose worker was lost on its MAX_ATTEMPTS-th run fails instead.
+        """
+        reclaimed = []
+        now = time.time()
+        for claim_path in (self.root / "claims").glob("*.json"):
+            age = _age(claim_path, now)
+            if age is None or age < stale_seconds:
+                continue
+            job_id = claim_path.stem
+            moved = claim_path.with_name(f"{claim_path.name}.stale-{uuid.uuid4().hex[:8]}")
+            try:
+                os.rename(claim_path, moved)  # Only one process wins the rename
+            except FileNotFoundError:
+                continue
+            claim = _read_json(moved) or {}
+            attempts = (self.read(job_id) or {}).get("attempts", 0)
+            if attempts >= MAX_ATTEMPTS:
+                self._update(job_id, status="failed", finished=now,
+                             current_workflow=None,
+                             error=f"Worker '{claim.get('worker')}' stopped responding "
+                                   f"({attempts} attempts)")
+                self._queue_path(job_id).unlink(missing_ok=True)
+            else:
+                self._update(job_id, status="queued", worker=None, current_workflow=None)
+            moved.unlink(missing_ok=True)
+            logger.warning(f"Reclaimed indexing job {job_id} from worker '{claim.get('worker')}' "
+                           f"after {age:.0f}s without a heartbeat")
+            reclaimed.append(job_id)
+        return reclaimed
+
+    def claims(self):
+        """Current claims by job id, with the seconds since their last heartbeat"""
+        claims = {}
+        now = time.time()
+        for claim_path in (self.root / "claims").glob("*.json"):
+            claim = _read_json(claim_path) or {}
+            claim.pop("token", None)
+            claim["heartbeat_age"] = _age(claim_path, now)
+            claims[claim_path.stem] = claim
+        return claims
+
+    def queue(self):
+        """Queued and running jobs as (state, claim or None), oldest first"""
+        claims = self.claims()
+        entries = []
+        for path in sorted((self.root / "queue").iterdir()):
+            state = self.read(path.name)
+            if state is not None:
+                entries.append((state, claims.get(path.name)))
+        return entries
+
+    # Workers
+
+    def register_worker(self, name, **info):
+        _write_json(self.root / "workers" / f"{name}.json",
+                    {"name": name, "host": socket.gethostname(), "pid": os.getpid(),
+                     **info, "last_seen": time.time()})
+
+    def unregister_worker(self, name):
+        (self.root / "workers" / f"{name}.json").unlink(missing_ok=True)
+
+    def workers(self):
+        """Registered workers, each with 'alive' telling if it sent a heartbeat recently"""
+        workers = []
+        now = time.time()
+        for path in sorted((self.root / "workers").glob("*.json")):
+            info = _read_json(path)
+            if info is None:
+                continue
+            age = now - info.get("last_seen", 0)
+            if age > WORKER_EXPIRY:
+                path.unlink(missing_ok=True)
+                continue
+            info["alive"] = age < STALE_SECONDS
+            info["heartbeat_age"] = age
+            workers.append(info)
+        return workers
+
+    def live_workers(self):
+        return [worker for worker in self.workers() if worker["alive"]]
+
+
+def use_spool():
+    """Whether indexing jobs started now go to the workers"""
+    if INDEX_MODE == "spool":
+        return True
+    if INDEX_MODE == "local":
+        return False
+    return bool(JobSpool().live_workers())
@@ -0,0 +1,55 @@
+import hashlib
+from pathlib import Path
+
+# Artifact names written by GraphRAG. Older releases prefix the tables with
+# "create_final_", newer ones use the bare table name.
+ARTIFACT_PREFIX = "create_final_"
+
+
+def output_dir(kb_path):
+    """Return the output directory holding the knowledge base's index artifacts"""
+    return Path(kb_path) / "output"
+
+
+def artifact_key(path):
+    """Normalize an artifact file name to its table name, e.g. 'entities'"""
+    stem = Path(path).stem
+    if stem.startswith(ARTIFACT_PREFIX):
+        stem = stem[len(ARTIFACT_PREFIX):]
+    return stem
+
+
+def list_artifacts(kb_path):
+    """List the parquet artifacts of a knowledge base, keyed by table name"""
+    out_dir = output_dir(kb_path)
+    if not out_dir.is_dir():
+        return {}
+    return {artifact_key(p): p for p in sorted(out_dir.glob("*.parquet"))}
+
+
+def find_artifact(kb_path, name):
+    """Return the path of a single artifact table, or None if it does not exist"""
+    return list_artifacts(kb_path).get(name)
+
+
+def index_fingerprint(kb_path):
+    """Fingerprint the index artifacts by name, size and modification time
+
+    Returns an empty string when the knowledge base has not been indexed yet.
+    """
+    out_dir = output_dir(kb_path)
+    if not out_dir.is_dir():
+        return ""
+    digest = hashlib.sha1()
+    found = False
+    for path in sorted(out_dir.rglob("*")):
+        if not path.is_file():
+            continue
+        # Only the index tables and the vector store matter for querying
+        rel = path.relative_to(out_dir).as_posix()
+        if path.suffix != ".parquet" and "lancedb" not in rel:
+            continue
+        stat = path.stat()
+        digest.update(f"{rel}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+        found = True
+    return digest.hexdigest() if found else ""
@@ -0,0 +1,182 @@
+"""asyncio counterparts of kb_core's graphrag subprocess paths
+
+Used by the HTTP API (api_server.py). graphrag runs under
+asyncio.create_subprocess_exec and its output is read in chunks without
+blocking the event loop, optionally handed to a callback as it arrives, and
+logged and recorded exactly like kb_core.run_graphrag_command. Knowledge base
+locks, the query cache and the warm query workers are shared with the web UI.
+"""
+import asyncio
+import codecs
+import logging
+import subprocess
+import time
+from pathlib import Path
+
+from kb_core import (RESPONSE_MARKERS, ROOT_DIR, KnowledgeBaseError, PartialAnswer,
+                     ResponseStream, _option, _record_command, init_succeeded, kb_path_for,
+                     parse_graphrag_response, query_args, record_query)
+from kb_locks import LOCK_TIMEOUT, reading_async
+from query_cache import get_query_cache, normalize_query
+from query_workers import get_worker_pool
+from run_logs import CHUNK_CHARS, OutputTail, open_run_log
+
+logger = logging.getLogger(__name__)
+
+_in_flight = {}
+
+
+async def run_graphrag_command(args, cwd, timeout=None, on_output=None, on_response=None):
+    """Run a graphrag command without blocking the event loop
+
+    Same contract as kb_core.run_graphrag_command: returns the tail of the
+    output (prefixed with "Error: " on a non-zero exit) and raises
+    subprocess.TimeoutExpired after timeout. on_output(text) is called with
+    every chunk of output as it arrives, on_response(text) with each piece
+    of a query's response. The child is killed when the calling task is
+    cancelled, e.g. because an API client disconnected.
+    """
+    start = time.perf_counter()
+    root = _option(args, "--root")
+    subcommand = args[0] if args else ""
+    output_tail = OutputTail(capture_markers=RESPONSE_MARKERS.values())
+    marker = RESPONSE_MARKERS.get((_option(args, "--method") or "").lower())
+    response_stream = ResponseStream(marker, on_response) if on_response and marker else None
+    process = await asyncio.create_subprocess_exec(
+        "python", "-m", "graphrag", *args, cwd=str(cwd),
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def pump(log):
+        while True:
+            data = await process.stdout.read(CHUNK_CHARS)
+            chunk = decoder.decode(data, final=not data)
+            if chunk:
+                output_tail.feed(chunk)
+                log.write(chunk)
+                if on_output:
+                    on_output(chunk)
+                if response_stream:
+                    response_stream.feed(chunk)
+            if not data:
+                return await process.wait()
+
+    log = open_run_log(subcommand, Path(root).name if root else "")
+    try:
+        log.write(f"$ python -m graphrag {' '.join(args)}\n")
+        returncode = await asyncio.wait_for(pump(log), timeout)
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(["python", "-m", "graphrag"] + args, timeout,
+                                        output_tail.text())
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        log.close()
+        _record_command(args, time.perf_counter() - start, process.returncode,
+                        output_tail.total_bytes, None, log.path.name)
+    output = output_tail.text()
+    if returncode != 0:
+        return f"Error: {output}"
+    return output
+
+
+async def init_knowledge_base(kb_path, cwd=ROOT_DIR):
+    """Create the folders of a knowledge base and run graphrag init; returns (success, output)"""
+    kb_path = Path(kb_path)
+    await asyncio.to_thread((kb_path / "input").mkdir, parents=True, exist_ok=True)
+    output = await run_graphrag_command(["init", "--root", str(kb_path)], cwd=cwd)
+    return init_succeeded(kb_path, output), output
+
+
+async def create_knowledge_base(name, cwd=ROOT_DIR):
+    kb_path = kb_path_for(name, must_exist=False)
+    if kb_path.exists():
+        raise KnowledgeBaseError(f"Knowledge base '{name}' already exists")
+    return await init_knowledge_base(kb_path, cwd=cwd)
+
+
+async def _shared(key, function):
+    """Await the identical call already in flight, or run function() as the first caller"""
+    future = _in_flight.get(key)
+    if future is not None:
+        return await asyncio.shield(future), True
+    future = _in_flight[key] = asyncio.get_running_loop().create_future()
+    try:
+        result = await function()
+    except asyncio.CancelledError:
+        future.set_exception(TimeoutError("The identical query in progress was cancelled"))
+        future.exception()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # Nobody may be waiting; don't warn about it
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        _in_flight.pop(key, None)
+    return result, False
+
+
+async def answer_query(kb_path, method, query, cwd=ROOT_DIR, use_cache=True, timeout=None,
+                       on_output=None, on_partial=None):
+    """Answer a question like kb_core.answer_query, from a coroutine
+
+    Returns (response, output, source) where source is 'cache', 'worker',
+    'cli' or 'shared' (another request's identical query). on_output gets
+    the graphrag CLI's output as it arrives; answers from the cache or a
+    worker produce no output. on_partial works as in kb_core.answer_query
+    and is always called on the event loop.
+    """
+    start = time.perf_counter()
+    kb_path = Path(kb_path)
+    partial = PartialAnswer(on_partial, start)
+    loop = asyncio.get_running_loop()
+
+    def worker_delta(text):
+        # Called from the worker's thread; runs before to_thread() returns to us
+        loop.call_soon_threadsafe(partial, text)
+
+    def remaining():
+        if timeout is None:
+            return None
+        left = timeout - (time.perf_counter() - start)
+        if left <= 0:
+            raise TimeoutError(f"No answer from '{kb_path.name}' within {timeout}s")
+        return left
+
+    async def run():
+        async with reading_async(kb_path, timeout=remaining() or LOCK_TIMEOUT):
+            response = await asyncio.to_thread(
+                get_worker_pool().query, kb_path, method, query, remaining(),
+                worker_delta if on_partial else None)
+            if response is not None:
+                return response, "", "worker"
+            partial.restart()
+            try:
+                output = await run_graphrag_command(
+                    query_args(kb_path, method, query), cwd=cwd, timeout=remaining(),
+                    on_output=on_output, on_response=partial if on_partial else None)
+            except subprocess.TimeoutExpired:
+                raise TimeoutError(f"No answer from '{kb_path.name}' within {timeout}s")
+            return parse_graphrag_response(output, method), output, "cli"
+
+    cache = get_query_cache()
+    response = await asyncio.to_thread(cache.get, kb_path, method, query) if use_cache else None
+    output, source = "", "cache"
+    if response is None:
+        key = (str(kb_path.resolve()), method.lower(), normalize_query(query))
+        try:
+            (response, output, source), shared = await asyncio.wait_for(
+                _shared(key, run), remaining())
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No answer from '{kb_path.name}' within {timeout}s")
+        if shared:
+            source = "shared"
+        elif response:
+            await asyncio.to_thread(cache.put, kb_path, method, query, response)
+    if on_partial and response and partial.first_token is None:
+        partial(response)  # Cached, shared or not streamed
+    record_query(kb_path, method, source, response, time.perf_counter() - start, partial)
+    return response, output, source
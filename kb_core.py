@@ -0,0 +1,458 @@
+"""Knowledge base operations shared by the English and Chinese web UIs and the HTTP API"""
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+from fs_cache import filter_names, list_dirs, list_files
+from index_jobs import get_job_manager
+from index_profile import delete_profiles, log_offsets, read_settings, record_run
+from index_versions import (VERSIONS_DIR, collect_garbage, discard_staging, is_versioned,
+                            prepare_staging, promote, supports_symlinks)
+from input_manifest import EXCLUDED_DIR, MANIFEST_NAME, InputManifest
+from metrics import get_metrics, wait_for_child
+from kb_locks import LOCK_TIMEOUT, get_single_flight, reading, writing
+from query_cache import get_query_cache, normalize_query
+from query_workers import get_worker_pool
+from run_logs import OutputTail, open_run_log, read_chunks
+
+logger = logging.getLogger(__name__)
+
+# Root directories
+ROOT_DIR = Path(__file__).parent.resolve()
+KB_DIR = ROOT_DIR / "knowledge_bases"
+
+QUERY_METHODS = ["local", "global", "drift"]
+RESPONSE_MARKERS = {
+    "local": "SUCCESS: Local Search Response:",
+    "global": "SUCCESS: Global Search Response:",
+    "drift": "SUCCESS: DRIFT Search Response:"
+}
+
+
+class KnowledgeBaseError(Exception):
+    """Raised for invalid, unknown or already existing knowledge base names"""
+
+
+class ResponseStream:
+    """Pass on a query's response as it arrives in the command output
+
+    Everything before the method's SUCCESS marker is progress output and is
+    dropped; the marker is found even when it is split across two chunks.
+    """
+
+    def __init__(self, marker, on_response):
+        self.marker = marker
+        self.on_response = on_response
+        self._pending = ""
+        self._started = False
+        self._leading = True
+
+    def feed(self, chunk):
+        if not self._started:
+            self._pending += chunk
+            index = self._pending.find(self.marker)
+            if index == -1:
+                self._pending = self._pending[-(len(self.marker) - 1):]
+                return
+            self._started = True
+            chunk = self._pending[index + len(self.marker):]
+            self._pending = ""
+        if self._leading:
+            chunk = chunk.lstrip()  # parse_graphrag_response strips it too
+            self._leading = not chunk
+        if chunk:
+            self.on_response(chunk)
+
+
+class PartialAnswer:
+    """Collect a streamed answer, reporting the text so far to on_partial
+
+    Also remembers when the first piece arrived, for the time-to-first-token
+    metric.
+    """
+
+    def __init__(self, on_partial, start):
+        self.on_partial = on_partial
+        self.start = start
+        self.first_token = None
+        self._pieces = []
+
+    def __call__(self, text):
+        if not text:
+            return
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+        self._pieces.append(text)
+        if self.on_partial:
+            self.on_partial("".join(self._pieces))
+
+    def restart(self):
+        """Drop what a failed worker streamed before the CLI answers again"""
+        if self._pieces:
+            self._pieces = []
+            if self.on_partial:
+                self.on_partial("")
+
+
+def _option(args, name):
+    return args[args.index(name) + 1] if name in args[:-1] else None
+
+
+def _record_command(args, seconds, returncode, output_bytes, peak_rss, log_name):
+    subcommand = args[0] if args else ""
+    root = _option(args, "--root")
+    kb_name = Path(root).name if root else ""
+    labels = {"subcommand": subcommand, "kb": kb_name,
+              "method": _option(args, "--method") or "",
+              "exit_code": returncode}
+    get_metrics().observe("command", seconds, labels,
+                          output_bytes=output_bytes, peak_rss_bytes=peak_rss)
+    logger.info(f"graphrag {subcommand} for '{kb_name}' exited with {returncode} after "
+                f"{seconds:.2f}s ({output_bytes} bytes of output, log {log_name})")
+
+
+def run_graphrag_command(args, cwd, timeout=None, on_response=None):
+    """Call GraphRAG commands via subprocess and record their metrics
+
+    The output is streamed into a rotating per-run log under command_logs/
+    and only its tail (plus a query's response) is kept in memory and
+    returned. Every call is recorded with its subcommand, knowledge base,
+    query method, exit code, wall time, the child's peak RSS and the size of
+    its output. With a timeout the command is killed when it runs longer,
+    and subprocess.TimeoutExpired is raised. For a query, on_response(text)
+    is called with each piece of the response as soon as it is read.
+    """
+    start = time.perf_counter()
+    root = _option(args, "--root")
+    subcommand = args[0] if args else ""
+    kb_name = Path(root).name if root else ""
+    output_tail = OutputTail(capture_markers=RESPONSE_MARKERS.values())
+    marker = RESPONSE_MARKERS.get((_option(args, "--method") or "").lower())
+    response_stream = ResponseStream(marker, on_response) if on_response and marker else None
+    process = subprocess.Popen(
+        ["python", "-m", "graphrag"] + args,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,  # Redirect stderr to stdout
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        with process.stdout, open_run_log(subcommand, kb_name) as log:
+            log.write(f"$ python -m graphrag {' '.join(args)}\n")
+            for chunk in read_chunks(process.stdout):
+                output_tail.feed(chunk)
+                log.write(chunk)
+                if response_stream:
+                    response_stream.feed(chunk)
+        returncode, peak_rss = wait_for_child(process)
+    finally:
+        if timer:
+            timer.cancel()
+    _record_command(args, time.perf_counter() - start, returncode,
+                    output_tail.total_bytes, peak_rss, log.path.name)
+    output = output_tail.text()
+    if timed_out.is_set() and returncode != 0:
+        raise subprocess.TimeoutExpired(process.args, timeout, output)
+    if returncode != 0:
+        return f"Error: {output}"
+    return output
+
+
+def parse_graphrag_response(output, method):
+    """Parse the response from GraphRAG commands"""
+    marker = RESPONSE_MARKERS.get(method.lower())
+    if not marker:
+        return None
+    start = output.find(marker)
+    if start == -1:
+        return None
+    return output[start + len(marker):].strip()
+
+
+def init_knowledge_base(kb_path, cwd=ROOT_DIR):
+    """Create the folders of a knowledge base and run graphrag init
+
+    Returns (success, output).
+    """
+    kb_path = Path(kb_path)
+    (kb_path / "input").mkdir(parents=True, exist_ok=True)
+    output = run_graphrag_command(["init", "--root", str(kb_path)], cwd=cwd)
+    return init_succeeded(kb_path, output), output
+
+
+def init_succeeded(kb_path, output):
+    return f"Initializing project at {kb_path}" in output
+
+
+def query_args(kb_path, method, query):
+    return ["query", "--root", str(kb_path), "--method", method, "--query", query]
+
+
+def answer_query(kb_path, method, query, cwd=ROOT_DIR, use_cache=True, timeout=None,
+                 on_partial=None):
+    """Answer a question against a knowledge base
+
+    Cached answers are returned first. Otherwise a warm query worker is used
+    when one is available, falling back to running the graphrag CLI. Returns
+    (response, output) where output is the raw command output (empty when the
+    answer came from the cache or a worker). Raises TimeoutError when no
+    answer arrived within timeout seconds and kb_locks.KBBusyError when the
+    knowledge base stayed locked by indexing or deletion.
+
+    on_partial(text) is called with the answer so far whenever more of it
+    arrives: token by token from a worker with graphrag's streaming search,
+    line by line from the CLI and at once from the cache. It is called with
+    "" if a failed worker's partial answer is discarded.
+    """
+    start = time.perf_counter()
+    partial = PartialAnswer(on_partial, start)
+
+    def remaining():
+        if timeout is None:
+            return None
+        left = timeout - (time.perf_counter() - start)
+        if left <= 0:
+            raise TimeoutError(f"No answer from '{Path(kb_path).name}' within {timeout}s")
+        return left
+
+    def run():
+        # Shared lock: indexing, cache clearing and deletion wait for this query
+        with reading(kb_path, timeout=remaining() or LOCK_TIMEOUT):
+            response = get_worker_pool().query(kb_path, method, query, timeout=remaining(),
+                                               on_delta=partial if on_partial else None)
+            if response is not None:
+                return response, "", "worker"
+            partial.restart()
+            args = query_args(kb_path, method, query)
+            try:
+                output = run_graphrag_command(args, cwd=cwd, timeout=remaining(),
+                                              on_response=partial if on_partial else None)
+            except subprocess.TimeoutExpired:
+                raise TimeoutError(f"No answer from '{Path(kb_path).name}' within {timeout}s")
+            return parse_graphrag_response(output, method), output, "cli"
+
+    cache = get_query_cache()
+    source = "cache"
+    response = cache.get(kb_path, method, query) if use_cache else None
+    output = ""
+    if response is None:
+        # Identical questions asked at the same time are answered once
+        key = (str(Path(kb_path).resolve()), method.lower(), normalize_query(query))
+        (response, output, source), shared = get_single_flight().do(
+            key, run, timeout=remaining())
+        if shared:
+            source = "shared"
+        elif response:
+            cache.put(kb_path, method, query, response)
+    if on_partial and response and partial.first_token is None:
+        partial(response)  # Cached, shared or not streamed
+    record_query(kb_path, method, source, response, time.perf_counter() - start, partial)
+    return response, output
+
+
+def record_query(kb_path, method, source, response, seconds, partial=None):
+    labels = {"kb": Path(kb_path).name, "method": method, "source": source}
+    get_metrics().observe(
+        "query", seconds, {**labels, "answered": bool(response)},
+        response_bytes=len(response.encode("utf-8")) if response else 0)
+    if partial is not None and partial.first_token is not None:
+        get_metrics().observe("query_first_token", partial.first_token, labels)
+
+
+def invalidate_index(kb_path):
+    """Drop the warm query worker and cached answers after an index changed"""
+    get_worker_pool().recycle(kb_path)
+    get_query_cache().invalidate(Path(kb_path).name)
+
+
+def warm_query_worker(kb_path):
+    """Start loading the knowledge base's query worker in the background"""
+    get_worker_pool().warm(kb_path)
+
+
+def _on_index_success(job):
+    logger.info(f"Knowledge base '{job.kb_name}' indexed successfully!")
+    invalidate_index(job.kb_path)
+    warm_query_worker(job.kb_path)
+
+
+def start_indexing(kb_path, cwd=ROOT_DIR, incremental=False):
+    """Index a knowledge base in the background and return the job
+
+    With incremental=True graphrag's update path only processes the documents
+    added since the last index.
+
+    The new index is built in a staging root while queries keep using the
+    current one, and swapped in under the exclusive lock once the build
+    succeeds (see index_versions). Without symlink support the output is
+    rewritten in place and the job holds the exclusive lock throughout.
+    """
+    kb_path = Path(kb_path)
+    manager = get_job_manager()
+    running = manager.active_job(kb_path.name)
+    if running:
+        return running
+    # The files present now are what this run indexes
+    snapshot = InputManifest(kb_path).refresh().snapshot()
+    command = "update" if incremental else "index"
+    staged = supports_symlinks(kb_path)
+    root = prepare_staging(kb_path, incremental) if staged else kb_path
+    # What the profile of this run compares against earlier runs
+    offsets, settings_text = log_offsets(root), read_settings(kb_path)
+
+    def on_success(job):
+        if staged:
+            try:
+                with writing(kb_path, timeout=None):
+                    promote(kb_path, root, snapshot)
+                    InputManifest(job.kb_path).mark_indexed(snapshot)
+                    _on_index_success(job)
+            except Exception:
+                discard_staging(root)
+                raise
+            # Other processes may have builds of this knowledge base running
+            building = [_option(other.args, "--root") for other in manager.jobs(kb_path.name)
+                        if other.active and other.id != job.id]
+            collect_garbage(kb_path, keep_staging=[stage for stage in building if stage])
+        else:
+            InputManifest(job.kb_path).mark_indexed(snapshot)
+            _on_index_success(job)
+        record_run(job, kb_path, offsets, settings_text)
+
+    def on_failure(job):
+        if staged:
+            discard_staging(root)
+
+    if staged:
+        # The current index stays readable while the new one is built
+        lock = partial(reading, kb_path, timeout=None)
+    else:
+        lock = partial(writing, kb_path, timeout=None)
+    args = [command, "--root", str(root)]
+    job = manager.submit(kb_path.name, kb_path, args, cwd=cwd, kind=command,
+                         on_success=on_success, on_failure=on_failure, lock=lock)
+    if job.args != args and staged:
+        discard_staging(root)  # Another session started a job first
+    return job
+
+
+def kb_path_for(name, must_exist=True):
+    """Path of a knowledge base, refusing names that would leave KB_DIR"""
+    if not name or name != Path(name).name or name.startswith(".") or "\\" in name:
+        raise KnowledgeBaseError(f"Invalid knowledge base name '{name}'")
+    kb_path = KB_DIR / name
+    if must_exist and not kb_path.is_dir():
+        raise KnowledgeBaseError(f"Knowledge base '{name}' does not exist")
+    return kb_path
+
+
+def list_knowledge_bases():
+    """Names of all knowledge bases (cached until the folder changes)"""
+    return list(list_dirs(KB_DIR))
+
+
+def create_knowledge_base(name, cwd=ROOT_DIR):
+    """Create and initialize a knowledge base; returns (success, graphrag output)"""
+    kb_path = kb_path_for(name, must_exist=False)
+    if kb_path.exists():
+        raise KnowledgeBaseError(f"Knowledge base '{name}' already exists")
+    return init_knowledge_base(kb_path, cwd=cwd)
+
+
+def delete_knowledge_base(name):
+    """Delete a knowledge base once running queries and indexing have finished
+
+    Raises KnowledgeBaseError if it does not exist and kb_locks.KBBusyError
+    if it stays in use.
+    """
+    kb_path = kb_path_for(name)
+    with writing(kb_path):
+        invalidate_index(kb_path)
+        shutil.rmtree(kb_path)
+    delete_profiles(name)
+
+
+def clear_cache(kb_path, keep_llm_cache=False):
+    """Delete everything generated in a knowledge base except the current index
+
+    Input (also excluded documents), prompts, .env, settings.yaml, the input
+    manifest and the versioned index are kept, and so is the LLM response
+    cache with keep_llm_cache.
+    Returns (path, error) pairs of the items that could not be deleted.
+    Raises kb_locks.KBBusyError while the knowledge base is in use.
+    """
+    kb_path = Path(kb_path)
+    exclusions = {"input", EXCLUDED_DIR, "prompts", ".env", "settings.yaml", MANIFEST_NAME,
+                  VERSIONS_DIR}
+    if keep_llm_cache:
+        exclusions.add("cache")  # Keep paid LLM responses for the rebuild
+    if is_versioned(kb_path):
+        exclusions.add("output")  # Queries use it until the rebuild is swapped in
+    errors = []
+    with writing(kb_path):
+        with get_metrics().timer("file_io", op="clear_cache", kb=kb_path.name) as timing:
+            timing["items"] = 0
+            for item in kb_path.iterdir():
+                if item.name in exclusions:
+                    logger.info(f"Retained file or folder: {item}")
+                    continue
+                try:
+                    if item.is_dir():
+                        shutil.rmtree(item)
+                        logger.info(f"Deleted directory: {item}")
+                    else:
+                        item.unlink()
+                        logger.info(f"Deleted file: {item}")
+                    timing["items"] += 1
+                except Exception as e:
+                    logger.error(f"Error deleting {item}: {e}")
+                    errors.append((item, e))
+        InputManifest(kb_path).reset_indexed()  # The output is gone, so is the indexed state
+        invalidate_index(kb_path)
+    return errors
+
+
+def list_input_files(kb_path, search=""):
+    """Names of the knowledge base's .txt documents containing search"""
+    return filter_names(list_files(Path(kb_path) / "input", "*.txt"), search)
+
+
+def delete_input_files(kb_path, names):
+    """Delete documents from input/; returns (deleted names, (name, error) pairs)"""
+    input_path = Path(kb_path) / "input"
+    deleted, errors = [], []
+    with get_metrics().timer("file_io", op="delete", kb=Path(kb_path).name) as timing:
+        for name in names:
+            try:
+                if name != Path(name).name:
+                    raise ValueError("not a file name")
+                os.remove(input_path / name)
+                deleted.append(name)
+            except Exception as e:
+                errors.append((name, e))
+        InputManifest(kb_path).remove_many(deleted)
+        timing["files"] = len(deleted)
+    return deleted, errors
+
+
+def index_knowledge_base(name, incremental=False, cwd=ROOT_DIR):
+    """Start indexing a knowledge base in the background and return the job"""
+    job = start_indexing(kb_path_for(name), cwd=cwd, incremental=incremental)
+    logger.info(f"Indexing job {job.id} started for knowledge base '{name}'")
+    return job
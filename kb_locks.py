@@ -0,0 +1,327 @@
+"""Coordination of operations on the same knowledge base
+
+Each knowledge base has a reader/writer lock: queries hold it shared, while
+indexing, cache clearing and deletion hold it exclusively, so nothing reads
+an index that is being rewritten or removed. Waiting writers block new
+readers, so a steady stream of queries cannot starve an indexing job.
+
+The lock also covers other processes on this host, such as the web UI and
+the HTTP API running side by side: whoever holds it keeps a flock() on a
+file under locks/, shared or exclusive. Between processes there is no writer
+preference. Without fcntl (Windows) the lock only covers threads of one
+process.
+
+Identical queries running at the same time in one process are collapsed by
+SingleFlight: the first caller runs the query and every other caller waits
+for and shares its result.
+"""
+import asyncio
+import hashlib
+import os
+import socket
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOCK_TIMEOUT = 30
+LOCK_DIR = Path(__file__).parent.resolve() / "locks"
+# How often a lock held by another process is tried again
+FILE_LOCK_POLL = 0.05
+
+
+class KBBusyError(Exception):
+    """Raised when a knowledge base lock could not be acquired in time"""
+
+
+def _remaining(deadline):
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def lock_file(path, shared=False, timeout=None):
+    """flock() a file shared or exclusively; returns its descriptor, or None after timeout
+
+    The lock belongs to the open file, not to a thread, and ends when the
+    descriptor is closed or the process exits. Without fcntl the file is
+    only opened.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is None:
+        return fd
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if timeout is None:
+        fcntl.flock(fd, operation)
+        return fd
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                os.close(fd)
+                return None
+            time.sleep(FILE_LOCK_POLL)
+
+
+@contextmanager
+def file_lock(path, shared=False, timeout=None):
+    """Hold lock_file() for a block, raising TimeoutError after timeout"""
+    fd = lock_file(path, shared, timeout)
+    if fd is None:
+        raise TimeoutError(f"{path} stayed locked by another process")
+    try:
+        yield
+    finally:
+        os.close(fd)
+
+
+def process_owner():
+    """This process, as recorded in state files that other processes read"""
+    return {"host": socket.gethostname(), "pid": os.getpid()}
+
+
+def owner_alive(owner):
+    """Whether the process recorded by process_owner() may still be running
+
+    Processes on other hosts are assumed to be alive. Without a way to probe
+    another process (Windows), only this process is.
+    """
+    if not owner:
+        return False
+    if owner.get("host") != socket.gethostname():
+        return True
+    pid = owner.get("pid")
+    if pid == os.getpid():
+        return True
+    if not pid or os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Alive, but owned by another user
+    return True
+
+
+class ReadWriteLock:
+    """Writer-preferring reader/writer lock
+
+    The lock is not owned by a thread, so it may be released by another
+    thread than the one that acquired it (e.g. an indexing job's thread).
+    With a path, holders also flock() that file, which extends the lock to
+    other processes: every reader holds a shared lock on a descriptor of its
+    own and the writer an exclusive one.
+    """
+
+    def __init__(self, path=None):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._path = path
+        self._read_fds = []
+        self._write_fd = None
+
+    def acquire_read(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self._cond.wait_for(
+                    lambda: not self._writer and not self._waiting_writers, timeout):
+                return False
+            self._readers += 1
+        if self._path is None:
+            return True
+        fd = lock_file(self._path, shared=True, timeout=_remaining(deadline))
+        with self._cond:
+            if fd is None:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+                return False
+            self._read_fds.append(fd)  # Shared locks are interchangeable
+        return True
+
+    def release_read(self):
+        with self._cond:
+            fd = self._read_fds.pop() if self._read_fds else None
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+        if fd is not None:
+            os.close(fd)
+
+    def acquire_write(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                acquired = self._cond.wait_for(
+                    lambda: not self._writer and not self._readers, timeout)
+            finally:
+                self._waiting_writers -= 1
+            if acquired:
+                self._writer = True
+            else:
+                self._cond.notify_all()  # Let readers held back by this writer in
+        if not acquired or self._path is None:
+            return acquired
+        fd = lock_file(self._path, timeout=_remaining(deadline))
+        if fd is None:
+            self.release_write()
+            return False
+        with self._cond:
+            self._write_fd = fd
+        return True
+
+    def release_write(self):
+        with self._cond:
+            fd, self._write_fd = self._write_fd, None
+            self._writer = False
+            self._cond.notify_all()
+        if fd is not None:
+            os.close(fd)
+
+    def state(self):
+        with self._cond:
+            return {"readers": self._readers, "writer": self._writer,
+                    "waiting_writers": self._waiting_writers}
+
+    @contextmanager
+    def read(self, timeout=LOCK_TIMEOUT, name=""):
+        if not self.acquire_read(timeout):
+            raise KBBusyError(f"Knowledge base '{name}' is being indexed or modified")
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self, timeout=LOCK_TIMEOUT, name=""):
+        if not self.acquire_write(timeout):
+            raise KBBusyError(f"Knowledge base '{name}' is in use, try again later")
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock_path(key):
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return LOCK_DIR / f"{Path(key).name}-{digest}.lock"
+
+
+def kb_lock(kb_path):
+    """Return the reader/writer lock of a knowledge base"""
+    key = str(Path(kb_path).resolve())
+    with _locks_lock:
+        if key not in _locks:
+            _locks[key] = ReadWriteLock(_lock_path(key))
+        return _locks[key]
+
+
+@contextmanager
+def reading(kb_path, timeout=LOCK_TIMEOUT):
+    """Hold a knowledge base's lock shared, raising KBBusyError after timeout"""
+    with kb_lock(kb_path).read(timeout, Path(kb_path).name):
+        yield
+
+
+@contextmanager
+def writing(kb_path, timeout=LOCK_TIMEOUT):
+    """Hold a knowledge base's lock exclusively, raising KBBusyError after timeout"""
+    with kb_lock(kb_path).write(timeout, Path(kb_path).name):
+        yield
+
+
+@asynccontextmanager
+async def reading_async(kb_path, timeout=LOCK_TIMEOUT):
+    """reading() for coroutines: the lock is waited for in a thread, not the event loop"""
+    lock = kb_lock(kb_path)
+    attempt = asyncio.ensure_future(asyncio.to_thread(lock.acquire_read, timeout))
+    try:
+        acquired = await asyncio.shield(attempt)
+    except asyncio.CancelledError:
+        # The thread keeps waiting; give the lock back if it gets it after all
+        attempt.add_done_callback(
+            lambda done: done.exception() is None and done.result() and lock.release_read())
+        raise
+    if not acquired:
+        raise KBBusyError(f"Knowledge base '{Path(kb_path).name}' is being indexed or modified")
+    try:
+        yield
+    finally:
+        lock.release_read()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, timeout=None):
+        """Run function(), or wait for the identical call already in flight
+
+        Returns (result, shared) where shared tells whether the result came
+        from another caller's execution. Exceptions are shared the same way.
+        Raises TimeoutError if a shared result does not arrive within timeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("The identical query in progress did not finish in time")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Number of distinct calls running and callers waiting on them"""
+        with self._lock:
+            return len(self._calls), sum(call.waiters for call in self._calls.values())
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight():
+    """Return the process-level SingleFlight shared by all sessions"""
+    return _single_flight
+
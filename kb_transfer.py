@@ -0,0 +1,316 @@
+"""Export and import of whole knowledge bases as .tar.zst archives
+
+An export is a tar stream of the knowledge base's settings, prompts, input,
+input manifest and current index (plus the LLM cache and .env on request),
+compressed with zstd and written straight to any binary file object: a file,
+an HTTP response or a pipe. Nothing is staged on disk first. Each file is
+hashed while it is written and a manifest with the SHA-256 of every member
+goes last into the archive:
+
+    kb_archive.json   {"format", "kb", "created", "files": {name: {sha256, bytes, mtime_ns}}}
+
+An import reads the archive as a stream as well, extracts it into a staging
+folder next to the knowledge bases while hashing every member, and renames
+the folder into place only after all checksums matched the manifest. A
+versioned index is exported as a plain output/ folder, which the next
+indexing run adopts as a version of its own (see index_versions).
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import time
+import uuid
+from pathlib import Path, PurePosixPath
+
+import kb_core
+from input_manifest import EXCLUDED_DIR, MANIFEST_NAME
+from kb_core import KnowledgeBaseError, invalidate_index, kb_path_for
+from kb_locks import LOCK_TIMEOUT, reading
+from metrics import get_metrics
+from uploads import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MANIFEST = "kb_archive.json"
+ARCHIVE_FORMAT = 1
+ARCHIVE_SUFFIX = ".tar.zst"
+# Exported in this order; folders are walked recursively
+MEMBERS = ["settings.yaml", MANIFEST_NAME, "prompts", "input", EXCLUDED_DIR, "output"]
+CACHE_DIR = "cache"
+ENV_FILE = ".env"
+# Parquet and lancedb files are compressed already; higher levels mostly cost time
+COMPRESSION_LEVEL = int(os.environ.get("GRAPHRAG_EXPORT_LEVEL", "1"))
+# zstd worker threads; -1 uses one per CPU so compression keeps up with the disk
+COMPRESSION_THREADS = int(os.environ.get("GRAPHRAG_EXPORT_THREADS", "-1"))
+MAX_MANIFEST_BYTES = 256 * 1024 * 1024
+IMPORTS_DIR = "kb_imports"
+EXPORT_DIR = kb_core.ROOT_DIR / "exports"
+# Streamlit holds a download in memory; larger exports are fetched from the HTTP API
+MAX_DOWNLOAD_BYTES = int(os.environ.get("GRAPHRAG_EXPORT_DOWNLOAD_BYTES", str(512 * 1024 ** 2)))
+_BLOCK = tarfile.BLOCKSIZE
+
+
+class TransferError(Exception):
+    """Raised for archives that cannot be written, read or verified"""
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise TransferError("Exporting and importing knowledge bases requires the "
+                            "'zstandard' package")
+    return zstandard
+
+
+def archive_name(kb_name, timestamp=None):
+    return f"{kb_name}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(timestamp))}{ARCHIVE_SUFFIX}"
+
+
+def _walk_files(folder, prefix):
+    """(path, archive name) of the files below folder, in a stable order
+
+    Hidden files (e.g. uploads still being written) and symlinks inside the
+    folder are skipped; the folder itself may be a symlink, like a versioned
+    output.
+    """
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        relative = Path(root).relative_to(folder)
+        for name in sorted(files):
+            path = Path(root) / name
+            if name.startswith(".") or path.is_symlink():
+                continue
+            yield path, (PurePosixPath(prefix) / relative.as_posix() / name).as_posix()
+
+
+def exported_files(kb_path, include_cache=False, include_env=False):
+    """(path, archive name) of every file an export of the knowledge base contains"""
+    kb_path = Path(kb_path)
+    names = list(MEMBERS)
+    if include_cache:
+        names.append(CACHE_DIR)
+    if include_env:
+        names.insert(1, ENV_FILE)
+    for name in names:
+        path = kb_path / name
+        if path.is_dir():
+            yield from _walk_files(path.resolve(), name)
+        elif path.is_file():
+            yield path, name
+
+
+class _TarWriter:
+    """Minimal streaming tar writer that hashes members as they are copied
+
+    tarfile's own writer copies in 16 KiB pieces; writing the headers here
+    lets file data go through in CHUNK_SIZE pieces, hashed on the way.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.files = {}
+        self.bytes = 0
+
+    def _header(self, name, size, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.mode = 0o644
+        self.stream.write(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+
+    def _pad(self, size):
+        if size % _BLOCK:
+            self.stream.write(b"\0" * (_BLOCK - size % _BLOCK))
+
+    def add_file(self, path, name):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            self._header(name, size, stat.st_mtime)
+            digest = hashlib.sha256()
+            left = size
+            while left:
+                data = f.read(min(CHUNK_SIZE, left))
+                if not data:
+                    raise TransferError(f"{name} was truncated while it was being exported")
+                digest.update(data)
+                self.stream.write(data)
+                left -= len(data)
+            self._pad(size)
+        self.files[name] = {"sha256": digest.hexdigest(), "bytes": size,
+                            "mtime_ns": stat.st_mtime_ns}
+        self.bytes += size
+
+    def add_bytes(self, name, data):
+        self._header(name, len(data), time.time())
+        self.stream.write(data)
+        self._pad(len(data))
+
+    def close(self):
+        self.stream.write(b"\0" * (2 * _BLOCK))  # End-of-archive marker
+
+
+def export_knowledge_base(kb_path, fileobj, include_cache=False, include_env=False,
+                          progress=None):
+    """Write a knowledge base as a .tar.zst archive to a binary file object
+
+    fileobj only needs a write() method and is not closed. progress(files,
+    bytes) is called after each file. The knowledge base is read-locked
+    throughout, so a finished indexing run cannot swap the index mid-export.
+    Returns the archive's manifest.
+    """
+    zstandard = _zstandard()
+    kb_path = Path(kb_path)
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, threads=COMPRESSION_THREADS,
+                                          write_checksum=True)
+    with get_metrics().timer("file_io", op="export", kb=kb_path.name) as timing:
+        with reading(kb_path, timeout=LOCK_TIMEOUT):
+            with compressor.stream_writer(fileobj, write_size=CHUNK_SIZE,
+                                          closefd=False) as stream:
+                writer = _TarWriter(stream)
+                for path, name in exported_files(kb_path, include_cache, include_env):
+                    writer.add_file(path, name)
+                    if progress:
+                        progress(len(writer.files), writer.bytes)
+                manifest = {"format": ARCHIVE_FORMAT, "kb": kb_path.name,
+                            "created": time.time(), "include_cache": include_cache,
+                            "include_env": include_env, "files": writer.files}
+                writer.add_bytes(ARCHIVE_MANIFEST,
+                                 json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+                writer.close()
+        timing.update(files=len(writer.files), bytes=writer.bytes)
+    logger.info(f"Exported '{kb_path.name}': {len(writer.files)} files, {writer.bytes} bytes")
+    return manifest
+
+
+def export_to_file(kb_path, path, **options):
+    """Export into a file, written under a temporary name and renamed when complete"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        with open(tmp_path, "wb") as f:
+            manifest = export_knowledge_base(kb_path, f, **options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return manifest
+
+
+def list_exports():
+    """Finished archives in EXPORT_DIR, newest first, as dicts with name, path, bytes and modified"""
+    exports = []
+    for path in Path(EXPORT_DIR).glob(f"*{ARCHIVE_SUFFIX}"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        exports.append({"name": path.name, "path": path, "bytes": stat.st_size,
+                        "modified": stat.st_mtime})
+    return sorted(exports, key=lambda export: export["modified"], reverse=True)
+
+
+def _member_path(staging, name):
+    """Where an archive member is extracted, refusing anything outside the exported folders"""
+    path = PurePosixPath(name)
+    allowed = set(MEMBERS) | {CACHE_DIR, ENV_FILE}
+    if (path.is_absolute() or "\\" in name or ".." in path.parts or not path.parts
+            or path.parts[0] not in allowed):
+        raise TransferError(f"Unexpected archive member '{name}'")
+    return Path(staging, *path.parts)
+
+
+def _extract(member, target, size):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    written = 0
+    with open(target, "wb") as f:
+        for data in iter(lambda: member.read(CHUNK_SIZE), b""):
+            digest.update(data)
+            f.write(data)
+            written += len(data)
+    if written != size:
+        raise TransferError(f"Archive member '{target.name}' is truncated")
+    return digest.hexdigest()
+
+
+def _verify(manifest, extracted):
+    if manifest is None:
+        raise TransferError(f"The archive has no {ARCHIVE_MANIFEST}; it is truncated or "
+                            "was not exported from a knowledge base")
+    if manifest.get("format") != ARCHIVE_FORMAT:
+        raise TransferError(f"Unsupported archive format {manifest.get('format')!r}")
+    expected = manifest.get("files", {})
+    missing = sorted(set(expected) - set(extracted))
+    unexpected = sorted(set(extracted) - set(expected))
+    if missing or unexpected:
+        raise TransferError(f"Archive contents do not match its manifest: "
+                            f"missing {missing[:5]}, unexpected {unexpected[:5]}")
+    corrupt = [name for name, sha256 in extracted.items() if expected[name]["sha256"] != sha256]
+    if corrupt:
+        raise TransferError(f"Checksum mismatch for {len(corrupt)} files, e.g. {corrupt[0]}")
+
+
+def import_knowledge_base(fileobj, name, progress=None):
+    """Create knowledge base `name` from a .tar.zst export read from a binary file object
+
+    fileobj only needs a read() method. The archive is extracted into a
+    staging folder and every member's SHA-256 checked against the archive's
+    manifest before the knowledge base appears under its name. Raises
+    KnowledgeBaseError for an invalid or existing name and TransferError for
+    archives that cannot be read or verified. Returns the archive's manifest.
+    """
+    zstandard = _zstandard()
+    kb_path = kb_path_for(name, must_exist=False)
+    if kb_path.exists():
+        raise KnowledgeBaseError(f"Knowledge base '{name}' already exists")
+    # Next to the knowledge bases, so the final rename stays on one file system
+    staging = Path(kb_core.KB_DIR).parent / IMPORTS_DIR / f"{name}-{uuid.uuid4().hex[:8]}"
+    staging.mkdir(parents=True)
+    extracted, total, manifest = {}, 0, None
+    try:
+        with get_metrics().timer("file_io", op="import", kb=name) as timing:
+            reader = zstandard.ZstdDecompressor().stream_reader(fileobj, read_size=CHUNK_SIZE)
+            try:
+                with tarfile.open(fileobj=reader, mode="r|", bufsize=CHUNK_SIZE) as archive:
+                    for info in archive:
+                        if info.name == ARCHIVE_MANIFEST:
+                            if info.size > MAX_MANIFEST_BYTES:
+                                raise TransferError(f"{ARCHIVE_MANIFEST} is too large")
+                            manifest = json.loads(archive.extractfile(info).read())
+                            continue
+                        if info.isdir():
+                            continue
+                        if not info.isfile():
+                            raise TransferError(f"Unexpected archive member '{info.name}'")
+                        target = _member_path(staging, info.name)
+                        extracted[info.name] = _extract(archive.extractfile(info), target,
+                                                        info.size)
+                        total += info.size
+                        if progress:
+                            progress(len(extracted), total)
+            except (tarfile.TarError, zstandard.ZstdError, ValueError, EOFError) as e:
+                raise TransferError(f"Error reading the archive: {e}")
+            _verify(manifest, extracted)
+            for member, entry in manifest["files"].items():
+                if entry.get("mtime_ns"):
+                    # The input manifest trusts unchanged size and mtime
+                    os.utime(_member_path(staging, member),
+                             ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            (staging / "input").mkdir(exist_ok=True)
+            if kb_path.exists():
+                raise KnowledgeBaseError(f"Knowledge base '{name}' already exists")
+            os.rename(staging, kb_path)
+            timing.update(files=len(extracted), bytes=total)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    invalidate_index(kb_path)  # Answers cached for an earlier knowledge base of this name
+    logger.info(f"Imported '{manifest.get('kb')}' as '{name}': {len(extracted)} files, "
+                f"{total} bytes")
+    return manifest
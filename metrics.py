@@ -0,0 +1,273 @@
+"""In-process metrics of graphrag commands, queries, indexing and file I/O
+
+Every observation keeps its labels and extra values (such as peak RSS or
+output size) in a bounded rolling window for the Metrics page, and updates
+cumulative counters that are exported in the Prometheus text format. The
+export is written to metrics/metrics.prom and, when GRAPHRAG_METRICS_PORT is
+set, also served over HTTP at /metrics.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = Path(__file__).parent.resolve() / "metrics" / "metrics.prom"
+WINDOW = int(os.environ.get("GRAPHRAG_METRICS_WINDOW", "2000"))
+FLUSH_SECONDS = float(os.environ.get("GRAPHRAG_METRICS_FLUSH_SECONDS", "10"))
+HTTP_PORT = os.environ.get("GRAPHRAG_METRICS_PORT")
+PREFIX = "graphrag_ui"
+QUANTILES = [0.5, 0.95, 0.99]
+# Values named peak_* (e.g. peak_rss_bytes) are exported as gauges, all others
+# as cumulative counters
+PEAK_PREFIX = "peak_"
+EVENT_FIELDS = {"time", "name", "seconds", "labels"}
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile (q between 0 and 1) of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 1))
+    return sorted_values[min(len(sorted_values), int(rank)) - 1]
+
+
+def wait_for_child(process):
+    """Wait for a Popen child and return (exit code, peak RSS in bytes)
+
+    The peak RSS comes from wait4() where available and is None elsewhere.
+    """
+    if not hasattr(os, "wait4"):
+        return process.wait(), None
+    try:
+        _pid, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # Already reaped, e.g. by Popen.poll() in another thread
+        return process.wait(), None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if os.uname().sysname == "Darwin" else 1024
+    return process.returncode, usage.ru_maxrss * scale
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+class Metrics:
+    """Thread-safe store of timed observations"""
+
+    def __init__(self, window=WINDOW, export_path=METRICS_FILE):
+        self.export_path = Path(export_path) if export_path else None
+        self._events = deque(maxlen=window)
+        # (name, labels) -> {"count", "seconds", <value>: sum}
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def observe(self, name, seconds, labels=None, **values):
+        """Record one observation, e.g. observe("command", 1.2, {"subcommand": "query"}, output_bytes=512)"""
+        labels = tuple(sorted((key, str(value)) for key, value in (labels or {}).items()))
+        values = {key: value for key, value in values.items() if value is not None}
+        with self._lock:
+            self._events.append({"time": time.time(), "name": name,
+                                 "seconds": seconds, "labels": dict(labels),
+                                 **values})
+            totals = self._totals.setdefault((name, labels), {"count": 0, "seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            for key, value in values.items():
+                if not key.startswith(PEAK_PREFIX):
+                    totals[key] = totals.get(key, 0) + value
+        self.flush()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time a block; extra values can be added to the yielded dict
+
+        e.g. ``with metrics.timer("file_io", op="upload") as m: m["bytes"] = n``.
+        A block that raises is recorded with status="error".
+        """
+        extra = {}
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield extra
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            labels.setdefault("status", status)
+            self.observe(name, time.perf_counter() - start, labels, **extra)
+
+    def events(self, name=None, since=None):
+        with self._lock:
+            events = list(self._events)
+        return [e for e in events
+                if (name is None or e["name"] == name)
+                and (since is None or e["time"] >= since)]
+
+    def summary(self, since=None, group_by=None):
+        """Rolling statistics per metric name and label set
+
+        group_by limits the labels that form a group, e.g. ["subcommand"].
+        Returns one row per group with count, p50/p95/p99/max seconds and the
+        mean of every extra value.
+        """
+        groups = {}
+        for event in self.events(since=since):
+            labels = event["labels"]
+            if group_by is not None:
+                labels = {key: value for key, value in labels.items() if key in group_by}
+            key = (event["name"], tuple(sorted(labels.items())))
+            groups.setdefault(key, []).append(event)
+        rows = []
+        for (name, labels), events in sorted(groups.items()):
+            latencies = sorted(e["seconds"] for e in events)
+            row = {"metric": name, **dict(labels), "count": len(events)}
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}_s"] = round(percentile(latencies, q), 3)
+            row["max_s"] = round(latencies[-1], 3)
+            extra_keys = {k for e in events for k in e if k not in EVENT_FIELDS}
+            for key in sorted(extra_keys):
+                present = [e[key] for e in events if key in e]
+                row[f"avg_{key}"] = round(sum(present) / len(present), 1)
+            rows.append(row)
+        return rows
+
+    def prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            totals = {key: dict(value) for key, value in self._totals.items()}
+            events = list(self._events)
+        lines = []
+        names = sorted({name for name, _labels in totals})
+        for name in names:
+            metric = f"{PREFIX}_{name}_seconds"
+            lines.append(f"# HELP {metric} Duration of {name} operations "
+                         f"(quantiles over the last {self._events.maxlen} observations)")
+            lines.append(f"# TYPE {metric} summary")
+            window = {}
+            for event in events:
+                if event["name"] == name:
+                    labels = tuple(sorted(event["labels"].items()))
+                    window.setdefault(labels, []).append(event["seconds"])
+            for (metric_name, labels), total in sorted(totals.items()):
+                if metric_name != name:
+                    continue
+                latencies = sorted(window.get(labels, []))
+                if latencies:
+                    for q in QUANTILES:
+                        lines.append(f"{metric}{_label_text(labels + (('quantile', str(q)),))} "
+                                     f"{percentile(latencies, q):.6f}")
+                lines.append(f"{metric}_sum{_label_text(labels)} {total['seconds']:.6f}")
+                lines.append(f"{metric}_count{_label_text(labels)} {total['count']}")
+            value_keys = sorted({key for event in events if event["name"] == name
+                                 for key in event if key not in EVENT_FIELDS}
+                                | {key for (metric_name, _labels), total in totals.items()
+                                   if metric_name == name for key in total
+                                   if key not in ("count", "seconds")})
+            for key in value_keys:
+                if key.startswith(PEAK_PREFIX):
+                    # Peaks are not additive; export the maximum of the window
+                    value_metric = f"{PREFIX}_{name}_{key}"
+                    peaks = {}
+                    for event in events:
+                        if event["name"] == name and key in event:
+                            labels = tuple(sorted(event["labels"].items()))
+                            peaks[labels] = max(peaks.get(labels, 0), event[key])
+                    lines.append(f"# TYPE {value_metric} gauge")
+                    for labels, value in sorted(peaks.items()):
+                        lines.append(f"{value_metric}{_label_text(labels)} {value}")
+                    continue
+                value_metric = f"{PREFIX}_{name}_{key}_total"
+                lines.append(f"# TYPE {value_metric} counter")
+                for (metric_name, labels), total in sorted(totals.items()):
+                    if metric_name == name and key in total:
+                        lines.append(f"{value_metric}{_label_text(labels)} {total[key]}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self, force=False):
+        """Write the Prometheus file, at most every FLUSH_SECONDS unless forced"""
+        if self.export_path is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_flush < FLUSH_SECONDS:
+                return
+            self._last_flush = now
+        try:
+            self.export_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.export_path.with_name(
+                f".{self.export_path.name}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus())
+            os.replace(tmp_path, self.export_path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {self.export_path}: {e}")
+
+
+def serve_http(metrics, port, host="0.0.0.0"):
+    """Serve the Prometheus export at http://<host>:<port>/metrics in a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http",
+                     daemon=True).start()
+    logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+    return server
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def export_as(name):
+    """Write this process's Prometheus export to metrics/<name>
+
+    Each process keeps its own metrics, so a process running next to the
+    web UI exports under a name of its own instead of overwriting its file.
+    """
+    metrics = get_metrics()
+    metrics.export_path = METRICS_FILE.with_name(name)
+    return metrics
+
+
+def get_metrics():
+    """Return the process-level metrics store shared by all sessions"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(WINDOW, METRICS_FILE)
+            if HTTP_PORT:
+                try:
+                    serve_http(_metrics, int(HTTP_PORT))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Metrics endpoint not started: {e}")
+        return _metrics
@@ -0,0 +1,465 @@
+"""Near-duplicate detection over a knowledge base's input documents
+
+Every input document is reduced to a MinHash signature of its shingles
+(runs of SHINGLE_TOKENS words; CJK characters count as words), read block by
+block and hashed with numpy on a process pool when there is enough new text.
+Signatures are cached by the file's content hash (from the input manifest),
+so checking again after uploading a few documents only reads those.
+
+Locality-sensitive hashing splits the signatures into bands; documents that
+agree on a whole band become candidates, and candidates whose estimated
+Jaccard similarity reaches the threshold are clustered. Each cluster keeps
+one document and the others can be moved to input_excluded/, which graphrag
+does not read, and restored from there. The tokens and LLM calls the
+exclusion saves come from the same model as index_estimate.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from index_estimate import (MAX_PROCESSES, POOL_MIN_BYTES, READ_BLOCK_CHARS, estimate_counts,
+                            read_index_settings, tokenize_inputs)
+from index_jobs import get_job_manager
+from input_manifest import EXCLUDED_DIR, InputManifest, file_entry
+from kb_locks import KBBusyError, writing
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = Path(__file__).parent.resolve() / "estimates" / "signatures.sqlite3"
+EXCLUDED_RECORD = "excluded.json"
+# Estimated Jaccard similarity of the shingle sets from which documents count as duplicates
+THRESHOLD = float(os.environ.get("GRAPHRAG_DEDUPE_THRESHOLD", "0.8"))
+NUM_PERM = int(os.environ.get("GRAPHRAG_DEDUPE_PERMUTATIONS", "128"))
+SHINGLE_TOKENS = int(os.environ.get("GRAPHRAG_DEDUPE_SHINGLE", "5"))
+# The LSH S-curve is centered this far below the threshold, so that pairs
+# just above it are almost always compared
+RECALL_MARGIN = 0.1
+SEED = 1
+# Shingles hashed per numpy step; bounds memory at NUM_PERM * HASH_BLOCK * 8 bytes
+HASH_BLOCK = 8192
+
+# CJK characters are words of their own, other words are runs of letters and digits
+_TOKEN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]|[^\W_]+")
+_BASE = np.uint64(0x100000001B3)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_SHIFT = np.uint64(32)
+_EMPTY = np.uint64(1 << 32)
+
+
+class DedupeError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Signatures
+# ---------------------------------------------------------------------------
+
+def _permutations(num_perm):
+    """The (a, b) of the multiply-shift hash functions ((a * x + b) mod 2**64) >> 32"""
+    generator = np.random.RandomState(SEED)
+    a = generator.randint(0, 1 << 64, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = generator.randint(0, 1 << 64, size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def _min_hashes(hashes, a, b):
+    """The smallest value of every hash function over the given shingle hashes"""
+    return ((a * hashes + b) >> _SHIFT).min(axis=1)  # Wraps around mod 2**64
+
+
+def _shingle_hashes(words, k):
+    """32-bit hashes of every run of k consecutive word hashes"""
+    count = len(words) - k + 1
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset in range(k):
+        combined = combined * _BASE + words[offset:offset + count]  # Wraps around mod 2**64
+    return (combined * _MIX) >> _SHIFT
+
+
+def compute_signature(path, num_perm=NUM_PERM, k=SHINGLE_TOKENS):
+    """Return the MinHash signature of a text file as bytes, or None without any words
+
+    Blocks end at a line break so no word is split between two blocks, and
+    the last k - 1 words of a block start the next one's shingles.
+    """
+    a, b = _permutations(num_perm)
+    signature = np.full(num_perm, _EMPTY, dtype=np.uint64)
+    vocabulary = {}
+    carry_text, carry_words = "", np.zeros(0, dtype=np.uint64)
+    shingled = False
+
+    def add(text, final=False):
+        nonlocal carry_words, shingled
+        tokens = _TOKEN.findall(text.lower())
+        for word in set(tokens).difference(vocabulary):
+            vocabulary[word] = zlib.crc32(word.encode("utf-8"))
+        words = np.concatenate([carry_words, np.fromiter(
+            map(vocabulary.__getitem__, tokens), dtype=np.uint64, count=len(tokens))])
+        if len(words) >= k:
+            hashes = _shingle_hashes(words, k)
+            for start in range(0, len(hashes), HASH_BLOCK):
+                block = hashes[start:start + HASH_BLOCK]
+                np.minimum(signature, _min_hashes(block, a, b), out=signature)
+            shingled = True
+            words = words[len(words) - k + 1:]
+        elif final and len(words) and not shingled:
+            # Shorter than one shingle: the whole document is its only shingle
+            hashes = _shingle_hashes(words, len(words))
+            np.minimum(signature, _min_hashes(hashes, a, b), out=signature)
+            shingled = True
+        carry_words = words
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_CHARS), ""):
+            block = carry_text + block
+            cut = block.rfind("\n") + 1
+            if cut == 0:
+                carry_text = block
+                continue
+            add(block[:cut])
+            carry_text = block[cut:]
+    add(carry_text, final=True)
+    return signature.astype("<u4").tobytes() if shingled else None
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(signature == other))
+
+
+class SignatureCache:
+    """MinHash signatures stored in SQLite by parameters and content hash"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            # A NULL signature marks a document without any words
+            conn.execute("CREATE TABLE IF NOT EXISTS signatures ("
+                         " params TEXT NOT NULL, sha256 TEXT NOT NULL,"
+                         " signature BLOB, PRIMARY KEY (params, sha256))")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, params, hashes):
+        """Map the cached hashes among the given ones to their signatures"""
+        hashes = list(set(hashes))
+        found = {}
+        with self._lock, self._connect() as conn:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = conn.execute(
+                    "SELECT sha256, signature FROM signatures WHERE params = ? AND sha256 IN "
+                    f"({','.join('?' * len(batch))})", [params] + batch)
+                found.update(rows)
+        return found
+
+    def put_many(self, params, signatures):
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO signatures (params, sha256, signature) VALUES (?, ?, ?)",
+                [(params, sha256, signature) for sha256, signature in signatures.items()])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_signature_cache():
+    """Return the process-level signature cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SignatureCache(CACHE_PATH)
+        return _cache
+
+
+def signature_inputs(kb_path, progress=None):
+    """MinHash signatures of the knowledge base's input documents, keyed by file name
+
+    Returns (signatures, stats) where a signature is a numpy array, or None
+    for a document without any words, and stats holds how many files came
+    from the cache and how many were read. progress(done, total) is called
+    as files are read.
+    """
+    manifest = InputManifest(kb_path).refresh()
+    files = manifest.files
+    params = f"k{SHINGLE_TOKENS}-p{NUM_PERM}-s{SEED}"
+    cache = get_signature_cache()
+    cached = cache.get_many(params, [entry["sha256"] for entry in files.values()])
+    pending = {}
+    for name, entry in files.items():
+        if entry["sha256"] not in cached:
+            pending.setdefault(entry["sha256"], manifest.input_path / name)
+    computed = {}
+    total_bytes = sum(files[path.name]["size"] for path in pending.values())
+    with get_metrics().timer("file_io", op="minhash", kb=Path(kb_path).name) as timing:
+        if len(pending) > 1 and total_bytes >= POOL_MIN_BYTES:
+            # spawn, since forking the multi-threaded Streamlit server is unsafe
+            context = multiprocessing.get_context("spawn")
+            workers = min(MAX_PROCESSES, len(pending))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = {executor.submit(compute_signature, path): sha256
+                           for sha256, path in pending.items()}
+                for done, future in enumerate(as_completed(futures), 1):
+                    computed[futures[future]] = future.result()
+                    if progress:
+                        progress(done, len(pending))
+        else:
+            for done, (sha256, path) in enumerate(pending.items(), 1):
+                computed[sha256] = compute_signature(path)
+                if progress:
+                    progress(done, len(pending))
+        timing["files"] = len(pending)
+        timing["bytes"] = total_bytes
+    if computed:
+        cache.put_many(params, computed)
+    cached.update(computed)
+    signatures = {}
+    for name, entry in files.items():
+        blob = cached[entry["sha256"]]
+        signatures[name] = np.frombuffer(blob, dtype="<u4") if blob is not None else None
+    stats = {"cached_files": len(files) - len(pending), "read_files": len(pending)}
+    return signatures, stats
+
+
+# ---------------------------------------------------------------------------
+# Clustering
+# ---------------------------------------------------------------------------
+
+def lsh_bands(threshold, num_perm=NUM_PERM):
+    """(bands, rows) for the threshold
+
+    Documents with similarity s share a band with probability
+    1 - (1 - s**rows)**bands; this picks the most rows per band whose S-curve
+    midpoint (1 / bands)**(1 / rows) stays RECALL_MARGIN below the threshold.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) > threshold - RECALL_MARGIN:
+            break
+        best = (bands, rows)
+    return best
+
+
+def find_clusters(signatures, threshold=THRESHOLD):
+    """Groups of names whose signatures are at least threshold similar
+
+    Candidates come from LSH buckets; within a bucket each document is only
+    compared with one member of every cluster seen there so far, so many
+    copies of one document stay cheap. Returns lists of names, largest first.
+    """
+    names = sorted(name for name, signature in signatures.items() if signature is not None)
+    bands, rows = lsh_bands(threshold, len(signatures[names[0]]) if names else NUM_PERM)
+    parent = list(range(len(names)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        for i, name in enumerate(names):
+            key = signatures[name][band * rows:(band + 1) * rows].tobytes()
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            seen = []
+            for i in members:
+                for j in seen:
+                    if (find(i) != find(j)
+                            and similarity(signatures[names[i]], signatures[names[j]]) >= threshold):
+                        parent[find(i)] = find(j)
+                if all(find(i) != find(j) for j in seen):
+                    seen.append(i)
+    clusters = {}
+    for i, name in enumerate(names):
+        clusters.setdefault(find(i), []).append(name)
+    return sorted((members for members in clusters.values() if len(members) > 1),
+                  key=lambda members: (-len(members), members[0]))
+
+
+def find_duplicates(kb_path, threshold=THRESHOLD, progress=None):
+    """Near-duplicate clusters of the input documents and what excluding them saves
+
+    Each cluster keeps the document that was indexed last time, or else the
+    largest one, and lists the others as duplicates with their similarity
+    to it. progress(stage, done, total) is called while signatures are
+    computed (stage "signatures") and documents tokenized ("tokens").
+    """
+    if not 0 < threshold <= 1:
+        raise DedupeError(f"The similarity threshold must be in (0, 1], not {threshold}")
+    start = time.perf_counter()
+    signatures, stats = signature_inputs(
+        kb_path, progress=progress and (lambda done, total: progress("signatures", done, total)))
+    manifest = InputManifest(kb_path)
+    indexed = manifest.indexed or {}
+    clusters = []
+    for names in find_clusters(signatures, threshold):
+        names.sort(key=lambda name: (name not in indexed, -manifest.files[name]["size"], name))
+        keep = names[0]
+        clusters.append({
+            "keep": keep,
+            "duplicates": [{"name": name,
+                            "similarity": similarity(signatures[keep], signatures[name])}
+                           for name in names[1:]],
+        })
+    duplicates = {entry["name"] for cluster in clusters for entry in cluster["duplicates"]}
+
+    settings = read_index_settings(kb_path)
+    counts, token_stats = tokenize_inputs(
+        kb_path, settings["encoding"],
+        progress and (lambda done, total: progress("tokens", done, total)))
+    full = estimate_counts(counts, settings, token_stats)
+    kept = estimate_counts({name: tokens for name, tokens in counts.items()
+                            if name not in duplicates}, settings, token_stats)
+    for cluster in clusters:
+        for entry in cluster["duplicates"]:
+            entry["tokens"] = counts.get(entry["name"], 0)
+    result = {
+        "threshold": threshold,
+        "documents": len(signatures),
+        "empty_documents": sum(signature is None for signature in signatures.values()),
+        "cached_files": stats["cached_files"],
+        "read_files": stats["read_files"],
+        "clusters": clusters,
+        "duplicate_documents": len(duplicates),
+        "duplicate_tokens": sum(counts.get(name, 0) for name in duplicates),
+        "exact_tokens": token_stats["exact"],
+        "full": full,
+        "deduplicated": kept,
+        "saved_llm_calls": full["llm_calls"] - kept["llm_calls"],
+        "saved_llm_prompt_tokens": full["llm_prompt_tokens"] - kept["llm_prompt_tokens"],
+        "saved_embedding_tokens": full["embedding_tokens"] - kept["embedding_tokens"],
+        "seconds": time.perf_counter() - start,
+    }
+    get_metrics().observe("dedupe", result["seconds"], {"kb": Path(kb_path).name},
+                          documents=result["documents"], read_files=stats["read_files"],
+                          duplicates=len(duplicates))
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Excluding and restoring
+# ---------------------------------------------------------------------------
+
+def _record_path(kb_path):
+    return Path(kb_path) / EXCLUDED_DIR / EXCLUDED_RECORD
+
+
+def list_excluded(kb_path):
+    """Excluded documents by name, with the document each duplicates and when"""
+    try:
+        with open(_record_path(kb_path), "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        record = {}
+    excluded_dir = Path(kb_path) / EXCLUDED_DIR
+    return {name: entry for name, entry in record.items() if (excluded_dir / name).is_file()}
+
+
+@contextmanager
+def _moving_inputs(kb_path):
+    """Hold the knowledge base's lock while documents move in or out of input/
+
+    Builds read input/ under the lock, and a queued build has already taken
+    its snapshot of the files, so both make this raise KBBusyError.
+    """
+    with writing(kb_path):
+        job = get_job_manager().active_job(Path(kb_path).name)
+        if job is not None:
+            raise KBBusyError(f"'{Path(kb_path).name}' is being indexed (job {job.id}), "
+                              f"try again once it has finished")
+        yield
+
+
+def _save_record(kb_path, record):
+    path = _record_path(kb_path)
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def exclude_duplicates(kb_path, duplicates):
+    """Move documents out of input/ so graphrag no longer indexes them
+
+    duplicates maps names to {"duplicate_of": name, "similarity": float}.
+    Returns (excluded names, (name, error) pairs). Raises
+    kb_locks.KBBusyError while the knowledge base is being indexed.
+    """
+    kb_path = Path(kb_path)
+    input_path, excluded_dir = kb_path / "input", kb_path / EXCLUDED_DIR
+    excluded_dir.mkdir(exist_ok=True)
+    manifest = InputManifest(kb_path)
+    excluded, errors = [], []
+    timer = get_metrics().timer("file_io", op="exclude", kb=kb_path.name)
+    with _moving_inputs(kb_path), manifest.lock, timer as timing:
+        record = list_excluded(kb_path)
+        for name, info in duplicates.items():
+            try:
+                if name != Path(name).name:
+                    raise ValueError("not a file name")
+                os.replace(input_path / name, excluded_dir / name)
+                record[name] = {"duplicate_of": info.get("duplicate_of"),
+                                "similarity": info.get("similarity"),
+                                "excluded_at": time.time()}
+                excluded.append(name)
+            except Exception as e:
+                errors.append((name, e))
+        _save_record(kb_path, record)
+        manifest.remove_many(excluded)
+        timing["files"] = len(excluded)
+    return excluded, errors
+
+
+def restore_excluded(kb_path, names):
+    """Move excluded documents back into input/; returns (restored names, (name, error) pairs)
+
+    Raises kb_locks.KBBusyError while the knowledge base is being indexed.
+    """
+    kb_path = Path(kb_path)
+    input_path, excluded_dir = kb_path / "input", kb_path / EXCLUDED_DIR
+    manifest = InputManifest(kb_path)
+    restored, errors, entries = [], [], {}
+    timer = get_metrics().timer("file_io", op="restore", kb=kb_path.name)
+    with _moving_inputs(kb_path), manifest.lock, timer as timing:
+        record = list_excluded(kb_path)
+        for name in names:
+            try:
+                if name not in record:
+                    raise ValueError("not an excluded document")
+                if (input_path / name).exists():
+                    raise FileExistsError(f"input/{name} exists")
+                os.replace(excluded_dir / name, input_path / name)
+                del record[name]
+                entries[name] = file_entry(input_path / name)
+                restored.append(name)
+            except Exception as e:
+                errors.append((name, e))
+        _save_record(kb_path, record)
+        manifest.record_many(entries)
+        timing["files"] = len(restored)
+    return restored, errors
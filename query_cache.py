@@ -0,0 +1,167 @@
+"""Persistent LRU cache of query answers
+
+Answers are keyed on the knowledge base, the query method, the normalized
+question and the fingerprint of the knowledge base's index artifacts, so a
+re-indexed knowledge base never serves answers computed from its old index.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from kb_artifacts import index_fingerprint
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = Path(__file__).parent.resolve() / "query_cache" / "queries.sqlite3"
+MAX_ENTRIES = int(os.environ.get("GRAPHRAG_QUERY_CACHE_MAX_ENTRIES", "1000"))
+MAX_BYTES = int(os.environ.get("GRAPHRAG_QUERY_CACHE_MAX_BYTES",
+                               str(64 * 1024 * 1024)))
+
+
+def normalize_query(query):
+    """Collapse whitespace and case so trivially different questions share an entry"""
+    return " ".join(query.split()).casefold()
+
+
+class QueryCache:
+    """Query answers stored in SQLite, bounded by entry count and total size"""
+
+    def __init__(self, db_path, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, kb TEXT NOT NULL, method TEXT NOT NULL,"
+                " query TEXT NOT NULL, response TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created REAL NOT NULL,"
+                " last_access REAL NOT NULL)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                " name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _key(self, kb_name, method, query, fingerprint):
+        raw = "\0".join([kb_name, method.lower(), normalize_query(query), fingerprint])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _count(self, conn, name, amount=1):
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount))
+
+    def get(self, kb_path, method, query):
+        """Return the cached answer, or None on a miss"""
+        kb_path = Path(kb_path)
+        fingerprint = index_fingerprint(kb_path)
+        key = self._key(kb_path.name, method, query, fingerprint)
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?",
+                         (time.time(), key))
+            self._count(conn, "hits")
+            return row[0]
+
+    def put(self, kb_path, method, query, response):
+        """Store an answer and evict least recently used entries over the limits"""
+        kb_path = Path(kb_path)
+        fingerprint = index_fingerprint(kb_path)
+        if not fingerprint:
+            return
+        key = self._key(kb_path.name, method, query, fingerprint)
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, kb, method, query, response, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kb_path.name, method.lower(), normalize_query(query),
+                 response, size, now, now))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            evicted += 1
+        self._count(conn, "evictions", evicted)
+
+    def invalidate(self, kb_name):
+        """Drop every cached answer of a knowledge base"""
+        with self._lock, self._connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM entries WHERE kb = ?", (kb_name,)).rowcount
+        if deleted:
+            logger.info(f"Invalidated {deleted} cached answers for '{kb_name}'")
+
+    def clear(self):
+        """Drop all cached answers and reset the counters"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM stats")
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache"""
+        with self._lock, self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """Return the process-level query cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache(CACHE_PATH)
+        return _cache
@@ -0,0 +1,434 @@
+"""Long-lived GraphRAG query workers
+
+Each worker is a child interpreter that imports graphrag once, loads the index
+artifacts of a single knowledge base into memory and then answers local,
+global and drift queries in-process. The parent talks to it over stdin/stdout
+using one JSON document per line.
+
+Workers start in the background: a query for a knowledge base without a
+ready worker starts one and is answered by the graphrag CLI meanwhile, so no
+query waits for an index to load.
+"""
+import atexit
+import inspect
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from kb_artifacts import index_fingerprint, list_artifacts
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of knowledge bases kept hot at the same time (0 disables the pool)
+MAX_WORKERS = int(os.environ.get("GRAPHRAG_QUERY_WORKERS", "4"))
+# Seconds a worker may take to import graphrag and load the index
+STARTUP_TIMEOUT = float(os.environ.get("GRAPHRAG_WORKER_STARTUP_TIMEOUT", "300"))
+# Workers that have not answered a query for this long are shut down
+IDLE_TIMEOUT = float(os.environ.get("GRAPHRAG_WORKER_IDLE_TIMEOUT", "1800"))
+# How often the pool looks for idle workers
+EVICT_INTERVAL = max(1.0, min(60.0, IDLE_TIMEOUT / 2))
+
+# Defaults used by the graphrag CLI when no option is given
+QUERY_DEFAULTS = {
+    "community_level": 2,
+    "response_type": "Multiple Paragraphs",
+    "dynamic_community_selection": False,
+}
+
+
+class WorkerError(Exception):
+    """Raised when a worker cannot start or answer a query"""
+
+
+class QueryWorker:
+    """A child process serving queries for one knowledge base"""
+
+    def __init__(self, kb_path):
+        self.kb_path = Path(kb_path)
+        self.fingerprint = index_fingerprint(self.kb_path)
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "--serve",
+             str(self.kb_path)],
+            cwd=str(Path(__file__).parent),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        ready = self._read_message(STARTUP_TIMEOUT)
+        if not ready.get("ready"):
+            self.stop()
+            raise WorkerError(ready.get("error", "worker failed to start"))
+        logger.info(f"Query worker for '{self.kb_path.name}' is ready "
+                    f"(pid {self.process.pid})")
+
+    def _read_message(self, timeout):
+        """Read one protocol message, killing the worker if it takes too long"""
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, self.process.kill)
+            timer.start()
+        try:
+            line = self.process.stdout.readline()
+        finally:
+            if timer:
+                timer.cancel()
+        if not line:
+            raise WorkerError("worker exited unexpectedly")
+        return json.loads(line)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def query(self, method, query, timeout=None, on_delta=None):
+        """Send a query to the worker and wait for its response
+
+        With on_delta the worker streams the answer and on_delta(text) is
+        called with every piece of it before the full response is returned.
+        """
+        self.last_used = time.monotonic()
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            self.process.stdin.write(json.dumps(
+                {"method": method, "query": query, "stream": on_delta is not None}) + "\n")
+            self.process.stdin.flush()
+            while True:
+                reply = self._read_message(
+                    max(0.001, deadline - time.monotonic()) if deadline else None)
+                if "delta" not in reply:
+                    break
+                try:
+                    on_delta(reply["delta"])
+                except BaseException:
+                    # The rest of this answer is still on its way; don't let
+                    # the next query read it
+                    self.process.kill()
+                    raise
+        except (OSError, ValueError) as e:
+            raise WorkerError(str(e))
+        finally:
+            self.last_used = time.monotonic()
+        if not reply.get("ok"):
+            raise WorkerError(reply.get("error", "query failed"))
+        return reply["response"]
+
+    def stop(self):
+        """Terminate the worker process"""
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+
+
+class WorkerPool:
+    """Process-wide pool of query workers, one per knowledge base"""
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._workers = OrderedDict()
+        # Knowledge bases whose worker failed to start, keyed by fingerprint,
+        # so a broken index does not respawn a worker on every query
+        self._failed = {}
+        self._starting = set()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        if max_workers > 0:
+            # Idle workers are stopped even when no more queries arrive
+            threading.Thread(target=self._evict_loop, name="query-worker-evict",
+                             daemon=True).start()
+
+    def _key(self, kb_path):
+        return str(Path(kb_path).resolve())
+
+    def _get_worker(self, kb_path):
+        """Return the knowledge base's ready worker, or None while there is none
+
+        A missing worker is started in the background.
+        """
+        key = self._key(kb_path)
+        fingerprint = index_fingerprint(kb_path)
+        if not fingerprint or self._failed.get(key) == fingerprint:
+            return None
+        stale = None
+        with self._lock:
+            worker = self._workers.get(key)
+            if worker and (not worker.alive() or worker.fingerprint != fingerprint):
+                logger.info(f"Recycling query worker for '{Path(kb_path).name}'")
+                stale = self._workers.pop(key)
+                worker = None
+            if worker is not None:
+                self._workers.move_to_end(key)
+                return worker
+            # Another session is already starting this worker
+            start = key not in self._starting and not self._closed.is_set()
+            if start:
+                self._starting.add(key)
+        if stale:
+            stale.stop()
+        if start:
+            threading.Thread(target=self._start, args=(kb_path, key, fingerprint),
+                             name=f"query-worker-{Path(kb_path).name}", daemon=True).start()
+        return None
+
+    def _start(self, kb_path, key, fingerprint):
+        """Start a worker and add it to the pool once it has loaded the index
+
+        Runs in a thread of its own and without the knowledge base's lock, so
+        writers are not held up; a worker that loaded an index which changed
+        meanwhile is dropped.
+        """
+        try:
+            worker = QueryWorker(kb_path)
+        except (OSError, WorkerError) as e:
+            logger.warning(f"Query worker for '{Path(kb_path).name}' "
+                           f"unavailable: {e}")
+            with self._lock:
+                self._starting.discard(key)
+                self._failed[key] = fingerprint
+            return
+        if index_fingerprint(kb_path) != worker.fingerprint or self._closed.is_set():
+            with self._lock:
+                self._starting.discard(key)
+            worker.stop()
+            return
+        with self._lock:
+            self._starting.discard(key)
+            self._workers[key] = worker
+            evicted = self._evict()
+        self._stop_all(evicted)
+
+    def _evict(self):
+        """Take idle workers and those beyond the size limit out of the pool
+
+        Called with the pool lock held; returns the removed workers, which the
+        caller stops after releasing the lock.
+        """
+        evicted = []
+        now = time.monotonic()
+        for key, worker in list(self._workers.items()):
+            if now - worker.last_used > IDLE_TIMEOUT and not worker.lock.locked():
+                evicted.append(self._workers.pop(key))
+        for key, worker in list(self._workers.items()):
+            if len(self._workers) <= self.max_workers:
+                break
+            if not worker.lock.locked():
+                evicted.append(self._workers.pop(key))
+        return evicted
+
+    def _stop_all(self, workers):
+        for worker in workers:
+            logger.info(f"Stopping query worker for '{worker.kb_path.name}'")
+            worker.stop()
+
+    def _evict_loop(self):
+        while not self._closed.wait(EVICT_INTERVAL):
+            with self._lock:
+                evicted = self._evict()
+            self._stop_all(evicted)
+
+    def query(self, kb_path, method, query, timeout=None, on_delta=None):
+        """Answer a query with a warm worker
+
+        Returns None when no worker is ready (one is started for the next
+        queries), in which case the caller should fall back to running the
+        graphrag CLI. on_delta streams the answer, see QueryWorker.query.
+        """
+        if self.max_workers <= 0:
+            return None
+        worker = self._get_worker(kb_path)
+        if worker is None:
+            return None
+        # A busy worker means another session is using it; do not queue behind it
+        if not worker.lock.acquire(blocking=False):
+            return None
+        try:
+            return worker.query(method, query, timeout=timeout, on_delta=on_delta)
+        except WorkerError as e:
+            logger.warning(f"Query worker for '{Path(kb_path).name}' failed: {e}")
+            if not worker.alive():
+                self.recycle(kb_path)
+            return None
+        finally:
+            worker.lock.release()
+
+    def warm(self, kb_path):
+        """Start the knowledge base's worker in the background unless it is running
+
+        Used when a knowledge base is selected for querying and after it was
+        indexed, so its first questions need not go to the CLI. Does nothing
+        while the pool is full, so warming never evicts another worker.
+        """
+        if self.max_workers <= 0:
+            return
+        with self._lock:
+            if (self._key(kb_path) not in self._workers
+                    and len(self._workers) + len(self._starting) >= self.max_workers):
+                return
+        self._get_worker(kb_path)
+
+    def recycle(self, kb_path):
+        """Stop the worker of a knowledge base, e.g. after it was re-indexed"""
+        key = self._key(kb_path)
+        with self._lock:
+            self._failed.pop(key, None)
+            worker = self._workers.pop(key, None)
+        if worker:
+            worker.stop()
+
+    def status(self):
+        """Describe the running workers"""
+        now = time.monotonic()
+        return [{
+            "knowledge_base": Path(key).name,
+            "pid": worker.process.pid,
+            "busy": worker.lock.locked(),
+            "idle_seconds": round(now - worker.last_used),
+        } for key, worker in list(self._workers.items())]
+
+    def shutdown(self):
+        self._closed.set()
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the process-level worker pool shared by all sessions"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def _load_index(kb_path):
+    """Load the graphrag configuration and all index tables of a knowledge base"""
+    import pandas as pd
+    from dotenv import load_dotenv
+    from graphrag.config.load_config import load_config
+
+    load_dotenv(dotenv_path=kb_path / ".env")
+    config = load_config(kb_path, None)
+    try:
+        from graphrag.config.resolve_path import resolve_paths
+        resolve_paths(config)
+    except ImportError:
+        pass
+    tables = {name: pd.read_parquet(path)
+              for name, path in list_artifacts(kb_path).items()}
+    return config, tables
+
+
+def _search_kwargs(search, config, tables, query):
+    """The arguments this graphrag version's search function accepts"""
+    kwargs = {}
+    for name, param in inspect.signature(search).parameters.items():
+        if name == "config":
+            kwargs[name] = config
+        elif name == "query":
+            kwargs[name] = query
+        elif name in tables:
+            kwargs[name] = tables[name]
+        elif name in QUERY_DEFAULTS:
+            kwargs[name] = QUERY_DEFAULTS[name]
+        elif param.default is inspect.Parameter.empty:
+            kwargs[name] = None
+    return kwargs
+
+
+def _search(config, tables, method, query, on_delta=None):
+    """Run a search through the graphrag API with the preloaded tables
+
+    With on_delta, graphrag's streaming search is used where this version
+    has one and on_delta(text) gets every piece of the answer as it is
+    generated. Returns the full response.
+    """
+    import asyncio
+    import graphrag.api as api
+
+    search = {
+        "local": api.local_search,
+        "global": api.global_search,
+        "drift": getattr(api, "drift_search", None),
+    }.get(method)
+    if search is None:
+        raise ValueError(f"Unsupported query method: {method}")
+    streaming = getattr(api, f"{method}_search_streaming", None) if on_delta else None
+    if streaming is None:
+        response, _context = asyncio.run(search(**_search_kwargs(search, config, tables, query)))
+        if not isinstance(response, str):
+            response = json.dumps(response, ensure_ascii=False, indent=2)
+        if on_delta:
+            on_delta(response)
+        return response
+
+    async def stream():
+        pieces = []
+        async for chunk in streaming(**_search_kwargs(streaming, config, tables, query)):
+            # Older releases yield the context data first
+            if isinstance(chunk, str):
+                pieces.append(chunk)
+                on_delta(chunk)
+        return "".join(pieces)
+
+    return asyncio.run(stream())
+
+
+def serve(kb_path):
+    """Worker main loop: load the index once, then answer queries until EOF"""
+    # graphrag prints progress to stdout; keep the real stdout for the protocol
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def send(message):
+        protocol.write(json.dumps(message, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    kb_path = Path(kb_path)
+    try:
+        config, tables = _load_index(kb_path)
+    except Exception as e:
+        send({"ready": False, "error": f"{type(e).__name__}: {e}"})
+        return
+    send({"ready": True})
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+            on_delta = (lambda text: send({"delta": text})) if request.get("stream") else None
+            response = _search(config, tables, request["method"].lower(),
+                               request["query"], on_delta)
+            send({"ok": True, "response": response})
+        except Exception as e:
+            send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve":
+        serve(sys.argv[2])
+    else:
+        print(f"Usage: {sys.argv[0]} --serve <knowledge_base_path>")
+        sys.exit(2)
@@ -0,0 +1,242 @@
+"""Bounded handling of graphrag's output: rotating run logs and an in-memory tail
+
+Child output is read in bounded chunks and written to a per-run log file
+that rotates like logging's RotatingFileHandler (run.log, run.log.1, ...),
+so neither memory nor a single file grows with the length of a run. Only
+the last RING_BYTES of output stay in memory, plus everything after a
+capture marker (the query response after "SUCCESS: ... Response:").
+Markers are detected chunk by chunk as the output arrives, including
+markers split across two chunks.
+
+The log files are read back from the end for tails and streamed line by
+line for searches, so viewing a multi-GB log costs about the lines shown.
+"""
+import os
+import re
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+RUN_LOG_DIR = Path(__file__).parent.resolve() / "command_logs"
+CHUNK_CHARS = 64 * 1024
+RING_BYTES = 256 * 1024
+MAX_CAPTURE_BYTES = 16 * 1024 * 1024
+LOG_MAX_BYTES = int(os.environ.get("GRAPHRAG_LOG_MAX_BYTES", str(16 * 1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get("GRAPHRAG_LOG_BACKUPS", "4"))
+MAX_RUN_LOGS = int(os.environ.get("GRAPHRAG_MAX_RUN_LOGS", "500"))
+TAIL_BLOCK_BYTES = 64 * 1024
+
+
+class RotatingLog:
+    """Text log file rotated to path.1 ... path.<backups> when it exceeds max_bytes"""
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8", errors="replace")
+        self._size = self._file.tell()
+
+    def write(self, text):
+        size = len(text.encode("utf-8", "replace"))
+        if self._size and self._size + size > self.max_bytes:
+            self._rotate()
+        self._file.write(text)
+        self._size += size
+
+    def flush(self):
+        self._file.flush()
+
+    def _rotate(self):
+        self._file.close()
+        oldest = self.path.with_name(f"{self.path.name}.{self.backups}")
+        if oldest.exists():
+            oldest.unlink()
+        for number in range(self.backups - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{number}")
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{self.path.name}.{number + 1}"))
+        if self.backups:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        self._file = open(self.path, "w", encoding="utf-8", errors="replace")
+        self._size = 0
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class OutputTail:
+    """Last part of a command's output, with incremental marker detection
+
+    markers are watched for anywhere in the output. Output from the chunk
+    that contains one of the capture markers onwards is kept in full (up to
+    MAX_CAPTURE_BYTES), everything before it only as a RING_BYTES tail.
+    """
+
+    def __init__(self, markers=(), capture_markers=(), max_bytes=RING_BYTES):
+        self.markers = list(markers) + [m for m in capture_markers if m not in markers]
+        self.capture_markers = list(capture_markers)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.dropped_bytes = 0
+        self._ring = deque()
+        self._ring_bytes = 0
+        self._captured = []
+        self._captured_bytes = 0
+        self._capturing = False
+        self._seen = set()
+        self._carry = ""
+        self._overlap = max((len(marker) for marker in self.markers), default=1) - 1
+
+    def feed(self, chunk):
+        size = len(chunk.encode("utf-8", "replace"))
+        self.total_bytes += size
+        window = self._carry + chunk
+        for marker in self.markers:
+            if marker not in self._seen and marker in window:
+                self._seen.add(marker)
+                if marker in self.capture_markers:
+                    self._capturing = True
+        self._carry = window[-self._overlap:] if self._overlap else ""
+        if self._capturing:
+            if self._captured_bytes + size <= MAX_CAPTURE_BYTES:
+                self._captured.append(chunk)
+                self._captured_bytes += size
+            else:
+                self.dropped_bytes += size
+            return
+        self._ring.append((chunk, size))
+        self._ring_bytes += size
+        while self._ring_bytes > self.max_bytes and len(self._ring) > 1:
+            _old, old_size = self._ring.popleft()
+            self._ring_bytes -= old_size
+            self.dropped_bytes += old_size
+
+    def seen(self, marker):
+        return marker in self._seen
+
+    def text(self):
+        return "".join(chunk for chunk, _size in self._ring) + "".join(self._captured)
+
+
+def read_chunks(stream, size=CHUNK_CHARS):
+    """Yield a text stream's lines, split into pieces of at most size characters"""
+    return iter(lambda: stream.readline(size), "")
+
+
+def log_files(path):
+    """Existing files of a rotated log, oldest first"""
+    path = Path(path)
+    rotated = []
+    number = 1
+    while path.with_name(f"{path.name}.{number}").exists():
+        rotated.append(path.with_name(f"{path.name}.{number}"))
+        number += 1
+    files = list(reversed(rotated))
+    if path.exists():
+        files.append(path)
+    return files
+
+
+def total_size(path):
+    return sum(file.stat().st_size for file in log_files(path))
+
+
+def _tail_file(path, lines):
+    """Last lines of one file, read backwards in blocks"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= lines:
+            step = min(TAIL_BLOCK_BYTES, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    text = data.decode("utf-8", "replace")
+    parts = text.splitlines(keepends=True)
+    if position > 0:
+        parts = parts[1:]  # The first line is cut off
+    return parts[-lines:] if lines else []
+
+
+def tail(path, lines=200):
+    """The last lines of a rotated log, continuing into older files when needed"""
+    collected = []
+    for file in reversed(log_files(path)):
+        collected = _tail_file(file, lines - len(collected)) + collected
+        if len(collected) >= lines:
+            break
+    return "".join(collected)
+
+
+def search(path, pattern, regex=False, ignore_case=True, limit=500):
+    """Matching lines of a rotated log as (line number, line), oldest first
+
+    The files are streamed line by line. Returns (matches, truncated) where
+    truncated tells that more than limit lines matched.
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    matcher = re.compile(pattern if regex else re.escape(pattern), flags)
+    matches, number = [], 0
+    for file in log_files(path):
+        with open(file, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                number += 1
+                if matcher.search(line):
+                    if len(matches) == limit:
+                        return matches, True
+                    matches.append((number, line.rstrip("\n")))
+    return matches, False
+
+
+def _safe(name):
+    return re.sub(r"[^\w.-]+", "_", name).strip("_") or "run"
+
+
+def open_run_log(subcommand, kb_name):
+    """Create the log of one graphrag command run and delete the oldest runs"""
+    run_dir = Path(RUN_LOG_DIR)
+    run_dir.mkdir(parents=True, exist_ok=True)
+    name = (f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}-"
+            f"{_safe(subcommand)}-{_safe(kb_name)}.log")
+    prune_run_logs()
+    return RotatingLog(run_dir / name)
+
+
+def list_run_logs(kb_name=None):
+    """Command run logs, newest first, as dicts with name, path, bytes and modified"""
+    run_dir = Path(RUN_LOG_DIR)
+    if not run_dir.is_dir():
+        return []
+    runs = []
+    for path in sorted(run_dir.glob("*.log"), reverse=True):
+        if kb_name and not path.stem.endswith(f"-{_safe(kb_name)}"):
+            continue
+        try:
+            modified = path.stat().st_mtime
+        except OSError:
+            continue
+        runs.append({"name": path.stem, "path": path, "bytes": total_size(path),
+                     "modified": modified})
+    return runs
+
+
+def prune_run_logs(keep=MAX_RUN_LOGS):
+    """Delete all but the newest `keep` command run logs"""
+    run_dir = Path(RUN_LOG_DIR)
+    logs = sorted(run_dir.glob("*.log"), reverse=True) if run_dir.is_dir() else []
+    for path in logs[keep:]:
+        for file in log_files(path):
+            try:
+                file.unlink()
+            except OSError:
+                pass
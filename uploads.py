@@ -0,0 +1,146 @@
+"""Streaming, content-deduplicated writes of uploaded documents
+
+Each upload is copied in fixed-size chunks into a hidden temporary file next
+to its destination while being hashed, then atomically renamed into place.
+Documents whose content already exists in the knowledge base are rejected, or
+hard-linked so that at least the bytes are not stored twice.
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from input_manifest import InputManifest, file_entry
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MAX_WORKERS = 4
+
+# What to do with a document whose content is already in the knowledge base
+DUPLICATE_REJECT = "reject"
+DUPLICATE_LINK = "link"
+
+
+def temp_path_for(dest_path):
+    """Hidden temporary file in the destination folder, ignored by the *.txt glob"""
+    dest_path = Path(dest_path)
+    return dest_path.with_name(f".{dest_path.name}.{threading.get_ident()}.part")
+
+
+def stream_to_temp(src, dest_path, chunk_size=CHUNK_SIZE):
+    """Copy a binary file object to a temporary file in chunks
+
+    Returns (temp path, sha256 hex digest, size). The caller renames the temp
+    file into place or deletes it.
+    """
+    tmp_path = temp_path_for(dest_path)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+class InputWriter:
+    """Moves finished temporary files into input/, skipping duplicate content
+
+    Safe to use from several threads. Call close() to write the collected
+    entries to the input manifest in one go.
+    """
+
+    def __init__(self, kb_path, on_duplicate=DUPLICATE_REJECT):
+        self.kb_path = Path(kb_path)
+        self.input_path = self.kb_path / "input"
+        self.input_path.mkdir(parents=True, exist_ok=True)
+        self.on_duplicate = on_duplicate
+        self.manifest = InputManifest(self.kb_path).refresh()
+        self.known = self.manifest.by_hash()
+        self.hash_of = {name: sha256 for sha256, names in self.known.items()
+                        for name in names}
+        self.recorded = {}
+        self.lock = threading.Lock()
+
+    def commit(self, tmp_path, name, sha256, size):
+        """Rename a temporary file to input/<name> unless its content is a duplicate
+
+        Returns a result dict with the keys name, status ('saved', 'unchanged',
+        'duplicate' or 'linked'), size, duplicate_of and error.
+        """
+        result = {"name": name, "status": "saved", "size": size,
+                  "duplicate_of": None, "error": None}
+        dest_path = self.input_path / name
+        with self.lock:
+            holders = self.known.get(sha256, [])
+            others = [n for n in holders if n != name]
+            if name in holders:
+                result["status"] = "unchanged"
+                tmp_path.unlink()
+            elif others and self.on_duplicate == DUPLICATE_LINK:
+                tmp_path.unlink()
+                os.link(self.input_path / others[0], tmp_path)
+                os.replace(tmp_path, dest_path)
+                result.update(status="linked", duplicate_of=others[0])
+            elif others:
+                tmp_path.unlink()
+                result.update(status="duplicate", duplicate_of=others[0])
+            else:
+                os.replace(tmp_path, dest_path)
+            if result["status"] in ("saved", "linked"):
+                # An overwritten file no longer holds its old content
+                if name in self.hash_of:
+                    self.known[self.hash_of[name]].remove(name)
+                self.known.setdefault(sha256, []).append(name)
+                self.hash_of[name] = sha256
+                self.recorded[name] = file_entry(dest_path, sha256)
+        return result
+
+    def close(self):
+        """Write the entries of the committed files to the input manifest"""
+        if self.recorded:
+            self.manifest.record_many(self.recorded)
+            self.recorded = {}
+
+
+def save_uploads(kb_path, uploaded_files, on_duplicate=DUPLICATE_REJECT,
+                 max_workers=MAX_WORKERS, progress=None):
+    """Write uploaded files into the knowledge base's input folder
+
+    uploaded_files are file-like objects with a name attribute (such as
+    Streamlit's UploadedFile). Returns one result dict per file, see
+    InputWriter.commit; failed files get the status 'error'.
+    progress(done, total) is called after each file.
+    """
+    writer = InputWriter(kb_path, on_duplicate)
+
+    def save_one(uploaded_file):
+        name = Path(uploaded_file.name).name
+        try:
+            if hasattr(uploaded_file, "seek"):
+                uploaded_file.seek(0)
+            tmp_path, sha256, size = stream_to_temp(
+                uploaded_file, writer.input_path / name)
+            return writer.commit(tmp_path, name, sha256, size)
+        except Exception as e:
+            logger.error(f"Error uploading file '{name}': {e}")
+            return {"name": name, "status": "error", "size": 0,
+                    "duplicate_of": None, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(save_one, f) for f in uploaded_files]
+        # Report progress from the calling thread, which owns the UI
+        for done, _future in enumerate(as_completed(futures), start=1):
+            if progress:
+                progress(done, len(futures))
+        results = [future.result() for future in futures]
+    writer.close()
+    return results